@@ -0,0 +1,222 @@
+import asyncio
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+
+from dotenv import load_dotenv
+
+from instrumentation import admission_decisions, generation_queue_wait_seconds
+from persistance.database import DBSession, Database, offload
+
+
+class AdmissionError(Exception):
+    """Raised when a request is turned away, with the seconds after which it may be retried."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class RateLimitedError(AdmissionError):
+    """Raised when a client has used up its rate limit."""
+
+
+class GenerationBusyError(AdmissionError):
+    """Raised when too many quizzes are waiting to be generated, or one waited too long."""
+
+
+class RateLimiter(ABC):
+    """A token bucket for each key, holding up to burst tokens and refilled at rate tokens a
+    second. Each request takes a token and is rejected when there is none left."""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def default(cls, database: Database, name: str = "create") -> "RateLimiter":
+        """Returns the limit on creating quizzes, QUIZ_CREATE_RATE a minute with bursts of up to
+        QUIZ_CREATE_BURST. The buckets are held in memory by each process, or shared by every
+        process in Postgres with QUIZ_RATE_LIMIT_BACKEND=postgres."""
+        load_dotenv()
+        rate = float(os.getenv("QUIZ_CREATE_RATE", 6)) / 60
+        burst = int(os.getenv("QUIZ_CREATE_BURST", 3))
+        if os.getenv("QUIZ_RATE_LIMIT_BACKEND", "memory") == "postgres":
+            return PostgresRateLimiter(database, name, rate, burst)
+        return MemoryRateLimiter(name, rate, burst)
+
+    async def take(self, key: str):
+        """Takes a token from the bucket of the key. Raises a RateLimitedError if it is empty."""
+        wait = await self._take(key)
+        if wait > 0:
+            admission_decisions.inc(limit=self.name, outcome="rate_limited")
+            raise RateLimitedError(f"Rate limit of {self.name} exceeded", wait)
+        admission_decisions.inc(limit=self.name, outcome="admitted")
+
+    @abstractmethod
+    async def _take(self, key: str) -> float:
+        """Takes a token if there is one and returns 0, or the seconds until there is one."""
+
+    def _refill(self, tokens: float, elapsed: float) -> tuple[float, float]:
+        """Returns the tokens left and the seconds to wait after taking a token from the bucket."""
+        tokens = min(self.burst, tokens + elapsed * self.rate)
+        if tokens >= 1:
+            return tokens - 1, 0.0
+        return tokens, (1 - tokens) / self.rate
+
+
+class MemoryRateLimiter(RateLimiter):
+    """Holds the buckets in this process, so each process of the app enforces its own limit. Only
+    the max_keys most recently used buckets are kept, a forgotten bucket starting full again."""
+
+    def __init__(
+        self, name: str, rate: float, burst: int, max_keys: int = 100_000, clock=time.monotonic
+    ):
+        super().__init__(name, rate, burst)
+        self.max_keys = max_keys
+        self.clock = clock
+        # The tokens left and when they were counted, by key in order of last use
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    async def _take(self, key: str) -> float:
+        now = self.clock()
+        tokens, updated = self._buckets.pop(key, (self.burst, now))
+        tokens, wait = self._refill(tokens, now - updated)
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            del self._buckets[next(iter(self._buckets))]
+        return wait
+
+
+class PostgresRateLimiter(RateLimiter):
+    """Holds the buckets in the rate_limits table so the limit holds across every process of the
+    app. A token is taken in a single statement, the row lock serialising concurrent requests for
+    the same key. Buckets left untouched for long enough to be full again are deleted every
+    prune_every requests, as a missing bucket is a full one."""
+
+    def __init__(
+        self, database: Database, name: str, rate: float, burst: int, prune_every: int = 1000
+    ):
+        super().__init__(name, rate, burst)
+        self.database = database
+        self.prune_every = prune_every
+        self._taken = 0
+
+    async def _take(self, key: str) -> float:
+        tokens = await self._take_token(f"{self.name}:{key}")
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    @offload
+    def _take_token(self, key: str) -> float:
+        """Takes a token if there is one, returning the tokens there were before it was taken."""
+        stmt = """WITH bucket AS (
+                      SELECT LEAST(
+                          %(burst)s,
+                          tokens + EXTRACT(EPOCH FROM NOW() - updated_at) * %(rate)s
+                      ) AS tokens
+                      FROM rate_limits
+                      WHERE key = %(key)s
+                      FOR UPDATE
+                  ), refilled AS (
+                      SELECT COALESCE((SELECT tokens FROM bucket), %(burst)s) AS tokens
+                  )
+                  INSERT INTO rate_limits (key, tokens, updated_at)
+                  SELECT %(key)s, CASE WHEN tokens >= 1 THEN tokens - 1 ELSE tokens END, NOW()
+                  FROM refilled
+                  ON CONFLICT (key) DO UPDATE
+                  SET tokens = EXCLUDED.tokens, updated_at = EXCLUDED.updated_at
+                  RETURNING (SELECT tokens FROM refilled);"""
+        prune_stmt = """DELETE FROM rate_limits
+                        WHERE updated_at < NOW() - make_interval(secs => %s);"""
+
+        self._taken += 1
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, dict(key=key, rate=self.rate, burst=self.burst))
+            tokens = db.cursor.fetchone()[0]
+            if self._taken % self.prune_every == 0:
+                db.cursor.execute(prune_stmt, (self.burst / self.rate,))
+            db.conn.commit()
+
+        return tokens
+
+
+class GenerationGate:
+    """Bounds the quizzes this process generates at once, as each holds language model quota and
+    database connections. Up to max_queue more wait for up to max_wait seconds for a slot, and
+    anything beyond that is rejected at once rather than left to time out."""
+
+    def __init__(self, concurrency: int = 4, max_queue: int = 16, max_wait: float = 10.0):
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._slots = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        # A moving average of how long a slot is held, to tell rejected clients when to retry
+        self.hold_seconds = 5.0
+
+    @classmethod
+    def default(cls):
+        load_dotenv()
+        return cls(
+            concurrency=int(os.getenv("QUIZ_GENERATION_CONCURRENCY", 4)),
+            max_queue=int(os.getenv("QUIZ_GENERATION_QUEUE", 16)),
+            max_wait=float(os.getenv("QUIZ_GENERATION_MAX_WAIT", 10)),
+        )
+
+    @property
+    def retry_after(self) -> float:
+        """An estimate of the seconds until the quizzes waiting now have all started."""
+        return self.hold_seconds * (self.waiting + 1) / self.concurrency
+
+    async def acquire(self) -> float:
+        """Waits for a slot and returns when it was acquired, to be given to release. Raises a
+        GenerationBusyError if the queue is full or no slot frees up within max_wait."""
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self._reject("queue_full")
+            raise GenerationBusyError(
+                "Too many quizzes are waiting to be generated", self.retry_after
+            )
+
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.max_wait)
+        except asyncio.TimeoutError:
+            self._reject("timed_out")
+            raise GenerationBusyError("Timed out waiting to generate a quiz", self.retry_after)
+        finally:
+            self.waiting -= 1
+
+        acquired = time.perf_counter()
+        generation_queue_wait_seconds.observe(acquired - started)
+        admission_decisions.inc(limit="generation", outcome="admitted")
+        self.admitted += 1
+        self.running += 1
+        return acquired
+
+    def release(self, acquired: float):
+        self.running -= 1
+        self._slots.release()
+        self.hold_seconds = 0.9 * self.hold_seconds + 0.1 * (time.perf_counter() - acquired)
+
+    @asynccontextmanager
+    async def slot(self):
+        acquired = await self.acquire()
+        try:
+            yield
+        finally:
+            self.release(acquired)
+
+    def _reject(self, outcome: str):
+        admission_decisions.inc(limit="generation", outcome=outcome)
+        self.rejected += 1
@@ -1,29 +1,269 @@
 import asyncio
+import hashlib
+import logging
 import os
+import time
+import uuid
+from contextlib import asynccontextmanager
 from typing import Annotated
 
 import uvicorn
 from fastapi import FastAPI, Depends
 from fastapi.requests import Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, Response
 import urllib.parse
 from starlette import status
 
+from admission import AdmissionError, GenerationGate, RateLimitedError, RateLimiter
 from models.form_models import CreateQuizForm, SubmitAnswerForm, GoToQuizForm
-from persistance.database import Database
-from persistance.quiz_repo import QuizRepo
-from quiz_builder import QuizBuilder
+from instrumentation import (
+    RequestStats,
+    answer_buffer_answers,
+    answer_buffer_flushes,
+    answer_buffer_lag_seconds,
+    answer_buffer_pending,
+    cache_lookups,
+    current_request_stats,
+    generation_queue,
+    pool_connections,
+    pool_timeouts,
+    quiz_cache_bytes,
+    query_warning_threshold,
+    query_warnings,
+    registry,
+    request_queries,
+    request_seconds,
+)
+from persistance.answer_buffer import AnswerBuffer, AnswerBufferFullError
+from persistance.database import Database, generation_lane
+from persistance.generation_cache_repo import GenerationCacheRepo
+from persistance.migrator import MigrationRunner
+from persistance.quiz_cache import QuizContentCache
+from persistance.quiz_repo import QuizRepo, QuizView
+from pool_worker import PoolWorker
+from reaper import QuizReaper, quiz_ttl
+from quiz_builder import Completion, QuizBuilder, QuizGenerationError, normalize_topic
+from compression import CompressionMiddleware
+from templating import HashedStaticFiles, QuizTemplates
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The pool is created once per process and shared by every request
+    database = Database.default()
+    database.open()
+    app.state.database = database
+    app.state.quiz_cache = QuizContentCache.default()
+    app.state.quiz_builder = QuizBuilder.default(
+        shared_cache=GenerationCacheRepo(database), on_usage=log_token_usage
+    )
+    app.state.generation_tasks = set()
+    # Creating a quiz is rate limited by client, and quizzes are generated a few at a time
+    app.state.create_limiter = RateLimiter.default(database)
+    app.state.generation_gate = GenerationGate.default()
+    app.state.query_warning_threshold = query_warning_threshold()
+    # Set QUIZ_ANSWER_BUFFER=true to write answers in batches behind the requests
+    app.state.answer_buffer = AnswerBuffer.default(database)
+    if app.state.answer_buffer is not None:
+        app.state.answer_buffer.start()
+    app.state.quiz_repo = QuizRepo(
+        database, cache=app.state.quiz_cache, answers=app.state.answer_buffer, ttl=quiz_ttl()
+    )
+    graceful_timeout = float(os.getenv("QUIZ_GRACEFUL_TIMEOUT", 30))
+
+    # Migrations are applied out of band, by make migrate or server.py --migrate
+    pending = await database.run(MigrationRunner(database).pending)
+    if pending:
+        logger.warning("The schema is missing migrations %s", ", ".join(map(str, pending)))
+
+    # The pool worker and reaper normally run as their own processes but can run inside the app
+    background_tasks = []
+    if os.getenv("QUIZ_POOL_WORKER") == "true":
+        worker = PoolWorker.default(database, app.state.quiz_builder)
+        background_tasks.append(asyncio.create_task(worker.run()))
+    if os.getenv("QUIZ_REAPER") == "true":
+        reaper = QuizReaper.default(app.state.quiz_repo)
+        background_tasks.append(asyncio.create_task(reaper.run()))
+
+    yield
+    for task in background_tasks:
+        task.cancel()
+
+    # Quizzes still being generated for a player are given the graceful timeout to finish
+    if app.state.generation_tasks:
+        logger.info("Waiting for %d quizzes to finish generating", len(app.state.generation_tasks))
+        await asyncio.wait(set(app.state.generation_tasks), timeout=graceful_timeout)
+
+    tasks = list(app.state.generation_tasks) + background_tasks
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await app.state.quiz_builder.close()
+    if app.state.answer_buffer is not None:
+        await app.state.answer_buffer.close()
+    database.close()
+
+
+logger = logging.getLogger(__name__)
+attempt_cookie = "quiz_attempt"
+attempt_cookie_max_age = 30 * 24 * 60 * 60
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, minimum_size=500)
+static_files = HashedStaticFiles(directory="static")
+templates = QuizTemplates.default(static_files=static_files)
+app.mount("/static", static_files, name="static")
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Records the time taken and the database queries issued to handle the request, and reports
+    them in the X-DB-Queries and Server-Timing response headers."""
+    stats = RequestStats()
+    token = current_request_stats.set(stats)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_request_stats.reset(token)
+    elapsed = time.perf_counter() - started
+
+    # Labelled by the route template rather than the path so quiz ids do not create new series
+    route = request.scope.get("route")
+    route = route.path if route is not None else "unmatched"
+    request_seconds.observe(elapsed, method=request.method, route=route)
+    request_queries.observe(stats.queries, method=request.method, route=route)
+
+    threshold = getattr(request.app.state, "query_warning_threshold", None)
+    if threshold is not None and stats.queries > threshold:
+        query_warnings.inc()
+        logger.warning(
+            "Possible N+1 query: %s %s issued %d queries %r",
+            request.method,
+            request.url.path,
+            stats.queries,
+            stats.queries_by_method,
+        )
+
+    response.headers["X-DB-Queries"] = str(stats.queries)
+    response.headers["Server-Timing"] = f"{stats.server_timing()}, total;dur={elapsed * 1000:.2f}"
+    return response
+
+
+def log_token_usage(topic: str, completion: Completion):
+    logger.info(
+        "Generated quiz about %r using %d prompt and %d completion tokens",
+        topic,
+        completion.prompt_tokens,
+        completion.completion_tokens,
+    )
+
+
+def client_key(request: Request) -> str:
+    """Returns the address of the client, which is that of the proxy unless uvicorn is run with
+    --proxy-headers behind a trusted proxy."""
+    return request.client.host if request.client is not None else "unknown"
+
+
+def rejected(e: AdmissionError) -> HTMLResponse:
+    """Returns the response to a request turned away by admission control."""
+    if isinstance(e, RateLimitedError):
+        message = "You are creating quizzes too quickly, please try again shortly."
+        status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    else:
+        message = "Too many quizzes are being created, please try again shortly."
+        status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+    return HTMLResponse(
+        message, status_code=status_code, headers={"Retry-After": e.retry_after_header}
+    )
+
+
+def quiz_repo_param(request: Request) -> QuizRepo:
+    return request.app.state.quiz_repo
+
+
+def quiz_builder_param(request: Request) -> QuizBuilder:
+    return request.app.state.quiz_builder
+
 
-app = FastAPI()
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+def attempt_id_param(request: Request) -> str | None:
+    """Returns the id of the visitor's attempt at the quiz from its cookie, if it is valid."""
+    try:
+        return str(uuid.UUID(request.cookies[attempt_cookie]))
+    except (KeyError, ValueError):
+        return None
 
 
-def quiz_repo_param() -> QuizRepo:
-    db = Database.default()
-    return QuizRepo(db)
+async def get_attempt(quiz_repo: QuizRepo, quiz_id: str, attempt_id: str | None) -> QuizView | None:
+    """Returns the progress of the attempt, starting a new attempt if there is no attempt or it
+    is not an attempt at this quiz. Returns None if the quiz does not exist."""
+    if attempt_id is not None:
+        view = await quiz_repo.get_with_progress(quiz_id, attempt_id)
+        if view is not None:
+            return view
+
+    attempt_id = await quiz_repo.start_attempt(quiz_id)
+    if attempt_id is None:
+        return None
+    return await quiz_repo.get_with_progress(quiz_id, attempt_id)
+
+
+def remember_attempt(response: Response, quiz_id: str, attempt_id: str) -> Response:
+    """Sets the attempt cookie, which is scoped to the pages of the quiz so that each quiz the
+    visitor takes has its own attempt."""
+    response.set_cookie(
+        attempt_cookie,
+        attempt_id,
+        max_age=attempt_cookie_max_age,
+        path=f"/quiz/{quiz_id}",
+        httponly=True,
+        samesite="lax",
+    )
+    return response
+
+
+def progress_etag(attempt_id: str, question_count: int, answered: int, generating: bool) -> str:
+    """Returns the ETag of the pages of a quiz for the progress of the attempt. The attempt is
+    hashed so its id, which is kept from scripts in an HttpOnly cookie, is not exposed."""
+    attempt = hashlib.blake2b(attempt_id.encode(), digest_size=6).hexdigest()
+    state = "g" if generating else "d"
+    return f'W/"{templates.version}-{attempt}-{question_count}-{answered}{state}"'
+
+
+def remember_progress(response: Response, quiz_id: str, view: QuizView) -> Response:
+    """Sets the attempt cookie and the ETag of the progress of the attempt. The page must be
+    revalidated on every use, which is answered with a 304 until a question is answered or
+    generated."""
+    etag = progress_etag(
+        view.attempt_id, len(view.quiz), view.results.answered, view.quiz.generating
+    )
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return remember_attempt(response, quiz_id, view.attempt_id)
+
+
+async def not_modified(
+    request: Request, quiz_repo: QuizRepo, quiz_id: str, attempt_id: str | None
+) -> Response | None:
+    """Returns a 304 response if the page the visitor has cached is for the current progress of
+    their attempt, which is checked without loading the quiz."""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None or attempt_id is None:
+        return None
+
+    version = await quiz_repo.get_progress_version(quiz_id, attempt_id)
+    if version is None:
+        return None
+
+    etag = progress_etag(attempt_id, *version)
+    cached = (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+    if etag.removeprefix("W/") not in cached:
+        return None
+
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -36,24 +276,117 @@ async def index_page(request: Request):
 async def create_quiz(
     request: Request,
     quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)],
+    builder: Annotated[QuizBuilder, Depends(quiz_builder_param)],
     form: CreateQuizForm = Depends(CreateQuizForm.form),
 ):
-    """Creates a new quiz and presents the button to start the quiz."""
-    builder = QuizBuilder(os.getenv("OPENAI_API_KEY"))
-    quiz = builder.make_quiz(form.prompt, num_questions=form.count)
-    saved_quiz = quiz_repo.create(quiz)
+    """Creates a new quiz and presents the button to start the quiz. Quizzes that must be
+    generated wait for a slot in the generation gate, while claiming a pooled or cached quiz only
+    counts towards the client's rate limit."""
+    try:
+        await request.app.state.create_limiter.take(client_key(request))
+    except AdmissionError as e:
+        logger.info("Rejected creating a quiz for %s: %s", client_key(request), e)
+        return rejected(e)
+
+    quiz_id = await quiz_repo.claim_pooled(
+        normalize_topic(form.prompt), form.count, prompt=form.prompt
+    )
+    if quiz_id is not None:
+        ctx = dict(request=request, quiz_id=quiz_id, prompt=form.prompt)
+        return templates.TemplateResponse("partials/quiz-created.html", ctx)
+
+    # Cached quizzes are looked up before taking a slot, so they never wait behind generation
+    quiz = None
+    if form.use_cache:
+        quiz = await builder.get_cached(form.prompt, num_questions=form.count)
+
+    gate = request.app.state.generation_gate
+    if form.stream and quiz is None:
+        try:
+            acquired = await gate.acquire()
+        except AdmissionError as e:
+            logger.warning("Rejected generating a quiz: %s", e)
+            return rejected(e)
+
+        quiz_id = await start_streamed_quiz(request.app, quiz_repo, builder, form, acquired)
+        ctx = dict(request=request, quiz_id=quiz_id, prompt=form.prompt)
+        return templates.TemplateResponse("partials/quiz-created.html", ctx)
+
+    if quiz is not None:
+        saved_quiz = await quiz_repo.create(quiz)
+    else:
+        try:
+            async with gate.slot():
+                with generation_lane():
+                    quiz = await builder.make_quiz(
+                        form.prompt, num_questions=form.count, use_cache=form.use_cache
+                    )
+                    saved_quiz = await quiz_repo.create(quiz)
+        except AdmissionError as e:
+            logger.warning("Rejected generating a quiz: %s", e)
+            return rejected(e)
 
     ctx = dict(request=request, quiz_id=saved_quiz.id, prompt=saved_quiz.prompt)
     return templates.TemplateResponse("partials/quiz-created.html", ctx)
 
 
+async def start_streamed_quiz(
+    app: FastAPI, quiz_repo: QuizRepo, builder: QuizBuilder, form: CreateQuizForm, acquired: float
+) -> str:
+    """Starts generating the quiz in the background, saving each question as it arrives, and
+    returns the quiz id as soon as the first question can be played. The slot of the generation
+    gate acquired at the given time is released once the quiz has been generated."""
+    gate = app.state.generation_gate
+    try:
+        with generation_lane():
+            quiz_id = await quiz_repo.create_placeholder(form.prompt)
+    except BaseException:
+        gate.release(acquired)
+        raise
+
+    first_question_saved = asyncio.Event()
+
+    async def generate() -> int:
+        saved = 0
+        try:
+            async for question in builder.stream_quiz(form.prompt, num_questions=form.count):
+                await quiz_repo.append_questions(quiz_id, [question])
+                saved += 1
+                first_question_saved.set()
+        except Exception:
+            logger.exception("Generation of quiz %s stopped after %d questions", quiz_id, saved)
+        finally:
+            try:
+                await quiz_repo.finish_generating(quiz_id)
+            except Exception:
+                logger.exception("Could not mark quiz %s as generated", quiz_id)
+            finally:
+                # Neither the waiting request nor the slot may depend on the database
+                first_question_saved.set()
+                gate.release(acquired)
+        return saved
+
+    # The task outlives this request, so a reference is kept until it completes. It is created in
+    # the generation lane so that its queries are too.
+    with generation_lane():
+        task = asyncio.create_task(generate())
+    app.state.generation_tasks.add(task)
+    task.add_done_callback(app.state.generation_tasks.discard)
+
+    await first_question_saved.wait()
+    if task.done() and task.result() == 0:
+        raise QuizGenerationError(f"Could not generate a quiz about {form.prompt}")
+
+    return quiz_id
+
+
 @app.post("/find", response_class=HTMLResponse)
 async def go_to_quiz(
     quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)],
     form: GoToQuizForm = Depends(GoToQuizForm.form),
 ):
     """Finsd a given quiz and redirects to it if found, otherwise redirects to error page."""
-    quiz = quiz_repo.get(form.quiz_id)
+    quiz = await quiz_repo.get(form.quiz_id)
 
     if quiz is None:
         message = urllib.parse.quote_plus("The quiz could not be found and may no longer exist.")
@@ -64,46 +397,77 @@ async def go_to_quiz(
 
 @app.get("/quiz/{quiz_id}", response_class=HTMLResponse)
 async def get_quiz(
-    request: Request, quiz_id: str, quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)]
+    request: Request,
+    quiz_id: str,
+    quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)],
+    attempt_id: Annotated[str | None, Depends(attempt_id_param)],
 ):
-    """Returns the requested quiz."""
-    quiz = quiz_repo.get(quiz_id)
+    """Returns the requested quiz at the current question of the visitor's attempt."""
+    response = await not_modified(request, quiz_repo, quiz_id, attempt_id)
+    if response is not None:
+        return response
 
-    if quiz is None:
+    view = await get_attempt(quiz_repo, quiz_id, attempt_id)
+
+    if view is None:
         message = urllib.parse.quote_plus("The quiz could not be found and may no longer exist.")
         return RedirectResponse(f"/not-found?message={message}")
 
-    # TODO: Maybe this only needs to get the ID of the current question?
-    current_question = quiz_repo.get_current_question(quiz_id)
-    current_question_index = quiz.get_question_index(current_question.id)
-    counts = quiz_repo.get_results(quiz_id)
+    quiz, counts = view.quiz, view.results
+    if view.waiting:
+        ctx = dict(request=request, quiz=quiz, quiz_id=quiz_id, waiting=True)
+        response = templates.TemplateResponse("quiz-page.html", ctx)
+        return remember_progress(response, quiz_id, view)
+
+    if view.completed:
+        ctx = dict(
+            request=request,
+            quiz=quiz,
+            quiz_id=quiz_id,
+            counts=counts,
+            pct=int(counts.correct / len(quiz) * 100),
+            question_count=len(quiz),
+            completed=True,
+        )
+        response = templates.TemplateResponse("quiz-page.html", ctx)
+        return remember_progress(response, quiz_id, view)
+
+    current_question_index = view.current_question_index
 
     ctx = dict(
         request=request,
         quiz=quiz,
+        quiz_id=quiz_id,
         counts=counts,
         pct=int(counts.correct / len(quiz) * 100),
-        question=quiz.questions[current_question_index],
-        question_number=current_question_index + 1,
+        question_html=templates.question(
+            quiz_id, quiz.questions[current_question_index], current_question_index + 1
+        ),
     )
 
-    return templates.TemplateResponse("quiz-page.html", ctx)
+    response = templates.TemplateResponse("quiz-page.html", ctx)
+    return remember_progress(response, quiz_id, view)
 
 
 @app.get("/quiz/{quiz_id}/next", response_class=HTMLResponse)
 async def get_quiz(
-    request: Request, quiz_id: str, quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)]
+    request: Request,
+    quiz_id: str,
+    quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)],
+    attempt_id: Annotated[str | None, Depends(attempt_id_param)],
 ):
     """Returns the next question for the given quiz, or the quiz complete notification if complete."""
-    quiz = quiz_repo.get(quiz_id)
-    if quiz is None:
+    response = await not_modified(request, quiz_repo, quiz_id, attempt_id)
+    if response is not None:
+        return response
+
+    view = await get_attempt(quiz_repo, quiz_id, attempt_id)
+    if view is None:
         message = urllib.parse.quote_plus("The quiz could not be found and may no longer exist.")
         return RedirectResponse(f"/not-found?message={message}")
 
-    # TODO: Maybe this only needs to get the ID of the current question?
-    current_question = quiz_repo.get_current_question(quiz_id)
-    if current_question is None:
-        counts = quiz_repo.get_results(quiz_id)
+    quiz, counts = view.quiz, view.results
+    if view.completed:
         ctx = dict(
             request=request,
             counts=counts,
@@ -111,21 +475,29 @@ async def get_quiz(
             question_count=len(quiz),
         )
 
-        return templates.TemplateResponse("partials/quiz-completed-message.html", ctx)
+        response = templates.TemplateResponse("partials/quiz-completed-message.html", ctx)
+        return remember_progress(response, quiz_id, view)
 
-    current_question_index = quiz.get_question_index(current_question.id)
-    counts = quiz_repo.get_results(quiz_id)
+    if view.waiting:
+        ctx = dict(request=request, quiz_id=quiz_id)
+        response = templates.TemplateResponse("partials/waiting-for-question.html", ctx)
+        return remember_progress(response, quiz_id, view)
+
+    current_question_index = view.current_question_index
 
     ctx = dict(
         request=request,
         quiz=quiz,
+        quiz_id=quiz_id,
         counts=counts,
         pct=int(counts.correct / len(quiz) * 100),
-        question=quiz.questions[current_question_index],
-        question_number=current_question_index + 1,
+        question_html=templates.question(
+            quiz_id, quiz.questions[current_question_index], current_question_index + 1
+        ),
     )
 
-    return templates.TemplateResponse("partials/question.html", ctx)
+    response = templates.TemplateResponse("partials/question.html", ctx)
+    return remember_progress(response, quiz_id, view)
 
 
 @app.post("/quiz/{quiz_id}/{question_id}/submit", response_class=HTMLResponse)
@@ -134,42 +506,199 @@ async def submit_question_answer(
     quiz_id: str,
     question_id: int,
     quiz_repo: Annotated[QuizRepo, Depends(quiz_repo_param)],
+    attempt_id: Annotated[str | None, Depends(attempt_id_param)],
     form: SubmitAnswerForm = Depends(SubmitAnswerForm.form),
 ):
-    """Updates the answer for the question and returns the next question in the list."""
+    """Records the answer for the visitor's attempt and returns the next question in the list."""
+    if attempt_id is None:
+        attempt_id = await quiz_repo.start_attempt(quiz_id)
+
+    result = None
+    if attempt_id is not None:
+        try:
+            result = await quiz_repo.submit(quiz_id, attempt_id, question_id, form.option)
+        except AnswerBufferFullError:
+            logger.warning("Rejected an answer to quiz %s as the answer buffer is full", quiz_id)
+            return HTMLResponse(
+                "Too many answers are being saved, please try again.",
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+
+    if result is None:
+        message = urllib.parse.quote_plus("The quiz could not be found and may no longer exist.")
+        return RedirectResponse(
+            f"/not-found?message={message}", status_code=status.HTTP_303_SEE_OTHER
+        )
 
-    quiz = quiz_repo.get(quiz_id)
-    answered_correctly = quiz_repo.answer(quiz_id, question_id, form.option)
-    current_question_index = quiz.get_question_index(question_id)
-    next_question_index = current_question_index + 1
-    counts = quiz_repo.get_results(quiz_id)
-    quiz_completed = current_question_index == len(quiz) - 1
+    counts = result.results
 
-    if not answered_correctly:
-        current_question = quiz.questions[current_question_index]
-        ctx = dict(request=request, quiz_id=quiz_id, correct_answer=current_question.correct_answer)
-        return templates.TemplateResponse("partials/incorrect.html", ctx)
+    if not result.answered_correct:
+        ctx = dict(request=request, quiz_id=quiz_id, correct_answer=result.correct_answer)
+        response = templates.TemplateResponse("partials/incorrect.html", ctx)
+        return remember_attempt(response, quiz_id, attempt_id)
 
-    if quiz_completed:
+    if result.next_question is None and not result.generating:
         ctx = dict(
             request=request,
             counts=counts,
-            pct=int(counts.correct / len(quiz) * 100),
-            question_count=len(quiz),
+            pct=int(counts.correct / counts.count * 100),
+            question_count=counts.count,
         )
 
-        return templates.TemplateResponse("partials/quiz-completed-message.html", ctx)
+        response = templates.TemplateResponse("partials/quiz-completed-message.html", ctx)
+        return remember_attempt(response, quiz_id, attempt_id)
+
+    if result.next_question is None:
+        # The next question is still being generated
+        ctx = dict(request=request, quiz_id=quiz_id)
+        response = templates.TemplateResponse("partials/waiting-for-question.html", ctx)
+        return remember_attempt(response, quiz_id, attempt_id)
 
     ctx = dict(
         request=request,
-        quiz=quiz,
+        quiz_id=quiz_id,
         counts=counts,
-        pct=int(counts.correct / len(quiz) * 100),
-        question=quiz.questions[next_question_index],
-        question_number=next_question_index + 1,
+        pct=int(counts.correct / counts.count * 100),
+        question_html=templates.question(
+            quiz_id, result.next_question, result.next_question_number
+        ),
+    )
+
+    response = templates.TemplateResponse("partials/question.html", ctx)
+    return remember_attempt(response, quiz_id, attempt_id)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(request: Request):
+    """Reports every metric in the Prometheus text format."""
+    collect_state_metrics(request.app)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+def collect_state_metrics(app: FastAPI):
+    stats = app.state.database.stats()
+    pool_connections.set(stats.in_use, state="in_use")
+    pool_connections.set(stats.waiting, state="waiting")
+    pool_connections.set(stats.max_size, state="max")
+    pool_timeouts.set(stats.timeouts)
+
+    quiz_cache = app.state.quiz_cache
+    cache_lookups.set(quiz_cache.hits, cache="quiz", result="hit")
+    cache_lookups.set(quiz_cache.shared_hits, cache="quiz", result="shared_hit")
+    cache_lookups.set(quiz_cache.misses, cache="quiz", result="miss")
+    quiz_cache_bytes.set(quiz_cache.size_bytes)
+
+    buffer = app.state.answer_buffer
+    if buffer is not None:
+        answer_buffer_pending.set(buffer.pending)
+        answer_buffer_lag_seconds.set(buffer.lag_seconds)
+        answer_buffer_answers.set(buffer.buffered, outcome="buffered")
+        answer_buffer_answers.set(buffer.flushed, outcome="flushed")
+        answer_buffer_answers.set(buffer.rejected, outcome="rejected")
+        answer_buffer_flushes.set(buffer.flushes, outcome="ok")
+        answer_buffer_flushes.set(buffer.failed_flushes, outcome="failed")
+
+    gate = app.state.generation_gate
+    generation_queue.set(gate.running, state="running")
+    generation_queue.set(gate.waiting, state="waiting")
+
+    cache_lookups.set(templates.fragments.hits, cache="fragment", result="hit")
+    cache_lookups.set(templates.fragments.misses, cache="fragment", result="miss")
+
+    generation_cache = app.state.quiz_builder.cache
+    if generation_cache is not None:
+        cache_lookups.set(generation_cache.local_hits, cache="generation", result="hit")
+        cache_lookups.set(generation_cache.shared_hits, cache="generation", result="shared_hit")
+        cache_lookups.set(generation_cache.misses, cache="generation", result="miss")
+
+
+@app.get("/metrics/pool")
+async def pool_metrics(request: Request):
+    """Reports how saturated the database connection pool is."""
+    stats = request.app.state.database.stats()
+    return dict(
+        max_size=stats.max_size,
+        in_use=stats.in_use,
+        waiting=stats.waiting,
+        saturation=stats.saturation,
+        acquired_total=stats.acquired,
+        timeouts_total=stats.timeouts,
+        wait_seconds_total=stats.wait_seconds,
+    )
+
+
+@app.get("/metrics/generation-cache")
+async def generation_cache_metrics(request: Request):
+    """Reports how often generated quizzes are served from the cache."""
+    builder = request.app.state.quiz_builder
+    cache = builder.cache
+    usage = dict(prompt_tokens=builder.prompt_tokens, completion_tokens=builder.completion_tokens)
+    if cache is None:
+        return dict(enabled=False, **usage)
+
+    return dict(
+        enabled=True,
+        local_hits=cache.local_hits,
+        shared_hits=cache.shared_hits,
+        misses=cache.misses,
+        **usage,
     )
 
-    return templates.TemplateResponse("partials/question.html", ctx)
+
+@app.get("/metrics/quiz-cache")
+async def quiz_cache_metrics(request: Request):
+    """Reports how often quiz content is served from the cache rather than the database."""
+    cache = request.app.state.quiz_cache
+    return dict(
+        hits=cache.hits,
+        shared_hits=cache.shared_hits,
+        misses=cache.misses,
+        hit_ratio=cache.hit_ratio,
+        evictions=cache.evictions,
+        entries=len(cache),
+        size_bytes=cache.size_bytes,
+    )
+
+
+@app.get("/metrics/answer-buffer")
+async def answer_buffer_metrics(request: Request):
+    """Reports how many answers are waiting to be written when answers are buffered."""
+    buffer = request.app.state.answer_buffer
+    if buffer is None:
+        return dict(enabled=False)
+
+    return dict(
+        enabled=True,
+        pending=buffer.pending,
+        max_pending=buffer.max_pending,
+        lag_seconds=buffer.lag_seconds,
+        buffered_total=buffer.buffered,
+        flushed_total=buffer.flushed,
+        flushes_total=buffer.flushes,
+        failed_flushes_total=buffer.failed_flushes,
+        rejected_total=buffer.rejected,
+        last_flush_seconds=buffer.last_flush_seconds,
+    )
+
+
+@app.get("/metrics/admission")
+async def admission_metrics(request: Request):
+    """Reports how many quizzes are being generated or waiting to be, and how many were rejected."""
+    gate = request.app.state.generation_gate
+    limiter = request.app.state.create_limiter
+    return dict(
+        rate_limit_backend=type(limiter).__name__,
+        rate_per_minute=limiter.rate * 60,
+        burst=limiter.burst,
+        concurrency=gate.concurrency,
+        running=gate.running,
+        waiting=gate.waiting,
+        max_queue=gate.max_queue,
+        max_wait_seconds=gate.max_wait,
+        admitted_total=gate.admitted,
+        rejected_total=gate.rejected,
+    )
 
 
 @app.get("/not-found", response_class=HTMLResponse)
@@ -179,7 +708,7 @@ async def not_found(request: Request, message: str = None):
 
 
 async def main():
-    # This is for development purposes only
+    # This is for development purposes only, use server.py in production
     # Initialize the database for the initial run
     __db = Database.default()
     __db.create_tables_if_not_exists()
@@ -0,0 +1,39 @@
+import json
+
+# Metrics where a higher value is a regression, and those where a lower value is
+higher_is_worse = ("p50_ms", "p95_ms", "p99_ms", "queries_per_request", "mean_us")
+lower_is_worse = ("throughput",)
+
+
+def save_baseline(path: str, results: dict[str, dict]):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"\nSaved baseline to {path}")
+
+
+def compare_with_baseline(path: str, results: dict[str, dict], tolerance: float) -> bool:
+    """Prints every metric that is worse than the baseline by more than the tolerance, given as a
+    fraction of the baseline value, and returns False if there were any."""
+    with open(path) as f:
+        baseline = json.load(f)
+
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            expected = baseline.get(name, {}).get(metric)
+            if value is None or expected is None:
+                continue
+
+            if metric in higher_is_worse and value > expected * (1 + tolerance):
+                regressions.append(f"{name} {metric}: {value:.2f} (baseline {expected:.2f})")
+            elif metric in lower_is_worse and value < expected * (1 - tolerance):
+                regressions.append(f"{name} {metric}: {value:.2f} (baseline {expected:.2f})")
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {path}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return False
+
+    print(f"\nNo regressions against {path}")
+    return True
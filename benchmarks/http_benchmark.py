@@ -0,0 +1,181 @@
+"""Drives the quiz flow through the HTTP API and reports throughput, latency percentiles and
+database queries per request for each endpoint.
+
+    python -m benchmarks.http_benchmark --users 50
+    python -m benchmarks.http_benchmark --url http://localhost:8000 --users 50
+
+Without --url the app is run in process with the fake language model backend. With --url the
+server must have been started with QUIZ_LLM_BACKEND=fake and with QUIZ_CREATE_RATE and
+QUIZ_CREATE_BURST raised above --users, as every flow creates its quiz from the same address.
+Both need a local Postgres database.
+Use --save-baseline to record the results and --compare to fail if they have regressed."""
+
+import argparse
+import asyncio
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+import httpx
+
+from benchmarks.baseline import compare_with_baseline, save_baseline
+
+question_form = re.compile(r'hx-post="/quiz/([^/"]+)/(\d+)/submit"')
+quiz_link = re.compile(r'href="quiz/([^"]+)"')
+
+
+class EndpointStats:
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.queries: list[int] = []
+        self.errors = 0
+
+    def record(self, latency: float, response: httpx.Response):
+        self.latencies.append(latency)
+        if "X-DB-Queries" in response.headers:
+            self.queries.append(int(response.headers["X-DB-Queries"]))
+        if response.status_code >= 400:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> dict:
+        quantiles = statistics.quantiles(self.latencies, n=100) if len(self.latencies) > 1 else []
+        return dict(
+            requests=len(self.latencies),
+            errors=self.errors,
+            throughput=len(self.latencies) / elapsed,
+            p50_ms=quantiles[49] * 1000 if quantiles else None,
+            p95_ms=quantiles[94] * 1000 if quantiles else None,
+            p99_ms=quantiles[98] * 1000 if quantiles else None,
+            queries_per_request=statistics.mean(self.queries) if self.queries else None,
+        )
+
+
+class QuizFlow:
+    """Plays a quiz the way a user would: create, find, open and then answer every question."""
+
+    def __init__(self, client: httpx.AsyncClient, num_questions: int, stream: bool):
+        self.client = client
+        self.num_questions = num_questions
+        self.stream = stream
+        self.stats: dict[str, EndpointStats] = {}
+
+    async def request(self, endpoint: str, method: str, url: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self.client.request(method, url, **kwargs)
+        elapsed = time.perf_counter() - started
+        self.stats.setdefault(endpoint, EndpointStats()).record(elapsed, response)
+        return response
+
+    async def run(self, user: int):
+        form = dict(q=f"benchmark topic {user}", qn=self.num_questions, stream=self.stream)
+        response = await self.request("POST /create", "POST", "/create", data=form)
+        link = quiz_link.search(response.text)
+        if response.status_code != 200 or link is None:
+            # Counted as an error, such as a 429 or 503 from admission control
+            return
+        quiz_id = link.group(1)
+
+        await self.request("POST /find", "POST", "/find", data=dict(quiz_id=quiz_id))
+        response = await self.request("GET /quiz/{id}", "GET", f"/quiz/{quiz_id}")
+
+        html = response.text
+        while True:
+            match = question_form.search(html)
+            if match is None:
+                if "being generated" not in html:
+                    break
+                await asyncio.sleep(0.1)
+            else:
+                url = f"/quiz/{quiz_id}/{match.group(2)}/submit"
+                form = dict(option=random.randrange(4))
+                response = await self.request(
+                    "POST /quiz/{id}/{qid}/submit", "POST", url, data=form
+                )
+                if question_form.search(response.text) or "completed the quiz" in response.text:
+                    html = response.text
+                    continue
+
+            response = await self.request("GET /quiz/{id}/next", "GET", f"/quiz/{quiz_id}/next")
+            html = response.text
+
+
+async def run_flows(client: httpx.AsyncClient, args) -> tuple[dict[str, EndpointStats], float]:
+    flows = [QuizFlow(client, args.questions, args.stream) for _ in range(args.users)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run(user: int, flow: QuizFlow):
+        async with semaphore:
+            await flow.run(user)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(user, flow) for user, flow in enumerate(flows)))
+    elapsed = time.perf_counter() - started
+
+    stats: dict[str, EndpointStats] = {}
+    for flow in flows:
+        for endpoint, flow_stats in flow.stats.items():
+            merged = stats.setdefault(endpoint, EndpointStats())
+            merged.latencies.extend(flow_stats.latencies)
+            merged.queries.extend(flow_stats.queries)
+            merged.errors += flow_stats.errors
+
+    return stats, elapsed
+
+
+async def run_in_process(args):
+    os.environ.setdefault("QUIZ_LLM_BACKEND", "fake")
+    # Every flow creates its quiz from the same address, so the limits must not turn them away
+    os.environ.setdefault("QUIZ_CREATE_RATE", str(args.users * 60))
+    os.environ.setdefault("QUIZ_CREATE_BURST", str(args.users))
+    os.environ.setdefault("QUIZ_GENERATION_QUEUE", str(args.concurrency))
+    import api
+
+    api.Database.default().create_tables_if_not_exists()
+    async with api.lifespan(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            return await run_flows(client, args)
+
+
+async def run_against_server(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        return await run_flows(client, args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="benchmark a running server instead of the app in process")
+    parser.add_argument("--users", type=int, default=50, help="the number of quizzes to play")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="create quizzes in streaming mode")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="fail if results regress on a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    runner = run_against_server if args.url else run_in_process
+    stats, elapsed = asyncio.run(runner(args))
+
+    results = {endpoint: s.summary(elapsed) for endpoint, s in sorted(stats.items())}
+    total = sum(len(s.latencies) for s in stats.values())
+    print(f"{total} requests in {elapsed:.2f}s ({total / elapsed:.1f} req/s)\n")
+    for endpoint, summary in results.items():
+        print(
+            f"{endpoint:32} {summary['requests']:6} req  {summary['throughput']:8.1f} req/s  "
+            f"p50 {summary['p50_ms'] or 0:7.2f}ms  p95 {summary['p95_ms'] or 0:7.2f}ms  "
+            f"p99 {summary['p99_ms'] or 0:7.2f}ms  "
+            f"queries {summary['queries_per_request'] or 0:.2f}  errors {summary['errors']}"
+        )
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare_with_baseline(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
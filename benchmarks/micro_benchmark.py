@@ -0,0 +1,208 @@
+"""Microbenchmarks for the CPU bound parts of loading a quiz, which need no database.
+
+python -m benchmarks.micro_benchmark --questions 10 100 1000"""
+
+import argparse
+import json
+import sys
+import timeit
+
+from benchmarks.baseline import compare_with_baseline, save_baseline
+from models import Question, Quiz
+from persistance.quiz_repo import QuizRepo, QuizView
+from quiz_builder.validation import QuizValidator
+
+
+def make_rows(num_questions: int, num_options: int = 4) -> list[tuple]:
+    """Returns rows shaped like those QuizRepo._load fetches, one for each option."""
+    return [
+        (
+            "Benchmark quiz",
+            False,
+            question_id,
+            f"Question {question_id}?",
+            1,
+            None,
+            f"Option {option}",
+            option == 1,
+        )
+        for question_id in range(1, num_questions + 1)
+        for option in range(num_options)
+    ]
+
+
+def make_dict_rows(num_questions: int, num_options: int = 4) -> list[dict]:
+    """Returns the same rows as make_rows as a RealDictCursor would."""
+    columns = (
+        "quiz_prompt",
+        "quiz_generating",
+        "question_id",
+        "question_text",
+        "question_correct_index",
+        "question_options",
+        "option_text",
+        "option_correct",
+    )
+    return [dict(zip(columns, row)) for row in make_rows(num_questions, num_options)]
+
+
+def assemble_quiz_from_dicts(quiz_id: str, results: list[dict]) -> Quiz:
+    """The previous implementation of QuizRepo._assemble_quiz, which grouped dict rows and
+    validated every model, kept to compare against."""
+    quiz_prompt = ""
+    rows_by_question_id = dict()
+    for row in results:
+        if not quiz_prompt:
+            quiz_prompt = row["quiz_prompt"]
+
+        if row["question_id"] not in rows_by_question_id:
+            rows_by_question_id[row["question_id"]] = []
+
+        rows_by_question_id[row["question_id"]].append(row)
+
+    questions: list[Question] = []
+    for question_id, option_rows in rows_by_question_id.items():
+        if option_rows[0]["question_options"] is not None:
+            correct_answer_index = option_rows[0]["question_correct_index"]
+            options = [
+                dict(text=text, correct=i == correct_answer_index)
+                for i, text in enumerate(option_rows[0]["question_options"])
+            ]
+        else:
+            options = [
+                dict(text=x["option_text"], correct=x["option_correct"]) for x in option_rows
+            ]
+
+        correct_answer_index = 0
+        for i, option in enumerate(options):
+            if option["correct"]:
+                correct_answer_index = i
+                break
+
+        q = Question(
+            id=question_id,
+            text=option_rows[0]["question_text"],
+            options=[option["text"] for option in options],
+            correct_answer=options[correct_answer_index]["text"],
+            correct_answer_index=correct_answer_index,
+        )
+
+        questions.append(q)
+
+    return Quiz(
+        id=quiz_id,
+        prompt=quiz_prompt,
+        questions=questions,
+        generating=results[0]["quiz_generating"],
+    )
+
+
+def view_with_copied_questions(quiz: Quiz, answers: dict[int, bool]):
+    """How a quiz view was built before QuizView, copying every question to set its answer."""
+    questions = [
+        q.model_copy(update=dict(answered_correct=answers.get(q.id))) for q in quiz.questions
+    ]
+    quiz = quiz.model_copy(update=dict(questions=questions))
+    next(i for i, q in enumerate(quiz.questions) if q.answered_correct is None)
+    sum(1 for q in quiz.questions if q.answered_correct is not None)
+    sum(1 for q in quiz.questions if q.answered_correct)
+    return quiz
+
+
+def make_quiz(num_questions: int) -> Quiz:
+    return Quiz(
+        id="benchmark",
+        prompt="Benchmark quiz",
+        questions=[
+            Question(
+                id=i,
+                text=f"Question {i}?",
+                options=["a", "b", "c", "d"],
+                correct_answer="b",
+                correct_answer_index=1,
+            )
+            for i in range(1, num_questions + 1)
+        ],
+    )
+
+
+def lookup_all(quiz: Quiz):
+    for question in quiz.questions:
+        quiz.get_question_index(question.id)
+
+
+def bench(fn, min_time: float = 0.5) -> float:
+    """Returns the mean time of a call to fn in microseconds."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=3, number=number)) / number * 1_000_000
+
+
+def run(question_counts: list[int]) -> dict[str, dict]:
+    results = {}
+    for count in question_counts:
+        rows = make_rows(count)
+        results[f"QuizRepo._assemble_quiz[{count}]"] = dict(
+            mean_us=bench(lambda: QuizRepo._assemble_quiz("benchmark", rows))
+        )
+        dict_rows = make_dict_rows(count)
+        results[f"assemble_quiz_from_dicts[{count}] (previous)"] = dict(
+            mean_us=bench(lambda: assemble_quiz_from_dicts("benchmark", dict_rows))
+        )
+
+        # An attempt half way through the quiz
+        content = make_quiz(count)
+        answers = {i: i % 3 == 0 for i in range(1, count // 2 + 1)}
+        results[f"QuizView[{count}]"] = dict(mean_us=bench(lambda: QuizView(content, answers)))
+        results[f"QuizView[{count}] with copied questions (previous)"] = dict(
+            mean_us=bench(lambda: view_with_copied_questions(content, answers))
+        )
+
+        # Looks up every question of a fresh quiz, so building the index is included
+        results[f"Quiz.get_question_index[{count}] all questions, new quiz"] = dict(
+            mean_us=bench(lambda: lookup_all(make_quiz(count))) - bench(lambda: make_quiz(count))
+        )
+
+        # A completion as the language model should produce it, and one that needs repairing
+        completion = content.model_dump_json(include={"prompt": True, "questions": True})
+        fenced = f"```json\n{completion[:-2]},]}}\n```"
+        validator = QuizValidator()
+        results[f"QuizValidator.parse[{count}]"] = dict(
+            mean_us=bench(lambda: validator.parse(completion))
+        )
+        results[f"QuizValidator.parse[{count}] with repairs"] = dict(
+            mean_us=bench(lambda: validator.parse(fenced))
+        )
+        results[f"Quiz(**json.loads())[{count}] (previous)"] = dict(
+            mean_us=bench(lambda: Quiz(**json.loads(completion)))
+        )
+
+        quiz = make_quiz(count)
+        results[f"Quiz.get_question_index[{count}] last question"] = dict(
+            mean_us=bench(lambda: quiz.get_question_index(count))
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--compare", metavar="PATH", help="fail if results regress on a baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.questions)
+    for name, metrics in results.items():
+        print(f"{name:60} {metrics['mean_us']:12.2f}us")
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results)
+    if args.compare and not compare_with_baseline(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Seeds the database with a large number of quizzes and reports the query plans and latencies of
+the quiz page queries, to check that the schema indexes are being used.
+
+    python -m benchmarks.schema_benchmark --quizzes 1000000 --questions 10
+
+Run against a disposable database, as the seeded quizzes are not removed."""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from persistance.database import DBSession, Database
+from persistance.migrator import MigrationRunner
+from persistance.quiz_repo import QuizRepo
+
+seed_prompt = "Benchmark quiz"
+
+explained_queries = {
+    "get": """SELECT qu.id, qu.text, o.id, o.text, o.correct
+              FROM quizzes q
+              JOIN questions qu ON q.id = qu.quiz_id
+              LEFT JOIN options o ON qu.id = o.question_id AND qu.options IS NULL
+              WHERE q.id = %(quiz_id)s
+              ORDER BY q.id, qu.id, o.id;""",
+    "progress": """SELECT q.generating, qu.id, an.correct
+                   FROM attempts a
+                   JOIN quizzes q ON q.id = a.quiz_id
+                   JOIN questions qu ON qu.quiz_id = q.id
+                   LEFT JOIN answers an ON an.attempt_id = a.id AND an.question_id = qu.id
+                   WHERE a.id = %(attempt_id)s AND a.quiz_id = %(quiz_id)s
+                   ORDER BY qu.id;""",
+    "results": """SELECT COUNT(qu.id), COUNT(an.correct), COUNT(*) FILTER (WHERE an.correct)
+                  FROM questions qu
+                  LEFT JOIN answers an
+                    ON an.attempt_id = %(attempt_id)s AND an.question_id = qu.id
+                  WHERE qu.quiz_id = %(quiz_id)s;""",
+}
+
+
+def seed(database: Database, quizzes: int, questions: int, compact: bool, batch_size: int):
+    quiz_stmt = """INSERT INTO quizzes (prompt)
+                   SELECT %s FROM generate_series(1, %s) RETURNING id;"""
+    question_stmt = """INSERT INTO questions (quiz_id, text, correct_index, options)
+                       SELECT
+                           q.id,
+                           'Question ' || n,
+                           n %% 4,
+                           CASE WHEN %s THEN ARRAY['A', 'B', 'C', 'D'] END
+                       FROM unnest(%s::uuid[]) q(id)
+                       CROSS JOIN generate_series(1, %s) n
+                       RETURNING id, correct_index;"""
+    options_stmt = """INSERT INTO options (question_id, text, correct)
+                      SELECT qu.id, 'Option ' || i, i = qu.correct_index
+                      FROM unnest(%s::int[], %s::int[]) qu(id, correct_index)
+                      CROSS JOIN generate_series(0, 3) i;"""
+    # One attempt at each quiz, with about half of its questions answered
+    attempts_stmt = """WITH attempt AS (
+                           INSERT INTO attempts (quiz_id) SELECT unnest(%s::uuid[]) RETURNING *
+                       )
+                       INSERT INTO answers (attempt_id, question_id, correct)
+                       SELECT a.id, qu.id, random() < 0.5
+                       FROM attempt a
+                       JOIN questions qu ON qu.quiz_id = a.quiz_id
+                       WHERE random() < 0.5;"""
+
+    seeded = 0
+    while seeded < quizzes:
+        count = min(batch_size, quizzes - seeded)
+        with DBSession(database) as db:
+            db.cursor.execute(quiz_stmt, (seed_prompt, count))
+            quiz_ids = [row[0] for row in db.cursor.fetchall()]
+            db.cursor.execute(question_stmt, (compact, quiz_ids, questions))
+            question_rows = db.cursor.fetchall()
+            if not compact:
+                ids, correct_indexes = zip(*question_rows)
+                db.cursor.execute(options_stmt, (list(ids), list(correct_indexes)))
+            db.cursor.execute(attempts_stmt, (quiz_ids,))
+            db.conn.commit()
+
+        seeded += count
+        print(f"Seeded {seeded}/{quizzes} quizzes", end="\r")
+    print()
+
+    with DBSession(database) as db:
+        db.conn.autocommit = True
+        db.cursor.execute("ANALYZE quizzes, questions, options, attempts, answers;")
+        db.conn.autocommit = False
+
+
+def sample_attempts(database: Database, samples: int) -> list[tuple[str, str]]:
+    """Returns (quiz id, attempt id) pairs for a sample of the seeded attempts."""
+    stmt = """SELECT a.quiz_id, a.id FROM attempts a TABLESAMPLE SYSTEM (1)
+              JOIN quizzes q ON q.id = a.quiz_id
+              WHERE q.prompt = %s LIMIT %s;"""
+    with DBSession(database) as db:
+        db.cursor.execute(stmt, (seed_prompt, samples))
+        return db.cursor.fetchall()
+
+
+def explain(database: Database, quiz_id: str, attempt_id: str):
+    params = dict(quiz_id=quiz_id, attempt_id=attempt_id)
+    with DBSession(database) as db:
+        for name, stmt in explained_queries.items():
+            db.cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {stmt}", params)
+            print(f"\n== {name} ==")
+            for (line,) in db.cursor.fetchall():
+                print(line)
+
+
+async def time_repo(repo: QuizRepo, attempts: list[tuple[str, str]]):
+    timings = {"QuizRepo.get_with_progress": [], "QuizRepo.get_results": []}
+    for quiz_id, attempt_id in attempts:
+        started = time.perf_counter()
+        await repo.get_with_progress(quiz_id, attempt_id)
+        timings["QuizRepo.get_with_progress"].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await repo.get_results(quiz_id, attempt_id)
+        timings["QuizRepo.get_results"].append(time.perf_counter() - started)
+
+    print()
+    for name, samples in timings.items():
+        quantiles = statistics.quantiles(samples, n=100)
+        print(
+            f"{name}: p50 {quantiles[49] * 1000:.2f}ms, p95 {quantiles[94] * 1000:.2f}ms, "
+            f"p99 {quantiles[98] * 1000:.2f}ms over {len(samples)} quizzes"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quizzes", type=int, default=1_000_000)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--compact", action="store_true", help="seed the compact options layout")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--skip-seed", action="store_true")
+    args = parser.parse_args()
+
+    database = Database.default()
+    MigrationRunner(database).migrate()
+    if not args.skip_seed:
+        seed(database, args.quizzes, args.questions, args.compact, args.batch_size)
+
+    attempts = sample_attempts(database, args.samples)
+    if len(attempts) < 2:
+        raise SystemExit("Not enough seeded quizzes to sample from")
+
+    explain(database, *attempts[0])
+
+    database.open()
+    try:
+        asyncio.run(time_repo(QuizRepo(database), attempts))
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+"""Per request timings and process wide metrics, exposed in Prometheus text format.
+
+Work done while handling a request is recorded against the RequestStats in current_request_stats,
+which is reported in the Server-Timing header, and in the metrics of the registry, which are
+served by the /metrics endpoint of the app and by serve_metrics in processes without one.
+
+The registry is held by each process. When the app runs in several worker processes, as it does
+under server.py, a scrape of /metrics is answered by whichever worker takes the connection and
+reports only that worker's counts, so the totals across the app are not the sum of one scrape.
+Run one worker per instance with --workers 1 where the metrics must be complete."""
+
+import contextvars
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from dotenv import load_dotenv
+
+default_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...], **extra) -> str:
+    pairs = list(zip(labelnames, values)) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metric(ABC):
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Returns the lines of the samples of the metric in the text format."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value: float, **labels):
+        """Sets the total of a counter that is kept elsewhere, such as the cache hit counts."""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in values]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = default_buckets,
+    ):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # The count in each bucket, the sum and the total count for each set of label values
+        self._values: dict[tuple[str, ...], tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = [(k, (list(c), s, n)) for k, (c, s, n) in self._values.items()]
+
+        lines = []
+        for key, (counts, total, count) in values:
+            for bound, bucket_count in zip(self.buckets, counts):
+                labels = _format_labels(self.labelnames, key, le=bound)
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key, le="+Inf")
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_seconds = registry.register(
+    Histogram("quizai_request_seconds", "Time taken to handle a request", ("method", "route"))
+)
+request_queries = registry.register(
+    Histogram(
+        "quizai_request_queries",
+        "Database queries issued while handling a request",
+        ("method", "route"),
+        buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+    )
+)
+db_acquire_seconds = registry.register(
+    Histogram("quizai_db_acquire_seconds", "Time taken to acquire a database connection")
+)
+db_queries = registry.register(
+    Counter("quizai_db_queries_total", "Database queries by the method issuing them", ("method",))
+)
+db_query_seconds = registry.register(
+    Histogram("quizai_db_query_seconds", "Time taken to execute a database query", ("method",))
+)
+template_render_seconds = registry.register(
+    Histogram("quizai_template_render_seconds", "Time taken to render a template", ("template",))
+)
+llm_seconds = registry.register(
+    Histogram("quizai_llm_seconds", "Time taken by requests to the language model", ("mode",))
+)
+llm_tokens = registry.register(
+    Counter("quizai_llm_tokens_total", "Tokens used by the language model", ("kind",))
+)
+llm_output_problems = registry.register(
+    Counter(
+        "quizai_llm_output_problems_total",
+        "Problems found in the output of the language model by what was done about them",
+        ("problem", "action"),
+    )
+)
+quiz_generation_seconds = registry.register(
+    Histogram("quizai_quiz_generation_seconds", "Time taken by QuizBuilder.make_quiz")
+)
+query_warnings = registry.register(
+    Counter("quizai_query_warnings_total", "Requests issuing more queries than the threshold")
+)
+reaper_rows = registry.register(
+    Counter("quizai_reaper_rows_total", "Rows deleted by the reaper by table", ("table",))
+)
+reaper_run_seconds = registry.register(
+    Histogram("quizai_reaper_run_seconds", "Time taken to delete every expired quiz")
+)
+admission_decisions = registry.register(
+    Counter(
+        "quizai_admission_decisions_total",
+        "Requests admitted or turned away by each limit",
+        ("limit", "outcome"),
+    )
+)
+generation_queue_wait_seconds = registry.register(
+    Histogram("quizai_generation_queue_wait_seconds", "Time waited for a slot to generate a quiz")
+)
+
+# Copied from the state of the app when the metrics are collected
+pool_connections = registry.register(
+    Gauge("quizai_db_pool_connections", "Database connections by state", ("state",))
+)
+pool_timeouts = registry.register(
+    Counter("quizai_db_pool_timeouts_total", "Timeouts acquiring a database connection")
+)
+cache_lookups = registry.register(
+    Counter("quizai_cache_lookups_total", "Cache lookups by result", ("cache", "result"))
+)
+quiz_cache_bytes = registry.register(
+    Gauge("quizai_quiz_cache_bytes", "Size of the quiz content held in the local cache")
+)
+answer_buffer_pending = registry.register(
+    Gauge("quizai_answer_buffer_pending", "Buffered answers not yet written to the database")
+)
+answer_buffer_lag_seconds = registry.register(
+    Gauge("quizai_answer_buffer_lag_seconds", "Age of the oldest buffered answer")
+)
+answer_buffer_answers = registry.register(
+    Counter("quizai_answer_buffer_answers_total", "Answers by what happened to them", ("outcome",))
+)
+answer_buffer_flushes = registry.register(
+    Counter("quizai_answer_buffer_flushes_total", "Batched writes of answers", ("outcome",))
+)
+generation_queue = registry.register(
+    Gauge("quizai_generation_queue", "Quizzes generating or waiting to generate", ("state",))
+)
+
+
+class RequestStats:
+    """The queries and timed spans of a single request. Queries run on the database threads, so
+    updates are locked."""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.queries_by_method: dict[str, int] = {}
+        self.spans: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record_query(self, method: str, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+            self.queries_by_method[method] = self.queries_by_method.get(method, 0) + 1
+
+    def record_span(self, name: str, seconds: float):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        """Returns the value of a Server-Timing header with the query time and every span."""
+        with self._lock:
+            entries = [f'db;dur={self.query_seconds * 1000:.2f};desc="{self.queries} queries"']
+            entries += [f"{name};dur={s * 1000:.2f}" for name, s in self.spans.items()]
+        return ", ".join(entries)
+
+
+# Set for the duration of a request so work can be attributed to it
+current_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+# The repository method issuing queries, used to label them
+current_query_method: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_query_method", default="other"
+)
+
+
+@contextmanager
+def timed(span: str, histogram: Histogram = None, **labels):
+    """Times the block as a span of the current request, and in the histogram if given."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.record_span(span, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+
+
+def record_query(seconds: float):
+    method = current_query_method.get()
+    db_queries.inc(method=method)
+    db_query_seconds.observe(seconds, method=method)
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.record_query(method, seconds)
+
+
+def query_warning_threshold() -> int | None:
+    """Returns the number of queries a request may issue before a possible N+1 query is logged,
+    or None if the warning is not enabled with QUIZ_DEBUG_QUERIES=true."""
+    load_dotenv()
+    if os.getenv("QUIZ_DEBUG_QUERIES") != "true":
+        return None
+    return int(os.getenv("QUIZ_QUERY_WARNING_THRESHOLD", 10))
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int) -> ThreadingHTTPServer:
+    """Serves the registry at /metrics on the port from a background thread, for processes such
+    as the reaper that do not run the app."""
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -1,12 +1,17 @@
 from typing import Annotated
 
 from fastapi import Form
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+# The most questions a quiz may have, as offered by the form on the index page
+max_questions = 15
 
 
 class CreateQuizForm(BaseModel):
     q: str
-    qn: int
+    qn: int = Field(ge=1, le=max_questions)
+    fresh: bool = False
+    stream: bool = False
 
     @property
     def prompt(self):
@@ -16,9 +21,19 @@ class CreateQuizForm(BaseModel):
     def count(self):
         return self.qn
 
+    @property
+    def use_cache(self):
+        return not self.fresh
+
     @classmethod
-    def form(cls, q: Annotated[str, Form()], qn: Annotated[int, Form()]):
-        return cls(q=q, qn=qn)
+    def form(
+        cls,
+        q: Annotated[str, Form()],
+        qn: Annotated[int, Form(ge=1, le=max_questions)],
+        fresh: Annotated[bool, Form()] = False,
+        stream: Annotated[bool, Form()] = False,
+    ):
+        return cls(q=q, qn=qn, fresh=fresh, stream=stream)
 
 
 class SubmitAnswerForm(BaseModel):
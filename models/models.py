@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 
 class Question(BaseModel):
@@ -23,6 +23,9 @@ class Quiz(BaseModel):
     id: str | None = None
     prompt: str
     questions: list[Question]
+    generating: bool = False
+
+    _question_indexes: dict[int, int] | None = PrivateAttr(default=None)
 
     def __len__(self):
         return len(self.questions)
@@ -36,10 +39,16 @@ class Quiz(BaseModel):
         return self.questions[idx]
 
     def get_question_index(self, question_id: int):
-        """Returns the index of the given question id or -1 if the id does not exist.
-        Raises a ValueError if the id of any question is None"""
-        question_ids = [q.id for q in self.questions]
-        if None in question_ids:
-            raise ValueError("Some questions do not have an ID set and cannot be compared")
-
-        return question_ids.index(question_id)
+        """Returns the index of the given question id.
+        Raises a ValueError if the id does not exist or if the id of any question is None"""
+        if self._question_indexes is None:
+            question_ids = [q.id for q in self.questions]
+            if None in question_ids:
+                raise ValueError("Some questions do not have an ID set and cannot be compared")
+
+            self._question_indexes = {qid: i for i, qid in enumerate(question_ids)}
+
+        try:
+            return self._question_indexes[question_id]
+        except KeyError:
+            raise ValueError(f"{question_id} is not a question in this quiz") from None
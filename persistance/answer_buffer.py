@@ -0,0 +1,212 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import psycopg2.extras
+from dotenv import load_dotenv
+
+from persistance.database import DBSession, Database
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerBufferFullError(Exception):
+    """Raised when the buffer stays full for longer than the full timeout."""
+
+
+class AnswerBuffer:
+    """Holds recorded answers in memory and writes them to the database in batches, either every
+    flush_interval seconds or as soon as max_batch answers are waiting, so that a burst of answers
+    costs a few multi-row inserts rather than a transaction each.
+
+    Answers are only buffered by the process that received them, so reads merge in the pending
+    answers of the attempt to see their own writes. Answers still pending when the process dies
+    are lost, which the pending and lag metrics bound."""
+
+    def __init__(
+        self,
+        database: Database,
+        max_batch: int = 500,
+        flush_interval: float = 0.1,
+        max_pending: int = 10_000,
+        full_timeout: float = 1.0,
+    ):
+        self.database = database
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.full_timeout = full_timeout
+        # The correct flag and time answered of every pending answer, by attempt and question
+        self._pending: dict[str, dict[int, tuple[bool, float]]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._flush_requested = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.buffered = 0
+        self.flushed = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.rejected = 0
+        self.last_flush_seconds = 0.0
+
+    @classmethod
+    def default(cls, database: Database) -> "AnswerBuffer | None":
+        """Returns a buffer if write-behind answers are enabled with QUIZ_ANSWER_BUFFER=true."""
+        load_dotenv()
+        if os.getenv("QUIZ_ANSWER_BUFFER") != "true":
+            return None
+
+        return cls(
+            database,
+            max_batch=int(os.getenv("QUIZ_ANSWER_BUFFER_BATCH", 500)),
+            flush_interval=int(os.getenv("QUIZ_ANSWER_BUFFER_INTERVAL_MS", 100)) / 1000,
+            max_pending=int(os.getenv("QUIZ_ANSWER_BUFFER_MAX", 10_000)),
+        )
+
+    @property
+    def pending(self) -> int:
+        return self._count
+
+    @property
+    def lag_seconds(self) -> float:
+        """How long the oldest pending answer has been waiting to be written."""
+        with self._lock:
+            oldest = min(
+                (at for answers in self._pending.values() for _, at in answers.values()),
+                default=None,
+            )
+        return time.time() - oldest if oldest is not None else 0.0
+
+    def answers(self, attempt_id: str) -> dict[int, bool]:
+        """Returns the pending answers of the attempt by question id."""
+        with self._lock:
+            return {qid: correct for qid, (correct, _) in self._pending.get(attempt_id, {}).items()}
+
+    def add(self, attempt_id: str, question_id: int, correct: bool) -> bool:
+        """Buffers the answer and returns whether the recorded answer is correct, which is the
+        first answer if the question has already been answered. Raises an AnswerBufferFullError
+        if the buffer is full."""
+        with self._lock:
+            answers = self._pending.get(attempt_id, {})
+            if question_id in answers:
+                return answers[question_id][0]
+            if self._count >= self.max_pending:
+                self.rejected += 1
+                raise AnswerBufferFullError(f"{self._count} answers are waiting to be written")
+
+            self._pending[attempt_id] = answers
+            answers[question_id] = (correct, time.time())
+            self._count += 1
+            self.buffered += 1
+            full_batch = self._count >= self.max_batch
+
+        if full_batch and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._flush_requested.set)
+        return correct
+
+    async def wait_for_space(self):
+        """Waits for answers to be written while the buffer is full, so callers slow down rather
+        than growing the buffer. Raises an AnswerBufferFullError if it is still full after the
+        full timeout."""
+        deadline = time.monotonic() + self.full_timeout
+        while self._count >= self.max_pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    self.rejected += 1
+                raise AnswerBufferFullError(f"{self._count} answers are waiting to be written")
+
+            self._flush_requested.set()
+            try:
+                await asyncio.wait_for(self._flushed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """Starts flushing in the background. Should be called once at application startup."""
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Stops flushing in the background and writes every pending answer."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._count:
+            logger.error("%d buffered answers could not be written at shutdown", self._count)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            if not await self.flush():
+                # Backs off rather than retrying as fast as full batches are requested
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self) -> bool:
+        """Writes every pending answer in batches of at most max_batch and returns False if a
+        batch could not be written. Answers stay pending, and visible to reads, until the batch
+        containing them has been committed."""
+        async with self._flush_lock:
+            while batch := self._take(self.max_batch):
+                started = time.perf_counter()
+                try:
+                    await self.database.run(self._write, batch)
+                except Exception:
+                    self.failed_flushes += 1
+                    logger.exception("Could not write %d buffered answers", len(batch))
+                    return False
+
+                self._remove(batch)
+                self.flushes += 1
+                self.flushed += len(batch)
+                self.last_flush_seconds = time.perf_counter() - started
+
+                # Wakes everyone waiting for space, who then check the buffer again
+                self._flushed.set()
+                self._flushed = asyncio.Event()
+
+            return True
+
+    def _take(self, limit: int) -> list[tuple[str, int, bool, float]]:
+        batch = []
+        with self._lock:
+            for attempt_id, answers in self._pending.items():
+                for question_id, (correct, answered_at) in answers.items():
+                    batch.append((attempt_id, question_id, correct, answered_at))
+                    if len(batch) == limit:
+                        return batch
+        return batch
+
+    def _remove(self, batch: list[tuple[str, int, bool, float]]):
+        with self._lock:
+            for attempt_id, question_id, _, _ in batch:
+                answers = self._pending.get(attempt_id)
+                if answers is not None and answers.pop(question_id, None) is not None:
+                    self._count -= 1
+                    if not answers:
+                        del self._pending[attempt_id]
+
+    def _write(self, batch: list[tuple[str, int, bool, float]]):
+        # Answers whose attempt or question has since been deleted are dropped rather than
+        # failing the whole batch on the foreign keys
+        stmt = """INSERT INTO answers (attempt_id, question_id, correct, answered_at)
+                  SELECT a.id, qu.id, v.correct, to_timestamp(v.answered_at)
+                  FROM (VALUES %s) v(attempt_id, question_id, correct, answered_at)
+                  JOIN attempts a ON a.id = v.attempt_id::uuid
+                  JOIN questions qu ON qu.id = v.question_id
+                  ON CONFLICT (attempt_id, question_id) DO NOTHING;"""
+
+        with DBSession(self.database) as db:
+            psycopg2.extras.execute_values(db.cursor, stmt, batch, page_size=len(batch))
+            db.conn.commit()
@@ -1,17 +1,54 @@
+import asyncio
+import contextvars
+import functools
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import psycopg2
+import psycopg2.pool
 from psycopg2 import extensions
 from dotenv import load_dotenv
 
+from instrumentation import current_query_method, db_acquire_seconds, record_query, timed
+
+# Whether the queries of the current task are for generating a quiz, which may only use the
+# connections not reserved for the pages of quizzes being taken
+generating = contextvars.ContextVar("generating", default=False)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when a connection could not be acquired from the pool in time."""
+
 
 class DatabaseConfig:
-    def __init__(self, name: str, host: str, user: str, port: str, password: str):
+    def __init__(
+        self,
+        name: str,
+        host: str,
+        user: str,
+        port: str,
+        password: str,
+        min_pool_size: int = None,
+        max_pool_size: int = 10,
+        acquire_timeout: float = 5.0,
+        compact_options: bool = False,
+        reserved_connections: int = 2,
+    ):
         self.name = name
         self.host = host
         self.user = user
         self.port = port
         self.password = password
+        # The pool closes any connection returned while it already holds min_pool_size idle ones,
+        # so this is the number of connections kept open between requests, all of them by default
+        self.min_pool_size = min_pool_size if min_pool_size is not None else max_pool_size
+        self.max_pool_size = max_pool_size
+        self.acquire_timeout = acquire_timeout
+        self.compact_options = compact_options
+        self.reserved_connections = reserved_connections
 
     @classmethod
     def default(cls):
@@ -21,13 +58,63 @@ class DatabaseConfig:
         db_user = os.getenv("DB_USER")
         db_port = os.getenv("DB_PORT")
         db_password = os.getenv("DB_PASSWORD")
+        max_pool_size = int(os.getenv("DB_POOL_MAX", 10))
+        min_pool_size = int(os.getenv("DB_POOL_MIN", max_pool_size))
+        acquire_timeout = float(os.getenv("DB_POOL_TIMEOUT", 5.0))
+        # Stores the options of new questions on the question rather than in the options table
+        compact_options = os.getenv("DB_COMPACT_OPTIONS") == "true"
+        reserved_connections = int(os.getenv("DB_POOL_RESERVED", 2))
+
+        return cls(
+            db_name,
+            db_host,
+            db_user,
+            db_port,
+            db_password,
+            min_pool_size=min_pool_size,
+            max_pool_size=max_pool_size,
+            acquire_timeout=acquire_timeout,
+            compact_options=compact_options,
+            reserved_connections=reserved_connections,
+        )
 
-        return cls(db_name, db_host, db_user, db_port, db_password)
+
+class PoolStats:
+    def __init__(
+        self,
+        max_size: int,
+        in_use: int,
+        waiting: int,
+        acquired: int,
+        timeouts: int,
+        wait_seconds: float,
+    ):
+        self.max_size = max_size
+        self.in_use = in_use
+        self.waiting = waiting
+        self.acquired = acquired
+        self.timeouts = timeouts
+        self.wait_seconds = wait_seconds
+
+    @property
+    def saturation(self) -> float:
+        """The fraction of the pool currently checked out."""
+        return self.in_use / self.max_size if self.max_size else 0.0
 
 
 class Database:
     def __init__(self, config: DatabaseConfig):
         self.config = config
+        self._pool: psycopg2.pool.ThreadedConnectionPool | None = None
+        self._executor: ThreadPoolExecutor | None = None
+        self._slots: threading.BoundedSemaphore | None = None
+        self._generation_slots: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._waiting = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
 
     @classmethod
     def default(cls, create_tables: bool = False):
@@ -52,46 +139,178 @@ class Database:
 
         return conn
 
+    @property
+    def is_open(self) -> bool:
+        return self._pool is not None
+
+    def open(self):
+        """Creates the connection pool and the worker threads used to run blocking queries.
+        Should be called once at application startup."""
+        if self.is_open:
+            return
+
+        self._pool = psycopg2.pool.ThreadedConnectionPool(
+            self.config.min_pool_size,
+            self.config.max_pool_size,
+            host=self.config.host,
+            user=self.config.user,
+            port=self.config.port,
+            database=self.config.name,
+            password=self.config.password,
+        )
+        self._slots = threading.BoundedSemaphore(self.config.max_pool_size)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.config.max_pool_size, thread_name_prefix="db"
+        )
+        self._generation_slots = asyncio.Semaphore(
+            max(1, self.config.max_pool_size - self.config.reserved_connections)
+        )
+
+    def close(self):
+        """Closes every pooled connection. Should be called once at application shutdown."""
+        if not self.is_open:
+            return
+
+        self._executor.shutdown(wait=True)
+        self._pool.closeall()
+        self._pool = None
+        self._executor = None
+        self._slots = None
+        self._generation_slots = None
+
+    def acquire(self) -> extensions.connection:
+        """Returns a connection from the pool, or a new connection if the pool is not open.
+        Raises a PoolTimeoutError if no pooled connection becomes free within the acquire
+        timeout."""
+        with timed("db-acquire", db_acquire_seconds):
+            return self._acquire()
+
+    def _acquire(self) -> extensions.connection:
+        if not self.is_open:
+            return self.connect(self.config)
+
+        started = time.perf_counter()
+        with self._lock:
+            self._waiting += 1
+        acquired = self._slots.acquire(timeout=self.config.acquire_timeout)
+        with self._lock:
+            self._waiting -= 1
+            self._wait_seconds += time.perf_counter() - started
+            if not acquired:
+                self._timeouts += 1
+            else:
+                self._in_use += 1
+                self._acquired += 1
+
+        if not acquired:
+            raise PoolTimeoutError(
+                f"Could not acquire a database connection within {self.config.acquire_timeout}s"
+            )
+
+        try:
+            return self._pool.getconn()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def release(self, conn: extensions.connection):
+        """Returns a connection acquired with acquire to the pool, or closes it if not pooled."""
+        if not self.is_open:
+            conn.close()
+            return
+
+        try:
+            self._pool.putconn(conn)
+        finally:
+            self._release_slot()
+
+    def _release_slot(self):
+        with self._lock:
+            self._in_use -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs the blocking callable on the database thread pool so the event loop is not stalled.
+        Calls made while generating a quiz wait here for one of the threads not reserved, before
+        taking a thread, so that reads are never queued behind them."""
+        if generating.get() and self._generation_slots is not None:
+            async with self._generation_slots:
+                return await self._run(fn, *args, **kwargs)
+        return await self._run(fn, *args, **kwargs)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fn, *args, **kwargs)
+        # The context is copied so queries are still attributed to the calling request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, call)
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            return PoolStats(
+                max_size=self.config.max_pool_size,
+                in_use=self._in_use,
+                waiting=self._waiting,
+                acquired=self._acquired,
+                timeouts=self._timeouts,
+                wait_seconds=self._wait_seconds,
+            )
+
     def create_tables_if_not_exists(self):
-        create_uuid_extension = """CREATE EXTENSION IF NOT EXISTS \"uuid-ossp\""""
-
-        create_quiz_table = """
-        CREATE TABLE IF NOT EXISTS quizzes (
-            id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
-            prompt TEXT NOT NULL,
-            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-        );"""
-
-        create_questions_table = """
-        CREATE TABLE IF NOT EXISTS questions (
-            id serial PRIMARY KEY,
-            quiz_id uuid,
-            text TEXT NOT NULL,
-            answered_correct BOOLEAN DEFAULT NULL,
-            CONSTRAINT fk_quizzes
-                FOREIGN KEY(quiz_id)
-                    REFERENCES quizzes(id)
-                        ON DELETE CASCADE
-        );"""
-
-        create_options_table = """
-        CREATE TABLE IF NOT EXISTS options (
-            id serial PRIMARY KEY,
-            question_id serial,
-            text TEXT NOT NULL,
-            correct BOOLEAN NOT NULL DEFAULT True,
-            CONSTRAINT fk_questions
-                FOREIGN KEY(question_id)
-                    REFERENCES questions(id)
-                        ON DELETE CASCADE
-        );"""
-
-        with DBSession(self) as db:
-            db.cursor.execute(create_uuid_extension)
-            db.cursor.execute(create_quiz_table)
-            db.cursor.execute(create_questions_table)
-            db.cursor.execute(create_options_table)
-            db.conn.commit()
+        """Brings the schema up to date by applying any pending migrations."""
+        # Imported here as the migrator depends on this module
+        from persistance.migrator import MigrationRunner
+
+        MigrationRunner(self).migrate()
+
+
+@contextmanager
+def generation_lane():
+    """Marks the queries issued within, and by the tasks created within, as generating a quiz."""
+    token = generating.set(True)
+    try:
+        yield
+    finally:
+        generating.reset(token)
+
+
+def offload(method):
+    """Turns a blocking repository method into a coroutine that runs on the database thread pool.
+    The wrapped class must expose the Database as self.database."""
+
+    name = method.__qualname__
+
+    def call(self, *args, **kwargs):
+        # Runs in the copied context of the database thread, so the label ends with the call
+        current_query_method.set(name)
+        return method(self, *args, **kwargs)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await self.database.run(call, self, *args, **kwargs)
+
+    return wrapper
+
+
+class InstrumentedCursor:
+    """Wraps a cursor to count and time the queries it executes, labelled with the repository
+    method issuing them."""
+
+    def __init__(self, cursor: extensions.cursor):
+        self._cursor = cursor
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(query, vars)
+        finally:
+            record_query(time.perf_counter() - started)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
 
 
 class ConnectionCursor:
@@ -108,15 +327,17 @@ class DBSession:
         self.cursor_factory = cursor_factory
 
     def __enter__(self):
-        self.conn = self.db.connect()
+        self.conn = self.db.acquire()
         if self.cursor_factory is None:
-            self.cursor = self.conn.cursor()
+            self.cursor = InstrumentedCursor(self.conn.cursor())
         else:
-            self.cursor = self.conn.cursor(cursor_factory=self.cursor_factory)
+            self.cursor = InstrumentedCursor(self.conn.cursor(cursor_factory=self.cursor_factory))
         return ConnectionCursor(self.conn, self.cursor)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.conn:
-            self.conn.close()
         if self.cursor:
             self.cursor.close()
+        if self.conn:
+            if exc_type is not None and not self.conn.closed:
+                self.conn.rollback()
+            self.db.release(self.conn)
@@ -0,0 +1,50 @@
+from models import Quiz
+from persistance.database import DBSession, Database, offload
+
+
+class GenerationCacheRepo:
+    """Stores generated quizzes in the database so they are shared between workers and restarts."""
+
+    def __init__(self, database: Database):
+        self.database = database
+
+    @offload
+    def get(self, key: str, max_age: float) -> Quiz | None:
+        stmt = """SELECT quiz FROM generation_cache
+                  WHERE key = %s AND created_at > NOW() - make_interval(secs => %s);"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (key, max_age))
+            result = db.cursor.fetchone()
+
+        if not result:
+            return None
+        return Quiz(**result[0])
+
+    @offload
+    def put(self, key: str, quiz: Quiz):
+        stmt = """INSERT INTO generation_cache (key, quiz) VALUES (%s, %s::jsonb)
+                  ON CONFLICT (key) DO UPDATE SET quiz = EXCLUDED.quiz, created_at = NOW();"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (key, quiz.model_dump_json(exclude={"id"})))
+            db.conn.commit()
+
+    @offload
+    def delete_stale(self, max_age: float, limit: int) -> int:
+        """Deletes up to limit quizzes stored more than max_age seconds ago, which get no longer
+        returns. Returns the number deleted."""
+        stmt = """DELETE FROM generation_cache
+                  WHERE key IN (
+                      SELECT key FROM generation_cache
+                      WHERE created_at < NOW() - make_interval(secs => %s)
+                      LIMIT %s
+                      FOR UPDATE SKIP LOCKED
+                  );"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (max_age, limit))
+            deleted = db.cursor.rowcount
+            db.conn.commit()
+
+        return deleted
@@ -0,0 +1,136 @@
+from persistance.database import DBSession, Database, offload
+
+
+class GenerationJob:
+    def __init__(self, id: int, topic: str, num_questions: int, attempts: int):
+        self.id = id
+        self.topic = topic
+        self.num_questions = num_questions
+        self.attempts = attempts
+
+
+class GenerationJobRepo:
+    """A queue of quizzes waiting to be generated for the pre-generated quiz pool. A topic with
+    max_failures failed jobs within the failure window is not topped up again until they age
+    out of it, so a topic the model cannot generate is not retried forever."""
+
+    def __init__(
+        self,
+        database: Database,
+        max_attempts: int = 3,
+        stale_after: float = 600,
+        max_failures: int = 3,
+        failure_window: float = 3600,
+    ):
+        self.database = database
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+
+    @offload
+    def top_up(self, topic: str, num_questions: int, target: int) -> int:
+        """Queues enough jobs for the pooled and queued quizzes for the topic to reach the target,
+        unless the topic has failed too often recently. Returns the number of jobs queued."""
+        lock_stmt = "SELECT pg_advisory_xact_lock(hashtext(%s));"
+        stmt = """INSERT INTO generation_jobs (topic, num_questions)
+                  SELECT %(topic)s, %(num_questions)s
+                  FROM generate_series(1, %(target)s - (
+                      SELECT COUNT(*) FROM quiz_pool
+                      WHERE topic = %(topic)s AND num_questions = %(num_questions)s
+                  ) - (
+                      SELECT COUNT(*) FROM generation_jobs
+                      WHERE topic = %(topic)s AND num_questions = %(num_questions)s
+                        AND status IN ('pending', 'running')
+                  ))
+                  WHERE (
+                      SELECT COUNT(*) FROM generation_jobs
+                      WHERE topic = %(topic)s AND num_questions = %(num_questions)s
+                        AND status = 'failed'
+                        AND updated_at > NOW() - make_interval(secs => %(failure_window)s)
+                  ) < %(max_failures)s;"""
+
+        with DBSession(self.database) as db:
+            # Serialises top ups for the topic so concurrent workers do not both fill the deficit
+            db.cursor.execute(lock_stmt, (f"{topic}|{num_questions}",))
+            db.cursor.execute(
+                stmt,
+                dict(
+                    topic=topic,
+                    num_questions=num_questions,
+                    target=target,
+                    failure_window=self.failure_window,
+                    max_failures=self.max_failures,
+                ),
+            )
+            queued = db.cursor.rowcount
+            db.conn.commit()
+
+        return queued
+
+    @offload
+    def claim(self) -> GenerationJob | None:
+        """Marks the oldest pending job as running and returns it. Jobs left running for longer
+        than stale_after seconds, such as by a worker that crashed, are claimed again."""
+        stmt = """UPDATE generation_jobs
+                  SET status = 'running', attempts = attempts + 1, updated_at = NOW()
+                  WHERE id = (
+                      SELECT id FROM generation_jobs
+                      WHERE status = 'pending'
+                         OR (status = 'running'
+                             AND updated_at < NOW() - make_interval(secs => %s))
+                      ORDER BY id
+                      LIMIT 1
+                      FOR UPDATE SKIP LOCKED
+                  )
+                  RETURNING id, topic, num_questions, attempts;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (self.stale_after,))
+            result = db.cursor.fetchone()
+            db.conn.commit()
+
+        if not result:
+            return None
+        return GenerationJob(*result)
+
+    @offload
+    def complete(self, job_id: int):
+        stmt = "DELETE FROM generation_jobs WHERE id = %s;"
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (job_id,))
+            db.conn.commit()
+
+    @offload
+    def fail(self, job_id: int):
+        """Returns the job to the queue, or marks it as failed once it has used every attempt."""
+        stmt = """UPDATE generation_jobs
+                  SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                      updated_at = NOW()
+                  WHERE id = %s;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (self.max_attempts, job_id))
+            db.conn.commit()
+
+    @offload
+    def delete_failed(self, older_than: float, limit: int) -> int:
+        """Deletes up to limit jobs that failed more than older_than seconds ago, which must be
+        longer than the failure window for them to still hold back their topic. Returns the
+        number of jobs deleted."""
+        stmt = """DELETE FROM generation_jobs
+                  WHERE id IN (
+                      SELECT id FROM generation_jobs
+                      WHERE status = 'failed'
+                        AND updated_at < NOW() - make_interval(secs => %s)
+                      LIMIT %s
+                      FOR UPDATE SKIP LOCKED
+                  );"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (max(older_than, self.failure_window), limit))
+            deleted = db.cursor.rowcount
+            db.conn.commit()
+
+        return deleted
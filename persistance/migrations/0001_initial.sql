@@ -0,0 +1,77 @@
+-- The schema previously created by Database.create_tables_if_not_exists. Every statement is
+-- idempotent so databases created before migrations existed can adopt them.
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE TABLE IF NOT EXISTS quizzes (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+    prompt TEXT NOT NULL,
+    generating BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS generating BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE TABLE IF NOT EXISTS questions (
+    id serial PRIMARY KEY,
+    quiz_id uuid,
+    text TEXT NOT NULL,
+    correct_index INT,
+    answered_correct BOOLEAN DEFAULT NULL,
+    CONSTRAINT fk_quizzes
+        FOREIGN KEY(quiz_id)
+            REFERENCES quizzes(id)
+                ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS options (
+    id serial PRIMARY KEY,
+    question_id serial,
+    text TEXT NOT NULL,
+    correct BOOLEAN NOT NULL DEFAULT True,
+    CONSTRAINT fk_questions
+        FOREIGN KEY(question_id)
+            REFERENCES questions(id)
+                ON DELETE CASCADE
+);
+
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS correct_index INT;
+
+-- Questions saved before the correct_index column existed take it from their options
+UPDATE questions qu SET correct_index = o.idx
+FROM (
+    SELECT
+        question_id,
+        correct,
+        ROW_NUMBER() OVER (PARTITION BY question_id ORDER BY id) - 1 idx
+    FROM options
+) o
+WHERE qu.id = o.question_id AND o.correct AND qu.correct_index IS NULL;
+
+CREATE TABLE IF NOT EXISTS generation_cache (
+    key TEXT PRIMARY KEY,
+    quiz JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE TABLE IF NOT EXISTS quiz_pool (
+    quiz_id uuid PRIMARY KEY,
+    topic TEXT NOT NULL,
+    num_questions INT NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT fk_quizzes
+        FOREIGN KEY(quiz_id)
+            REFERENCES quizzes(id)
+                ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS quiz_pool_topic_idx ON quiz_pool (topic, num_questions, created_at);
+
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id serial PRIMARY KEY,
+    topic TEXT NOT NULL,
+    num_questions INT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,14 @@
+-- migrate: no-transaction
+-- Built concurrently so that existing tables stay writable while the indexes are created.
+
+-- Every read of a quiz's questions filters on quiz_id and orders by id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_quiz_id_id_idx ON questions (quiz_id, id);
+
+-- Finding the current question only looks at questions that have not been answered
+CREATE INDEX CONCURRENTLY IF NOT EXISTS questions_unanswered_idx
+    ON questions (quiz_id, id) WHERE answered_correct IS NULL;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS options_question_id_id_idx ON options (question_id, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS generation_jobs_pending_idx
+    ON generation_jobs (id) WHERE status IN ('pending', 'running');
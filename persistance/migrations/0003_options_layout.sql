@@ -0,0 +1,8 @@
+-- options.question_id was declared serial, which gave it a default from a sequence it never needs
+ALTER TABLE options ALTER COLUMN question_id DROP DEFAULT;
+DROP SEQUENCE IF EXISTS options_question_id_seq;
+ALTER TABLE options ALTER COLUMN question_id SET NOT NULL;
+
+-- The compact layout stores the options of a question in order on the question itself instead of
+-- as rows in the options table. Questions with no array still read their options from the table.
+ALTER TABLE questions ADD COLUMN IF NOT EXISTS options TEXT[];
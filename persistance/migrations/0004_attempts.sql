@@ -0,0 +1,37 @@
+-- Answers are recorded against an attempt rather than on the questions, so that a quiz can be
+-- taken by any number of people at once and its content never changes once generated.
+-- questions.answered_correct is no longer written and is kept only for the answers recorded
+-- before this migration.
+CREATE TABLE IF NOT EXISTS attempts (
+    id uuid PRIMARY KEY DEFAULT uuid_generate_v4(),
+    quiz_id uuid NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CONSTRAINT fk_quizzes
+        FOREIGN KEY(quiz_id)
+            REFERENCES quizzes(id)
+                ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS attempts_quiz_id_idx ON attempts (quiz_id);
+
+-- Rows are only ever inserted, one for each question answered in an attempt
+CREATE TABLE IF NOT EXISTS answers (
+    attempt_id uuid NOT NULL,
+    question_id INT NOT NULL,
+    correct BOOLEAN NOT NULL,
+    answered_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (attempt_id, question_id),
+    CONSTRAINT fk_attempts
+        FOREIGN KEY(attempt_id)
+            REFERENCES attempts(id)
+                ON DELETE CASCADE,
+    CONSTRAINT fk_questions
+        FOREIGN KEY(question_id)
+            REFERENCES questions(id)
+                ON DELETE CASCADE
+);
+
+-- Deleting a question looks up its answers through the foreign key
+CREATE INDEX IF NOT EXISTS answers_question_id_idx ON answers (question_id);
+
+DROP INDEX IF EXISTS questions_unanswered_idx;
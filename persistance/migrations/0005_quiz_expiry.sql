@@ -0,0 +1,4 @@
+-- Quizzes are deleted by the reaper once they expire. Quizzes with no expiry, including those
+-- created before this migration and those waiting in the pool, are kept until given one, such as
+-- by `python reaper.py --backfill`.
+ALTER TABLE quizzes ADD COLUMN IF NOT EXISTS expires_at TIMESTAMPTZ;
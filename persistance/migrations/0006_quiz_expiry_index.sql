@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+-- The reaper finds the expired quizzes oldest first, and only quizzes with an expiry are indexed
+CREATE INDEX CONCURRENTLY IF NOT EXISTS quizzes_expires_at_idx
+    ON quizzes (expires_at) WHERE expires_at IS NOT NULL;
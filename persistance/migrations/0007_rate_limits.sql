@@ -0,0 +1,7 @@
+-- The token buckets of the rate limits shared by every process of the app. The table is unlogged
+-- as losing the buckets in a crash only resets the limits, which is not worth the write ahead log.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,190 @@
+import argparse
+import os
+import re
+
+from persistance.database import DBSession, Database
+
+migrations_dir = os.path.join(os.path.dirname(__file__), "migrations")
+migration_filename = re.compile(r"^(\d+)_(\w+)\.sql$")
+no_transaction_marker = "-- migrate: no-transaction"
+concurrent_index = re.compile(
+    r"^CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.IGNORECASE
+)
+
+
+class Migration:
+    def __init__(self, version: int, name: str, sql: str):
+        self.version = version
+        self.name = name
+        self.sql = sql
+
+    @property
+    def transactional(self) -> bool:
+        """Statements such as CREATE INDEX CONCURRENTLY cannot run inside a transaction, so
+        migrations starting with the no-transaction marker run each statement on its own."""
+        return not self.sql.lstrip().startswith(no_transaction_marker)
+
+    def statements(self) -> list[str]:
+        """Splits the migration into statements, each of which must end a line with a semicolon."""
+        lines = [line for line in self.sql.splitlines() if not line.strip().startswith("--")]
+        statements = re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE)
+        return [s.strip() for s in statements if s.strip()]
+
+    @staticmethod
+    def concurrent_index_name(statement: str) -> str | None:
+        """Returns the name of the index the statement creates concurrently, if it does."""
+        match = concurrent_index.match(statement)
+        return match.group(1) if match else None
+
+    def __str__(self):
+        return f"{self.version:04d}_{self.name}"
+
+
+class MigrationRunner:
+    """Applies the numbered SQL files in the migrations directory that have not yet been applied,
+    recording each in the schema_migrations table."""
+
+    def __init__(self, database: Database, directory: str = migrations_dir):
+        self.database = database
+        self.directory = directory
+
+    def load(self) -> list[Migration]:
+        migrations = []
+        for filename in sorted(os.listdir(self.directory)):
+            match = migration_filename.match(filename)
+            if match is None:
+                continue
+
+            with open(os.path.join(self.directory, filename)) as f:
+                migrations.append(Migration(int(match.group(1)), match.group(2), f.read()))
+
+        return sorted(migrations, key=lambda m: m.version)
+
+    def applied_versions(self) -> set[int]:
+        create_stmt = """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(create_stmt)
+            db.cursor.execute("SELECT version FROM schema_migrations;")
+            versions = {row[0] for row in db.cursor.fetchall()}
+            db.conn.commit()
+
+        return versions
+
+    def pending(self) -> list[Migration]:
+        applied = self.applied_versions()
+        return [m for m in self.load() if m.version not in applied]
+
+    def migrate(self) -> list[Migration]:
+        """Applies every pending migration in order and returns those that were applied."""
+        record_stmt = "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);"
+        # Stops two processes starting at the same time from applying the same migration
+        lock_stmt = "SELECT pg_advisory_lock(hashtext('schema_migrations'));"
+        unlock_stmt = "SELECT pg_advisory_unlock(hashtext('schema_migrations'));"
+
+        applied = []
+        with DBSession(self.database) as lock:
+            lock.conn.autocommit = True
+            lock.cursor.execute(lock_stmt)
+            try:
+                for migration in self.pending():
+                    with DBSession(self.database) as db:
+                        if migration.transactional:
+                            db.cursor.execute(migration.sql)
+                        else:
+                            db.conn.autocommit = True
+                            for statement in migration.statements():
+                                self._drop_invalid_index(db, statement)
+                                db.cursor.execute(statement)
+                            db.conn.autocommit = False
+
+                        db.cursor.execute(record_stmt, (migration.version, migration.name))
+                        db.conn.commit()
+
+                    applied.append(migration)
+            finally:
+                lock.cursor.execute(unlock_stmt)
+                lock.conn.autocommit = False
+
+        return applied
+
+    @staticmethod
+    def _drop_invalid_index(db: DBSession, statement: str):
+        """A CREATE INDEX CONCURRENTLY that fails leaves behind an invalid index, which IF NOT
+        EXISTS would then skip, so one left by an earlier attempt at the statement is dropped
+        before the index is created again."""
+        stmt = """SELECT 1 FROM pg_index i
+                  JOIN pg_class c ON c.oid = i.indexrelid
+                  WHERE c.relname = %s AND pg_table_is_visible(c.oid) AND NOT i.indisvalid;"""
+
+        name = Migration.concurrent_index_name(statement)
+        if name is None:
+            return
+        db.cursor.execute(stmt, (name,))
+        if db.cursor.fetchone() is not None:
+            db.cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+def compact_options(database: Database, batch_size: int = 1000, delete: bool = False) -> int:
+    """Copies the options of questions still using the options table onto the questions in the
+    compact layout, in batches so no long running lock is held. If delete is True the copied
+    option rows are removed. Returns the number of questions converted."""
+    stmt = """WITH batch AS (
+                SELECT id FROM questions WHERE options IS NULL ORDER BY id LIMIT %s
+              )
+              UPDATE questions qu
+              SET options = ARRAY(
+                  SELECT o.text FROM options o WHERE o.question_id = qu.id ORDER BY o.id
+              )
+              FROM batch
+              WHERE qu.id = batch.id
+              RETURNING qu.id;"""
+    delete_stmt = "DELETE FROM options WHERE question_id = ANY(%s);"
+
+    converted = 0
+    while True:
+        with DBSession(database) as db:
+            db.cursor.execute(stmt, (batch_size,))
+            question_ids = [row[0] for row in db.cursor.fetchall()]
+            if delete and question_ids:
+                db.cursor.execute(delete_stmt, (question_ids,))
+            db.conn.commit()
+
+        converted += len(question_ids)
+        if len(question_ids) < batch_size:
+            return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manages the quiz database schema")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="apply pending migrations")
+    commands.add_parser("status", help="list pending migrations")
+    compact = commands.add_parser(
+        "compact-options", help="move existing options onto their questions"
+    )
+    compact.add_argument("--batch-size", type=int, default=1000)
+    compact.add_argument("--delete", action="store_true", help="delete the copied option rows")
+    args = parser.parse_args()
+
+    database = Database.default()
+    runner = MigrationRunner(database)
+
+    if args.command == "migrate":
+        for migration in runner.migrate():
+            print(f"Applied {migration}")
+    elif args.command == "status":
+        for migration in runner.pending():
+            print(f"Pending {migration}")
+    elif args.command == "compact-options":
+        converted = compact_options(database, batch_size=args.batch_size, delete=args.delete)
+        print(f"Converted {converted} questions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from models import Quiz
+
+
+class SharedQuizCache(ABC):
+    """The interface for a cache shared between processes, such as Redis or memcached.
+    Values are the JSON encoded quiz content."""
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+
+class InMemorySharedCache(SharedQuizCache):
+    """A process local stand-in for a shared cache, for development and tests."""
+
+    def __init__(self):
+        self._values: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._values[key] = value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._values.pop(key, None)
+
+
+class QuizContentCache:
+    """Caches the content of quizzes, which never changes once a quiz has been generated, in a
+    process local LRU bounded by both entry count and size. The answered state of the questions is
+    not cached and is always None on quizzes returned from the cache."""
+
+    def __init__(
+        self, max_entries: int = 10_000, max_bytes: int = 64_000_000, shared: SharedQuizCache = None
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries: OrderedDict[str, tuple[Quiz, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def default(cls, shared: SharedQuizCache = None):
+        load_dotenv()
+        # QUIZ_SHARED_CACHE=memory uses the in memory stand-in in place of a real shared cache
+        if shared is None and os.getenv("QUIZ_SHARED_CACHE") == "memory":
+            shared = InMemorySharedCache()
+
+        return cls(
+            max_entries=int(os.getenv("QUIZ_CONTENT_CACHE_ENTRIES", 10_000)),
+            max_bytes=int(os.getenv("QUIZ_CONTENT_CACHE_BYTES", 64_000_000)),
+            shared=shared,
+        )
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.shared_hits + self.misses
+        return (self.hits + self.shared_hits) / lookups if lookups else 0.0
+
+    def get(self, quiz_id: str) -> Quiz | None:
+        with self._lock:
+            entry = self._entries.get(quiz_id)
+            if entry is not None:
+                self._entries.move_to_end(quiz_id)
+                self.hits += 1
+                return entry[0]
+
+        if self.shared is not None:
+            value = self.shared.get(quiz_id)
+            if value is not None:
+                quiz = Quiz.model_validate_json(value)
+                self._put_local(quiz_id, quiz, len(value))
+                with self._lock:
+                    self.shared_hits += 1
+                return quiz
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, quiz: Quiz):
+        """Caches the content of the quiz, ignoring its answered state."""
+        content = quiz.model_copy(
+            update=dict(
+                questions=[q.model_copy(update=dict(answered_correct=None)) for q in quiz.questions]
+            )
+        )
+        value = content.model_dump_json()
+        self._put_local(quiz.id, content, len(value))
+        if self.shared is not None:
+            self.shared.set(quiz.id, value)
+
+    def invalidate(self, quiz_id: str):
+        with self._lock:
+            entry = self._entries.pop(quiz_id, None)
+            if entry is not None:
+                self.size_bytes -= entry[1]
+
+        if self.shared is not None:
+            self.shared.delete(quiz_id)
+
+    def _put_local(self, quiz_id: str, quiz: Quiz, size: int):
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(quiz_id, None)
+            if previous is not None:
+                self.size_bytes -= previous[1]
+
+            self._entries[quiz_id] = (quiz, size)
+            self.size_bytes += size
+            while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size_bytes -= evicted_size
+                self.evictions += 1
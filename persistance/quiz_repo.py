@@ -1,7 +1,16 @@
+import asyncio
+import csv
+import io
+import uuid
+from typing import IO, Iterable, Iterator
+
 import psycopg2.extras
 
+from instrumentation import timed
 from models import Quiz, Question
-from persistance.database import DBSession, Database
+from persistance.answer_buffer import AnswerBuffer
+from persistance.database import DBSession, Database, InstrumentedCursor, offload
+from persistance.quiz_cache import QuizContentCache
 
 
 class QuizResults:
@@ -11,146 +20,857 @@ class QuizResults:
         self.correct = correct
 
 
+class QuizView:
+    """A read-only view of a quiz together with the answers of a single attempt. The content of
+    the quiz is shared with the cache rather than copied for each attempt, so the answered state
+    of its questions is always None and the answers are looked up by question id instead."""
+
+    __slots__ = ("quiz", "answers", "results", "current_question_index", "attempt_id")
+
+    def __init__(self, quiz: Quiz, answers: dict[int, bool | None], attempt_id: str = None):
+        self.quiz = quiz
+        self.answers = answers
+        self.attempt_id = attempt_id
+
+        answered = correct = 0
+        self.current_question_index = None
+        for i, question in enumerate(quiz.questions):
+            answer = answers.get(question.id)
+            if answer is None:
+                if self.current_question_index is None:
+                    self.current_question_index = i
+            else:
+                answered += 1
+                correct += answer
+        self.results = QuizResults(count=len(quiz), answered=answered, correct=correct)
+
+    @property
+    def current_question(self) -> Question | None:
+        if self.current_question_index is None:
+            return None
+        return self.quiz.questions[self.current_question_index]
+
+    @property
+    def completed(self) -> bool:
+        return self.current_question_index is None and not self.quiz.generating
+
+    @property
+    def waiting(self) -> bool:
+        """True if every question so far has been answered but more are still being generated."""
+        return self.current_question_index is None and self.quiz.generating
+
+
+class SubmitResult:
+    """The outcome of answering a question, with what is needed to render the response."""
+
+    def __init__(
+        self,
+        answered_correct: bool,
+        correct_answer: str,
+        results: QuizResults,
+        next_question: Question | None,
+        next_question_number: int,
+        generating: bool,
+    ):
+        self.answered_correct = answered_correct
+        self.correct_answer = correct_answer
+        self.results = results
+        self.next_question = next_question
+        self.next_question_number = next_question_number
+        self.generating = generating
+
+
+class ImportResult:
+    def __init__(self, quizzes: int = 0, questions: int = 0, rejected: int = 0):
+        self.quizzes = quizzes
+        self.questions = questions
+        self.rejected = rejected
+
+    def add(self, other: "ImportResult"):
+        self.quizzes += other.quizzes
+        self.questions += other.questions
+        self.rejected += other.rejected
+
+
+# One row for each question of every finished quiz, in order. Questions saved before the compact
+# layout take their options, and if needed their correct index, from the options table.
+export_stmt = """SELECT
+        q.id,
+        q.prompt,
+        qu.id,
+        qu.text,
+        COALESCE(qu.correct_index, o.correct_index, 0),
+        COALESCE(qu.options, o.texts)
+    FROM quizzes q
+    JOIN questions qu ON qu.quiz_id = q.id
+    LEFT JOIN LATERAL (
+        SELECT
+            array_agg(text ORDER BY id) AS texts,
+            array_position(array_agg(correct ORDER BY id), TRUE) - 1 AS correct_index
+        FROM options
+        WHERE question_id = qu.id
+    ) o ON qu.options IS NULL
+    WHERE NOT q.generating
+    ORDER BY q.id, qu.id"""
+
+# Imported questions are copied into this table, whose columns match the rows of export_stmt, and
+# then moved into the quiz tables with a single statement
+staging_stmt = """CREATE TEMP TABLE IF NOT EXISTS import_questions (
+        quiz_id uuid,
+        prompt TEXT,
+        position INT,
+        text TEXT,
+        correct_index INT,
+        options TEXT[]
+    ) ON COMMIT DELETE ROWS;"""
+
+# Every imported quiz is given a new id. Question ids are taken from the sequence in the order of
+# the questions so the options can be inserted in the same statement.
+move_staged_stmt = """WITH staged AS (
+        SELECT * FROM import_questions
+    ),
+    valid AS (
+        SELECT * FROM staged
+        WHERE text <> ''
+            AND prompt IS NOT NULL
+            AND cardinality(options) >= 2
+            AND correct_index >= 0
+            AND correct_index < cardinality(options)
+    ),
+    new_quizzes AS (
+        SELECT quiz_id AS old_id, uuid_generate_v4() AS id, min(prompt) AS prompt
+        FROM valid
+        GROUP BY quiz_id
+    ),
+    inserted_quizzes AS (
+        INSERT INTO quizzes (id, prompt, expires_at)
+        SELECT id, prompt, NOW() + make_interval(secs => %(ttl)s) FROM new_quizzes
+        RETURNING id
+    ),
+    new_questions AS (
+        SELECT nextval(pg_get_serial_sequence('questions', 'id')) AS id, *
+        FROM (
+            SELECT n.id AS quiz_id, v.text, v.correct_index, v.options
+            FROM valid v
+            JOIN new_quizzes n ON n.old_id = v.quiz_id
+            ORDER BY v.quiz_id, v.position
+        ) ordered
+    ),
+    inserted_questions AS (
+        INSERT INTO questions (id, quiz_id, text, correct_index, options)
+        SELECT id, quiz_id, text, correct_index, CASE WHEN %(compact)s THEN options END
+        FROM new_questions
+        RETURNING id
+    ),
+    inserted_options AS (
+        INSERT INTO options (question_id, text, correct)
+        SELECT nq.id, o.text, o.position - 1 = nq.correct_index
+        FROM new_questions nq
+        CROSS JOIN LATERAL unnest(nq.options) WITH ORDINALITY o(text, position)
+        WHERE NOT %(compact)s
+        ORDER BY nq.id, o.position
+    )
+    SELECT
+        (SELECT COUNT(*) FROM inserted_quizzes),
+        (SELECT COUNT(*) FROM inserted_questions),
+        (SELECT COUNT(*) FROM staged) - (SELECT COUNT(*) FROM valid);"""
+
+
+def _array_literal(values: list[str]) -> str:
+    quoted = (v.replace("\\", "\\\\").replace('"', '\\"') for v in values)
+    return "{" + ",".join(f'"{v}"' for v in quoted) + "}"
+
+
 class QuizRepo:
-    def __init__(self, database: Database):
+    def __init__(
+        self,
+        database: Database,
+        cache: QuizContentCache = None,
+        answers: AnswerBuffer = None,
+        ttl: float = None,
+    ):
         self.database = database
+        self.cache = cache
+        self.answers = answers
+        # Seconds until a new quiz expires and is deleted by the reaper, or None to keep it
+        self.ttl = ttl
 
+    @offload
     def create(self, quiz: Quiz) -> Quiz:
-        """Creates a placeholder entry for a Quiz and returns the id"""
-        quiz_id: str
-        quiz_stmt = "INSERT INTO quizzes (prompt) VALUES (%s) RETURNING id;"
-        question_stmt = "INSERT INTO questions (quiz_id, text) VALUES (%s, %s) RETURNING id;"
-        options_stmt = "INSERT INTO options (question_id, text, correct) VALUES (%s, %s, %s);"
+        """Saves the quiz and returns a copy with the generated quiz and question ids set"""
+        with DBSession(self.database) as db:
+            saved = self._insert(db.cursor, [quiz])
+            db.conn.commit()
+
+        if self.cache is not None:
+            self.cache.put(saved[0])
+        return saved[0]
 
+    @offload
+    def create_many(self, quizzes: list[Quiz], batch_size: int = 500) -> list[Quiz]:
+        """Saves the quizzes in batches, committing after each batch of batch_size quizzes"""
+        saved: list[Quiz] = []
         with DBSession(self.database) as db:
-            db.cursor.execute(quiz_stmt, (quiz.prompt,))
-            quiz_id = db.cursor.fetchone()[0]
+            for start in range(0, len(quizzes), batch_size):
+                saved.extend(self._insert(db.cursor, quizzes[start : start + batch_size]))
+                db.conn.commit()
 
-            for question in quiz.questions:
-                db.cursor.execute(question_stmt, (quiz_id, question.text))
-                question_id = db.cursor.fetchone()[0]
+        return saved
 
-                for i, option in enumerate(question.options):
-                    is_correct = question.correct_answer_index == i
-                    db.cursor.execute(options_stmt, (question_id, option, is_correct))
+    @offload
+    def create_placeholder(self, prompt: str) -> str:
+        """Saves a quiz with no questions that is marked as generating and returns its id.
+        Questions are added with append_questions as they are generated."""
+        stmt = """INSERT INTO quizzes (prompt, generating, expires_at)
+                  VALUES (%s, TRUE, NOW() + make_interval(secs => %s))
+                  RETURNING id;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (prompt, self.ttl))
+            quiz_id = db.cursor.fetchone()[0]
+            db.conn.commit()
+
+        return quiz_id
 
+    @offload
+    def append_questions(self, quiz_id: str, questions: list[Question]) -> list[Question]:
+        """Adds the questions to the end of an existing quiz and returns them with their ids set"""
+        with DBSession(self.database) as db:
+            saved = self._insert_questions(db.cursor, [(quiz_id, q) for q in questions])
             db.conn.commit()
 
-        quiz = self.get(quiz_id)
-        return quiz
+        self._invalidate(quiz_id)
 
-    def get(self, quiz_id: str) -> Quiz | None:
-        stmt = """SELECT 
-                q.prompt quiz_prompt,
-                qu.id question_id,
-                qu.text question_text,
-                qu.answered_correct question_answered_correct,
-                o.id option_id,
-                o.text option_text,
-                o.correct option_correct
-            FROM quizzes q
-            JOIN questions qu on q.id = qu.quiz_id
-            JOIN options o ON qu.id = o.question_id
-            WHERE q.id = %s
-            ORDER BY q.id, qu.id;"""
+        return saved
 
-        results = []
-        with DBSession(self.database, cursor_factory=psycopg2.extras.RealDictCursor) as db:
+    @offload
+    def finish_generating(self, quiz_id: str):
+        stmt = "UPDATE quizzes SET generating = FALSE WHERE id = %s;"
+
+        with DBSession(self.database) as db:
             db.cursor.execute(stmt, (quiz_id,))
-            results = db.cursor.fetchall()
+            db.conn.commit()
 
-        if not results:
+        self._invalidate(quiz_id)
+
+    @offload
+    def create_pooled(self, quiz: Quiz, topic: str, num_questions: int) -> Quiz:
+        """Saves the quiz and adds it to the pool of pre-generated quizzes for the topic. Pooled
+        quizzes do not expire until they are claimed."""
+        pool_stmt = "INSERT INTO quiz_pool (quiz_id, topic, num_questions) VALUES (%s, %s, %s);"
+
+        with DBSession(self.database) as db:
+            saved = self._insert(db.cursor, [quiz], expires=False)[0]
+            db.cursor.execute(pool_stmt, (saved.id, topic, num_questions))
+            db.conn.commit()
+
+        return saved
+
+    @offload
+    def claim_pooled(self, topic: str, num_questions: int, prompt: str) -> str | None:
+        """Removes a pre-generated quiz for the topic from the pool and returns its id, or None if
+        the pool is empty. The quiz is given the prompt and treated as created now, so it expires
+        after the ttl from now. Rows locked by a concurrent claim are skipped, so each pooled quiz
+        is handed out exactly once."""
+        stmt = """WITH claimed AS (
+                    DELETE FROM quiz_pool
+                    WHERE quiz_id = (
+                        SELECT quiz_id FROM quiz_pool
+                        WHERE topic = %s AND num_questions = %s
+                        ORDER BY created_at
+                        LIMIT 1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING quiz_id
+                  )
+                  UPDATE quizzes
+                  SET prompt = %s, created_at = NOW(), expires_at = NOW() + make_interval(secs => %s)
+                  FROM claimed
+                  WHERE quizzes.id = claimed.quiz_id
+                  RETURNING quizzes.id;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (topic, num_questions, prompt, self.ttl))
+            result = db.cursor.fetchone()
+            db.conn.commit()
+
+        if not result:
             return None
 
-        quiz_prompt = ""
-        rows_by_question_id = dict()
-        for row in results:
-            if not quiz_prompt:
-                quiz_prompt = row["quiz_prompt"]
-
-            if row["question_id"] not in rows_by_question_id:
-                rows_by_question_id[row["question_id"]] = []
-
-            rows_by_question_id[row["question_id"]].append(row)
-
-        questions: list[Question] = []
-        for question_id, option_rows in rows_by_question_id.items():
-            options = [
-                dict(text=x["option_text"], correct=x["option_correct"]) for x in option_rows
-            ]
-
-            correct_answer_index = 0
-            for i, option in enumerate(options):
-                if option["correct"]:
-                    correct_answer_index = i
-                    break
-
-            q = Question(
-                id=question_id,
-                text=option_rows[0]["question_text"],
-                options=[option["text"] for option in options],
-                correct_answer=options[correct_answer_index]["text"],
-                correct_answer_index=correct_answer_index,
-                answered_correct=rows_by_question_id[question_id][0]["question_answered_correct"],
+        self._invalidate(result[0])
+        return result[0]
+
+    def _insert(self, cursor, quizzes: list[Quiz], expires: bool = True) -> list[Quiz]:
+        """Inserts the quizzes, their questions and their options with one statement per table."""
+        if not quizzes:
+            return []
+
+        quiz_stmt = "INSERT INTO quizzes (prompt, expires_at) VALUES %s RETURNING id;"
+        ttl = self.ttl if expires else None
+
+        quiz_rows = psycopg2.extras.execute_values(
+            cursor,
+            quiz_stmt,
+            [(quiz.prompt, ttl) for quiz in quizzes],
+            template="(%s, NOW() + make_interval(secs => %s))",
+            page_size=len(quizzes),
+            fetch=True,
+        )
+        quiz_ids = [row[0] for row in quiz_rows]
+
+        saved_questions = iter(
+            self._insert_questions(
+                cursor,
+                [(quiz_id, q) for quiz_id, quiz in zip(quiz_ids, quizzes) for q in quiz.questions],
             )
+        )
 
-            questions.append(q)
+        return [
+            Quiz(
+                id=quiz_id,
+                prompt=quiz.prompt,
+                questions=[next(saved_questions) for _ in quiz.questions],
+            )
+            for quiz_id, quiz in zip(quiz_ids, quizzes)
+        ]
+
+    def _insert_questions(
+        self, cursor, quiz_questions: list[tuple[str, Question]]
+    ) -> list[Question]:
+        """Inserts the (quiz id, question) pairs and their options with one statement per table.
+        The ids returned by each multi-row insert are in the same order as the values given.
+        In the compact layout the options are stored on the questions instead."""
+        if not quiz_questions:
+            return []
+
+        compact = self.database.config.compact_options
+        question_stmt = (
+            "INSERT INTO questions (quiz_id, text, correct_index, options) VALUES %s RETURNING id;"
+        )
+        options_stmt = "INSERT INTO options (question_id, text, correct) VALUES %s;"
+
+        question_rows = psycopg2.extras.execute_values(
+            cursor,
+            question_stmt,
+            [
+                (quiz_id, q.text, q.correct_answer_index, q.options if compact else None)
+                for quiz_id, q in quiz_questions
+            ],
+            page_size=len(quiz_questions),
+            fetch=True,
+        )
+
+        saved: list[Question] = []
+        option_values = []
+        for (question_id,), (_, question) in zip(question_rows, quiz_questions):
+            if not compact:
+                for i, option in enumerate(question.options):
+                    option_values.append((question_id, option, question.correct_answer_index == i))
 
-        return Quiz(id=quiz_id, prompt=quiz_prompt, questions=questions)
+            saved.append(question.model_copy(update=dict(id=question_id, answered_correct=None)))
 
-    def answer(self, quiz_id: str, question_id: int, option_index: int) -> bool:
-        option_stmt = "SELECT correct FROM options WHERE question_id = %s ORDER BY id;"
-        update_stmt = "UPDATE questions SET answered_correct = %s WHERE quiz_id = %s AND id = %s;"
+        if option_values:
+            psycopg2.extras.execute_values(cursor, options_stmt, option_values, page_size=1000)
+        return saved
 
+    def export_quizzes(self, itersize: int = 10_000) -> Iterator[dict]:
+        """Yields every finished quiz as a dict in the shape of a Quiz without ids. The rows are
+        read through a server side cursor, itersize at a time, so memory use does not grow with
+        the number of quizzes. Blocking, so meant for scripts rather than request handlers."""
         with DBSession(self.database) as db:
-            # Determine if the correct answer was selected
-            db.cursor.execute(option_stmt, (question_id,))
-            options = [x[0] for x in db.cursor.fetchall()]
-            correct_index = options.index(True)
+            cursor = db.conn.cursor(name="quiz_export")
+            cursor.itersize = itersize
+            cursor = InstrumentedCursor(cursor)
+            cursor.execute(export_stmt)
+
+            quiz = None
+            current_id = None
+            for quiz_id, prompt, _, text, correct_index, options in cursor:
+                if quiz_id != current_id:
+                    if quiz is not None:
+                        yield quiz
+                    quiz = dict(prompt=prompt, questions=[])
+                    current_id = quiz_id
+                if not options or not 0 <= correct_index < len(options):
+                    continue
+
+                quiz["questions"].append(
+                    dict(
+                        text=text,
+                        options=options,
+                        correct_answer=options[correct_index],
+                        correct_answer_index=correct_index,
+                    )
+                )
+
+            if quiz is not None:
+                yield quiz
+
+            cursor.close()
+            db.conn.commit()
 
-            # Persist if the answer was correct or not
-            is_correct = option_index == correct_index
-            db.cursor.execute(update_stmt, (is_correct, quiz_id, question_id))
+    def export_copy(self, file: IO[bytes]):
+        """Writes every finished quiz to the file in PostgreSQL's binary COPY format, one row for
+        each question, which import_copy reloads without parsing each quiz in Python. The rows are
+        streamed to the file as the database produces them."""
+        with DBSession(self.database) as db:
+            db.cursor.copy_expert(f"COPY ({export_stmt}) TO STDOUT (FORMAT binary);", file)
+            db.conn.commit()
+
+    def import_quizzes(self, quizzes: Iterable[Quiz], batch_size: int = 1000) -> ImportResult:
+        """Saves the quizzes, which are expected to have been validated, as new quizzes. Each
+        batch of batch_size quizzes is copied into a staging table with COPY and moved into the
+        quiz tables in a single statement, then committed. Blocking, so meant for scripts."""
+        result = ImportResult()
+        with DBSession(self.database) as db:
+            db.cursor.execute(staging_stmt)
             db.conn.commit()
 
-            return is_correct
+            buffer = io.StringIO()
+            # Every field is quoted, as COPY reads an unquoted empty field as NULL rather than ''
+            writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+            count = 0
+            for quiz in quizzes:
+                key = str(uuid.uuid4())
+                for position, q in enumerate(quiz.questions):
+                    row = (key, quiz.prompt, position, q.text, q.correct_answer_index)
+                    writer.writerow(row + (_array_literal(q.options),))
+
+                count += 1
+                if count == batch_size:
+                    result.add(self._copy_staged(db, buffer))
+                    buffer.seek(0)
+                    buffer.truncate()
+                    count = 0
+
+            if count:
+                result.add(self._copy_staged(db, buffer))
+
+        return result
+
+    def import_copy(self, file: IO[bytes]) -> ImportResult:
+        """Saves the quizzes in a file written by export_copy as new quizzes, in one transaction.
+        The rows are not parsed in Python, so questions with an invalid correct index or too few
+        options are rejected by the statement moving them into the quiz tables instead."""
+        with DBSession(self.database) as db:
+            db.cursor.execute(staging_stmt)
+            db.cursor.copy_expert("COPY import_questions FROM STDIN (FORMAT binary);", file)
+            return self._move_staged(db)
+
+    def _copy_staged(self, db, buffer: io.StringIO) -> ImportResult:
+        buffer.seek(0)
+        db.cursor.copy_expert("COPY import_questions FROM STDIN (FORMAT csv);", buffer)
+        return self._move_staged(db)
+
+    def _move_staged(self, db) -> ImportResult:
+        params = dict(compact=self.database.config.compact_options, ttl=self.ttl)
+        db.cursor.execute(move_staged_stmt, params)
+        quizzes, questions, rejected = db.cursor.fetchone()
+        db.conn.commit()
+        return ImportResult(quizzes, questions, rejected)
+
+    @offload
+    def delete_expired(self, limit: int = 500) -> tuple[int, int]:
+        """Deletes up to limit of the quizzes that have expired, oldest first, together with their
+        questions, options, attempts and answers through the cascading foreign keys. Returns the
+        number of quizzes and questions deleted. Quizzes locked by another reaper are skipped."""
+        stmt = """WITH expired AS (
+                    SELECT id FROM quizzes
+                    WHERE expires_at < NOW()
+                    ORDER BY expires_at
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                  ),
+                  deleted AS (
+                    DELETE FROM quizzes q USING expired WHERE q.id = expired.id RETURNING q.id
+                  )
+                  SELECT
+                    ARRAY(SELECT id::text FROM deleted),
+                    (SELECT COUNT(*) FROM questions WHERE quiz_id IN (SELECT id FROM deleted));"""
 
-    def get_results(self, quiz_id) -> QuizResults:
-        stmt = """SELECT
-                    COUNT(q.id) AS count,
-                    SUM(CASE WHEN qu.answered_correct IS NOT NULL THEN 1 ELSE 0 END) AS answered,
-                    SUM(CASE WHEN qu.answered_correct THEN 1 ELSE 0 END) AS correct
-                  FROM quizzes q
-                  JOIN questions qu ON q.id = qu.quiz_id
-                  WHERE q.id = %s;"""
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (limit,))
+            quiz_ids, questions = db.cursor.fetchone()
+            db.conn.commit()
+
+        for quiz_id in quiz_ids:
+            self._invalidate(quiz_id)
+        return len(quiz_ids), questions
+
+    @offload
+    def set_missing_expiry(self, limit: int = 500) -> int:
+        """Gives up to limit of the quizzes with no expiry, other than those in the pool, an
+        expiry of the ttl after they were created. Returns the number of quizzes updated."""
+        stmt = """WITH batch AS (
+                    SELECT id FROM quizzes q
+                    WHERE expires_at IS NULL
+                        AND NOT EXISTS (SELECT 1 FROM quiz_pool p WHERE p.quiz_id = q.id)
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                  )
+                  UPDATE quizzes q
+                  SET expires_at = q.created_at + make_interval(secs => %s)
+                  FROM batch
+                  WHERE q.id = batch.id;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (limit, self.ttl))
+            updated = db.cursor.rowcount
+            db.conn.commit()
+
+        return updated
+
+    @offload
+    def get(self, quiz_id: str) -> Quiz | None:
+        """Returns the content of the quiz, without the answers of any attempt."""
+        return self._get(quiz_id)
+
+    @offload
+    def start_attempt(self, quiz_id: str) -> str | None:
+        """Starts a new attempt at the quiz and returns its id, or None if the quiz does not
+        exist. Every attempt keeps its own answers, so any number of people can take a quiz."""
+        stmt = """INSERT INTO attempts (quiz_id)
+                  SELECT id FROM quizzes WHERE id = %s
+                  RETURNING id;"""
 
         with DBSession(self.database) as db:
             db.cursor.execute(stmt, (quiz_id,))
-            counts = db.cursor.fetchone()
-            # return dict(question_count=counts[0], correct_count=counts[1])
-            return QuizResults(count=counts[0], answered=counts[1], correct=counts[2])
+            row = db.cursor.fetchone()
+            db.conn.commit()
+
+        return str(row[0]) if row else None
+
+    @offload
+    def get_with_progress(self, quiz_id: str, attempt_id: str) -> QuizView | None:
+        """Returns the quiz along with the current question and results of the attempt. Returns
+        None if the quiz does not exist or the attempt is not an attempt at the quiz."""
+        return self._get_view(quiz_id, attempt_id)
+
+    def _get_view(self, quiz_id: str, attempt_id: str) -> QuizView | None:
+        progress = self._get_progress(quiz_id, attempt_id)
+        if not progress:
+            return None
+
+        quiz = self._get(quiz_id, progress)
+        if quiz is None:
+            return None
 
-    def get_current_question(self, quiz_id: str) -> Question | None:
+        answers = {row[1]: row[2] for row in progress}
+        if self.answers is not None:
+            # Answers waiting to be written, unless the question was answered before
+            for question_id, correct in self.answers.answers(attempt_id).items():
+                if answers.get(question_id) is None:
+                    answers[question_id] = correct
+
+        return QuizView(quiz, answers, attempt_id)
+
+    def _get(
+        self, quiz_id: str, progress: list[tuple[bool, int, bool | None]] = None
+    ) -> Quiz | None:
+        """Returns the content of the quiz, taking it from the cache when possible. Cached
+        content is only used if it matches the questions in the progress rows, if given."""
+        if self.cache is None:
+            return self._load(quiz_id)
+
+        content = self.cache.get(quiz_id)
+        if content is not None:
+            if progress is None:
+                return content
+
+            generating = progress[0][0]
+            question_ids = [row[1] for row in progress]
+            if not generating and question_ids == [q.id for q in content.questions]:
+                return content
+
+            # The content has changed since it was cached
+            self._invalidate(quiz_id)
+
+        quiz = self._load(quiz_id)
+        if quiz is not None and not quiz.generating:
+            self.cache.put(quiz)
+        return quiz
+
+    @offload
+    def get_progress_version(self, quiz_id: str, attempt_id: str) -> tuple[int, int, bool] | None:
+        """Returns the number of questions in the quiz, the number answered in the attempt and
+        whether the quiz is generating, which together identify the progress of the attempt as the
+        content of a quiz only changes by adding questions and answers are never changed. They are
+        read from the indexes without loading the quiz. Returns None if the attempt is not an
+        attempt at the quiz."""
         stmt = """SELECT
-        	q.id AS quiz_id,
-        	qu.id AS question_id,
-        	qu.text
-        FROM quizzes q
-        JOIN questions qu ON q.id = qu.quiz_id
-        WHERE q.id = %s
-        	AND qu.answered_correct IS NULL
-        ORDER BY qu.id
-        LIMIT 1;"""
+                    (SELECT COUNT(*) FROM questions qu WHERE qu.quiz_id = a.quiz_id),
+                    (SELECT COUNT(*) FROM answers an WHERE an.attempt_id = a.id),
+                    q.generating
+                  FROM attempts a
+                  JOIN quizzes q ON q.id = a.quiz_id
+                  WHERE a.id = %s AND a.quiz_id = %s;"""
 
         with DBSession(self.database) as db:
-            db.cursor.execute(stmt, (quiz_id,))
+            db.cursor.execute(stmt, (attempt_id, quiz_id))
             result = db.cursor.fetchone()
-            if not result:
-                return None
-            return Question(
-                id=result[1], text=result[2], options=[], correct_answer="", correct_answer_index=-1
+
+        if not result:
+            return None
+
+        questions, answered, generating = result
+        if self.answers is not None:
+            # Buffered answers are not yet in the table, but are seen by the reads of the attempt
+            answered += len(self.answers.answers(attempt_id))
+        return questions, answered, generating
+
+    def _get_progress(self, quiz_id: str, attempt_id: str) -> list[tuple[bool, int, bool | None]]:
+        """Returns a (quiz generating, question id, answered correct) row for each question, with
+        the answers of the attempt. Returns no rows if the attempt is not an attempt at the quiz."""
+        stmt = """SELECT q.generating, qu.id, an.correct
+                  FROM attempts a
+                  JOIN quizzes q ON q.id = a.quiz_id
+                  JOIN questions qu ON qu.quiz_id = q.id
+                  LEFT JOIN answers an ON an.attempt_id = a.id AND an.question_id = qu.id
+                  WHERE a.id = %s AND a.quiz_id = %s
+                  ORDER BY qu.id;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (attempt_id, quiz_id))
+            return db.cursor.fetchall()
+
+    def _invalidate(self, quiz_id: str):
+        if self.cache is not None:
+            self.cache.invalidate(quiz_id)
+
+    def _load(self, quiz_id: str) -> Quiz | None:
+        stmt = """SELECT
+                q.prompt,
+                q.generating,
+                qu.id,
+                qu.text,
+                qu.correct_index,
+                qu.options,
+                o.text,
+                o.correct
+            FROM quizzes q
+            JOIN questions qu on q.id = qu.quiz_id
+            LEFT JOIN options o ON qu.id = o.question_id AND qu.options IS NULL
+            WHERE q.id = %s
+            ORDER BY q.id, qu.id, o.id;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (quiz_id,))
+            rows = db.cursor.fetchall()
+
+        if not rows:
+            return None
+
+        with timed("assemble"):
+            return self._assemble_quiz(quiz_id, rows)
+
+    @staticmethod
+    def _assemble_quiz(quiz_id: str, rows: list[tuple]) -> Quiz:
+        """Builds the quiz from the rows of the query in _load, one for each option, or one for
+        each question in the compact layout. The rows are ordered by question so they are grouped
+        in a single pass into plain dicts, which are validated into the models in one call as that
+        is quicker than constructing each model."""
+        questions: list[dict] = []
+        correct_flags: list[list[bool]] = []
+        for _, _, question_id, text, correct_index, compact_options, option, correct in rows:
+            if not questions or questions[-1]["id"] != question_id:
+                questions.append(
+                    dict(
+                        id=question_id,
+                        text=text,
+                        options=compact_options if compact_options is not None else [],
+                        correct_answer_index=correct_index,
+                    )
+                )
+                correct_flags.append([])
+                if compact_options is not None:
+                    continue
+
+            questions[-1]["options"].append(option)
+            correct_flags[-1].append(correct)
+
+        for question, flags in zip(questions, correct_flags):
+            if question["correct_answer_index"] is None:
+                # Saved before correct_index was stored
+                question["correct_answer_index"] = flags.index(True) if True in flags else 0
+            question["correct_answer"] = question["options"][question["correct_answer_index"]]
+
+        return Quiz.model_validate(
+            dict(id=quiz_id, prompt=rows[0][0], generating=rows[0][1], questions=questions)
+        )
+
+    async def submit(
+        self, quiz_id: str, attempt_id: str, question_id: int, option_index: int
+    ) -> SubmitResult | None:
+        """Records the answer for the attempt and returns the outcome, the updated results and
+        the question that follows it. A question that has already been answered keeps its first
+        answer. Returns None if the attempt is not an attempt at the quiz or the question is not
+        part of it.
+
+        With an answer buffer the answer is buffered to be written later rather than committed,
+        waiting first while the buffer is full."""
+        if self.answers is None:
+            return await self._submit(quiz_id, attempt_id, question_id, option_index)
+
+        await self.answers.wait_for_space()
+        return await self._submit_buffered(quiz_id, attempt_id, question_id, option_index)
+
+    @offload
+    def _submit_buffered(
+        self, quiz_id: str, attempt_id: str, question_id: int, option_index: int
+    ) -> SubmitResult | None:
+        view = self._get_view(quiz_id, attempt_id)
+        if view is None:
+            return None
+
+        quiz = view.quiz
+        try:
+            index = quiz.get_question_index(question_id)
+        except ValueError:
+            return None
+
+        question = quiz.questions[index]
+        answered_correct = view.answers.get(question_id)
+        if answered_correct is None:
+            answered_correct = self.answers.add(
+                attempt_id, question_id, question.correct_answer_index == option_index
             )
 
+        answers = dict(view.answers)
+        answers[question_id] = answered_correct
+        next_question = quiz.questions[index + 1] if index + 1 < len(quiz) else None
+
+        return SubmitResult(
+            answered_correct=answered_correct,
+            correct_answer=question.correct_answer,
+            results=QuizView(quiz, answers).results,
+            next_question=next_question,
+            next_question_number=index + 2,
+            generating=quiz.generating,
+        )
+
+    @offload
+    def _submit(
+        self, quiz_id: str, attempt_id: str, question_id: int, option_index: int
+    ) -> SubmitResult | None:
+        """Records the answer in a single statement that also returns the results and the next
+        question. Answers are only ever inserted, so attempts at the same quiz never contend on
+        the same rows."""
+        # The row inserted by the answered CTE is not visible to the rest of the statement,
+        # so the new answer is merged in when counting
+        stmt = """WITH answered AS (
+                    INSERT INTO answers (attempt_id, question_id, correct)
+                    SELECT a.id, qu.id, qu.correct_index = %(option)s
+                    FROM attempts a
+                    JOIN questions qu ON qu.quiz_id = a.quiz_id
+                    WHERE a.id = %(attempt_id)s
+                        AND a.quiz_id = %(quiz_id)s
+                        AND qu.id = %(question_id)s
+                    ON CONFLICT (attempt_id, question_id) DO UPDATE SET correct = answers.correct
+                    RETURNING question_id id, correct
+                  ), progress AS (
+                    SELECT
+                        COUNT(*) count,
+                        COUNT(*) FILTER (WHERE qu.id = a.id OR an.correct IS NOT NULL) answered,
+                        COUNT(*) FILTER (
+                            WHERE CASE WHEN qu.id = a.id THEN a.correct ELSE an.correct END
+                        ) correct,
+                        COUNT(*) FILTER (WHERE qu.id <= a.id) answered_position,
+                        MIN(qu.id) FILTER (WHERE qu.id > a.id) next_question_id
+                    FROM answered a
+                    JOIN questions qu ON qu.quiz_id = %(quiz_id)s
+                    LEFT JOIN answers an
+                        ON an.attempt_id = %(attempt_id)s AND an.question_id = qu.id
+                    GROUP BY a.id, a.correct
+                  )
+                  SELECT
+                    a.correct,
+                    COALESCE(
+                        aq.options[aq.correct_index + 1],
+                        (SELECT o.text FROM options o
+                            WHERE o.question_id = a.id AND o.correct ORDER BY o.id LIMIT 1)
+                    ),
+                    p.count,
+                    p.answered,
+                    p.correct,
+                    p.answered_position,
+                    q.generating,
+                    nq.id,
+                    nq.text,
+                    nq.correct_index,
+                    COALESCE(
+                        nq.options,
+                        ARRAY(SELECT o.text FROM options o WHERE o.question_id = nq.id ORDER BY o.id)
+                    )
+                  FROM answered a
+                  JOIN questions aq ON aq.id = a.id
+                  JOIN progress p ON TRUE
+                  JOIN quizzes q ON q.id = %(quiz_id)s
+                  LEFT JOIN questions nq ON nq.id = p.next_question_id;"""
+
+        params = dict(
+            quiz_id=quiz_id, attempt_id=attempt_id, question_id=question_id, option=option_index
+        )
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, params)
+            row = db.cursor.fetchone()
+            db.conn.commit()
+
+        if not row:
+            return None
+
+        (
+            answered_correct,
+            correct_answer,
+            count,
+            answered,
+            correct,
+            answered_position,
+            generating,
+            next_id,
+            next_text,
+            next_correct_index,
+            next_options,
+        ) = row
+
+        next_question = None
+        if next_id is not None:
+            next_question = Question(
+                id=next_id,
+                text=next_text,
+                options=next_options,
+                correct_answer=next_options[next_correct_index],
+                correct_answer_index=next_correct_index,
+            )
+
+        return SubmitResult(
+            answered_correct=bool(answered_correct),
+            correct_answer=correct_answer,
+            results=QuizResults(count=count, answered=answered, correct=correct),
+            next_question=next_question,
+            next_question_number=answered_position + 1,
+            generating=generating,
+        )
+
+    @offload
+    def get_results(self, quiz_id: str, attempt_id: str) -> QuizResults:
+        if self.answers is not None and self.answers.answers(attempt_id):
+            view = self._get_view(quiz_id, attempt_id)
+            if view is not None:
+                return view.results
+
+        stmt = """SELECT
+                    COUNT(qu.id) AS count,
+                    COUNT(an.correct) AS answered,
+                    COUNT(*) FILTER (WHERE an.correct) AS correct
+                  FROM questions qu
+                  LEFT JOIN answers an ON an.attempt_id = %s AND an.question_id = qu.id
+                  WHERE qu.quiz_id = %s;"""
+
+        with DBSession(self.database) as db:
+            db.cursor.execute(stmt, (attempt_id, quiz_id))
+            counts = db.cursor.fetchone()
+            return QuizResults(count=counts[0], answered=counts[1], correct=counts[2])
+
 
 if __name__ == "__main__":
     q1 = Question(
@@ -169,5 +889,5 @@ if __name__ == "__main__":
 
     __db = Database.default(create_tables=True)
     repo = QuizRepo(__db)
-    identifier = repo.create(test_quiz)
+    identifier = asyncio.run(repo.create(test_quiz))
     print(identifier, type(identifier))
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+
+from dotenv import load_dotenv
+
+from persistance.database import Database
+from persistance.generation_cache_repo import GenerationCacheRepo
+from persistance.generation_job_repo import GenerationJobRepo
+from persistance.quiz_repo import QuizRepo
+from quiz_builder import QuizBuilder, normalize_topic
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTarget:
+    def __init__(self, topic: str, num_questions: int, size: int):
+        self.topic = normalize_topic(topic)
+        self.num_questions = num_questions
+        self.size = size
+
+    @classmethod
+    def parse(cls, spec: str, size: int) -> list["PoolTarget"]:
+        """Parses a comma separated list of topic:num_questions pairs, e.g. "history:10,maths:5"."""
+        targets = []
+        for item in spec.split(","):
+            if not item.strip():
+                continue
+            topic, _, num_questions = item.rpartition(":")
+            targets.append(cls(topic, int(num_questions), size))
+
+        return targets
+
+
+class PoolWorker:
+    """Keeps a pool of pre-generated quizzes topped up for popular topics so that creating one of
+    those quizzes is a database claim rather than a call to the language model."""
+
+    def __init__(
+        self,
+        job_repo: GenerationJobRepo,
+        quiz_repo: QuizRepo,
+        builder: QuizBuilder,
+        targets: list[PoolTarget],
+        interval: float = 5.0,
+    ):
+        self.job_repo = job_repo
+        self.quiz_repo = quiz_repo
+        self.builder = builder
+        self.targets = targets
+        self.interval = interval
+
+    @classmethod
+    def default(cls, database: Database, builder: QuizBuilder):
+        load_dotenv()
+        targets = PoolTarget.parse(
+            os.getenv("QUIZ_POOL_TOPICS", ""), int(os.getenv("QUIZ_POOL_SIZE", 5))
+        )
+        return cls(
+            GenerationJobRepo(
+                database,
+                max_failures=int(os.getenv("QUIZ_POOL_MAX_FAILURES", 3)),
+                failure_window=float(os.getenv("QUIZ_POOL_FAILURE_WINDOW", 3600)),
+            ),
+            QuizRepo(database),
+            builder,
+            targets,
+            interval=float(os.getenv("QUIZ_POOL_INTERVAL", 5.0)),
+        )
+
+    async def run_once(self) -> bool:
+        """Queues jobs for any pools below their target and runs the next job.
+        Returns False if there was no job to run."""
+        for target in self.targets:
+            await self.job_repo.top_up(target.topic, target.num_questions, target.size)
+
+        job = await self.job_repo.claim()
+        if job is None:
+            return False
+
+        try:
+            quiz = await self.builder.make_quiz(job.topic, job.num_questions, use_cache=False)
+            await self.quiz_repo.create_pooled(quiz, job.topic, job.num_questions)
+        except Exception:
+            logger.exception("Could not generate a pooled quiz about %r", job.topic)
+            await self.job_repo.fail(job.id)
+        else:
+            await self.job_repo.complete(job.id)
+
+        return True
+
+    async def run(self):
+        """Runs jobs until cancelled, sleeping for the interval whenever the queue is empty."""
+        while True:
+            try:
+                ran_job = await self.run_once()
+            except Exception:
+                logger.exception("The quiz pool worker failed")
+                ran_job = False
+
+            if not ran_job:
+                await asyncio.sleep(self.interval)
+
+
+async def main():
+    logging.basicConfig(level=logging.INFO)
+    database = Database.default()
+    database.open()
+    builder = QuizBuilder.default(shared_cache=GenerationCacheRepo(database))
+
+    try:
+        await PoolWorker.default(database, builder).run()
+    finally:
+        await builder.close()
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,4 @@
+from quiz_builder.builder import QuizBuilder, QuizGenerationError, normalize_topic
+from quiz_builder.clients import Completion, LLMClient, OpenAIClient, FakeLLMClient
+from quiz_builder.cache import GenerationCache, GenerationCacheStore
+from quiz_builder.validation import QuizOutputError, QuizValidator
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+import random
+from typing import AsyncIterator, Callable
+
+from dotenv import load_dotenv
+
+from instrumentation import (
+    llm_output_problems,
+    llm_seconds,
+    llm_tokens,
+    quiz_generation_seconds,
+    timed,
+)
+from models import Question, Quiz
+from quiz_builder.cache import GenerationCache, GenerationCacheStore, cache_key
+from quiz_builder.chunking import chunk_topic, dedupe_questions, split_chunks
+from quiz_builder.clients import Completion, LLMClient, OpenAIClient, FakeLLMClient
+from quiz_builder.streaming import QuestionStreamParser
+from quiz_builder.validation import QuizValidator
+
+logger = logging.getLogger(__name__)
+
+prompt = """You are a  quiz master. You will be provided with a topic followed by a | character and then the number of questions required. Produce a quiz consisting of the given number of questions, each with 4 possible answers. Only one of the answers should be correct. The response should be in JSON format. The response should only include the JSON.
+
+The json should have the following format:
+
+{
+  "prompt": "the original quiz prompt",
+  "questions": [
+    {
+      "text": "",
+      "options": [
+        "option1",
+        "option2",
+        "option3",
+        "option4"
+      ],
+      "correct_answer": "option2",
+      "correct_answer_index": 1
+    }
+  ]
+}"""
+
+
+class QuizGenerationError(Exception):
+    """Raised when a quiz could not be generated after all retries."""
+
+
+def normalize_topic(topic: str) -> str:
+    return " ".join(topic.lower().split())
+
+
+class QuizBuilder:
+    """Generates quizzes using a language model. A single builder is intended to be shared by
+    every request in the process."""
+
+    def __init__(
+        self,
+        client: LLMClient,
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 1.0,
+        timeout: float = 60.0,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        max_concurrency: int = 8,
+        chunk_size: int = 10,
+        cache: GenerationCache = None,
+        on_usage: Callable[[str, Completion], None] = None,
+    ):
+        self.client = client
+        self.model = model
+        self.temperature = temperature
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.cache = cache
+        self.on_usage = on_usage
+        self.validator = QuizValidator(metric=llm_output_problems)
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    @classmethod
+    def default(
+        cls,
+        shared_cache: GenerationCacheStore = None,
+        on_usage: Callable[[str, Completion], None] = None,
+    ):
+        load_dotenv()
+        # QUIZ_LLM_BACKEND=fake generates quizzes locally so the app can be run offline
+        if os.getenv("QUIZ_LLM_BACKEND") == "fake":
+            client = FakeLLMClient()
+        else:
+            client = OpenAIClient(os.getenv("OPENAI_API_KEY"))
+
+        cache = GenerationCache(
+            max_entries=int(os.getenv("QUIZ_CACHE_SIZE", 1024)),
+            ttl=float(os.getenv("QUIZ_CACHE_TTL", 3600)),
+            shared=shared_cache,
+        )
+
+        return cls(
+            client,
+            model=os.getenv("QUIZ_LLM_MODEL", "gpt-3.5-turbo"),
+            temperature=float(os.getenv("QUIZ_LLM_TEMPERATURE", 1.0)),
+            max_concurrency=int(os.getenv("QUIZ_LLM_CONCURRENCY", 8)),
+            chunk_size=int(os.getenv("QUIZ_LLM_CHUNK_SIZE", 10)),
+            cache=cache,
+            on_usage=on_usage,
+        )
+
+    async def make_quiz(self, topic: str, num_questions: int = 10, use_cache: bool = True) -> Quiz:
+        """Generates a quiz on the topic. Concurrent calls for the same topic and number of
+        questions share a single request to the language model. If use_cache is False a cached
+        quiz is never returned, though the newly generated quiz is still cached."""
+        with timed("generate", quiz_generation_seconds):
+            return await self._make_quiz(topic, num_questions, use_cache)
+
+    async def _make_quiz(self, topic: str, num_questions: int, use_cache: bool) -> Quiz:
+        key = self._cache_key(topic, num_questions)
+        if use_cache:
+            quiz = await self.get_cached(topic, num_questions)
+            if quiz is not None:
+                return quiz
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._generate_and_cache(key, topic, num_questions))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # Shielded so a cancelled caller does not cancel the request for everyone else
+        return await asyncio.shield(task)
+
+    async def _generate_and_cache(self, key: str, topic: str, num_questions: int) -> Quiz:
+        quiz = await self._generate(topic, num_questions)
+        if self.cache is not None:
+            await self.cache.put(key, quiz)
+        return quiz
+
+    async def get_cached(self, topic: str, num_questions: int = 10) -> Quiz | None:
+        """Returns a previously generated quiz for the topic if one is cached."""
+        if self.cache is None:
+            return None
+        return await self.cache.get(self._cache_key(topic, num_questions))
+
+    def _cache_key(self, topic: str, num_questions: int) -> str:
+        return cache_key(normalize_topic(topic), num_questions, self.model, prompt)
+
+    async def stream_quiz(self, topic: str, num_questions: int = 10) -> AsyncIterator[Question]:
+        """Generates a quiz on the topic, yielding each question as soon as it has been produced.
+        The timeout applies to the wait for each chunk rather than to the whole completion, and
+        requests are not retried or coalesced. The complete quiz is added to the cache."""
+        questions: list[Question] = []
+        parser = QuestionStreamParser(self.validator)
+        usage = Completion("")
+
+        messages = self._messages(topic, num_questions)
+        async with self._semaphore:
+            with timed("llm", llm_seconds, mode="stream"):
+                stream = aiter(self.client.stream(messages, self.model, self.temperature))
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(anext(stream), self.timeout)
+                    except StopAsyncIteration:
+                        break
+                    except Exception as e:
+                        raise QuizGenerationError(f"Could not generate a quiz about {topic}") from e
+
+                    usage.prompt_tokens += chunk.prompt_tokens
+                    usage.completion_tokens += chunk.completion_tokens
+                    for question in parser.feed(chunk.content):
+                        questions.append(question)
+                        yield question
+
+        self._record_usage(topic, usage)
+        if self.cache is not None and questions:
+            quiz = Quiz(prompt=topic, questions=questions)
+            await self.cache.put(self._cache_key(topic, num_questions), quiz)
+
+    @staticmethod
+    def _messages(topic: str, num_questions: int) -> list[dict]:
+        return [
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": f"{topic} | {num_questions}"},
+        ]
+
+    async def _generate(self, topic: str, num_questions: int) -> Quiz:
+        """Generates the quiz in concurrent chunks of at most chunk_size questions, so a large quiz
+        takes about as long as a small one and stays within the output limit of the model. Each
+        chunk is retried on its own. Questions that were invalid or repeated across chunks, and
+        those of chunks that still failed, are replaced by one further round of chunks."""
+        chunks = split_chunks(num_questions, self.chunk_size)
+        questions, errors = await self._generate_chunks(topic, chunks)
+        questions = dedupe_questions(questions)
+        if questions and len(questions) < num_questions:
+            # Later parts of the topic are hinted at so the replacements differ from the first round
+            missing = split_chunks(num_questions - len(questions), self.chunk_size)
+            more, more_errors = await self._generate_chunks(topic, missing, first=len(chunks))
+            questions = dedupe_questions(questions + more)
+            errors += more_errors
+
+        if not questions:
+            raise QuizGenerationError(f"Could not generate a quiz about {topic}") from (
+                errors[0] if errors else None
+            )
+        if len(questions) < num_questions:
+            logger.warning(
+                "Generated %d of %d questions about %s", len(questions), num_questions, topic
+            )
+
+        return Quiz(prompt=topic, questions=questions[:num_questions])
+
+    async def _generate_chunks(
+        self, topic: str, chunks: list[int], first: int = 0
+    ) -> tuple[list[Question], list[QuizGenerationError]]:
+        """Generates the chunks concurrently, limited by the semaphore, and returns the questions
+        of those that succeeded and the errors of those that did not."""
+        num_chunks = first + len(chunks)
+        results = await asyncio.gather(
+            *(
+                self._generate_chunk(topic, count, first + i, num_chunks)
+                for i, count in enumerate(chunks)
+            ),
+            return_exceptions=True,
+        )
+
+        questions: list[Question] = []
+        errors: list[QuizGenerationError] = []
+        for result in results:
+            if isinstance(result, QuizGenerationError):
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                questions += result
+
+        return questions, errors
+
+    async def _generate_chunk(
+        self, topic: str, num_questions: int, chunk: int = 0, num_chunks: int = 1
+    ) -> list[Question]:
+        messages = self._messages(chunk_topic(topic, chunk, num_chunks), num_questions)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self._semaphore:
+                    with timed("llm", llm_seconds, mode="complete"):
+                        completion = await asyncio.wait_for(
+                            self.client.complete(messages, self.model, self.temperature),
+                            self.timeout,
+                        )
+                self._record_usage(topic, completion)
+                return self.validator.parse(completion.content)
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise QuizGenerationError(f"Could not generate a quiz about {topic}") from e
+
+            delay = self.backoff * 2**attempt
+            await asyncio.sleep(delay + random.uniform(0, delay))
+
+    def _record_usage(self, topic: str, completion: Completion):
+        self.prompt_tokens += completion.prompt_tokens
+        self.completion_tokens += completion.completion_tokens
+        llm_tokens.inc(completion.prompt_tokens, kind="prompt")
+        llm_tokens.inc(completion.completion_tokens, kind="completion")
+        if self.on_usage is not None:
+            self.on_usage(topic, completion)
+
+    async def close(self):
+        await self.client.close()
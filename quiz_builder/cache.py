@@ -0,0 +1,81 @@
+import hashlib
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+from models import Quiz
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(topic: str, num_questions: int, model: str, system_prompt: str) -> str:
+    """Returns the key a generated quiz is cached under. The topic is expected to be normalized."""
+    prompt_hash = hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+    return f"{model}|{prompt_hash}|{num_questions}|{topic}"
+
+
+class GenerationCacheStore(ABC):
+    """The interface for a cache tier shared between processes, such as the database."""
+
+    @abstractmethod
+    async def get(self, key: str, max_age: float) -> Quiz | None:
+        """Returns the quiz stored under the key if it was stored within max_age seconds."""
+
+    @abstractmethod
+    async def put(self, key: str, quiz: Quiz):
+        pass
+
+
+class GenerationCache:
+    """Caches generated quizzes in a process local LRU, backed by an optional shared store."""
+
+    def __init__(
+        self, max_entries: int = 1024, ttl: float = 3600, shared: GenerationCacheStore = None
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: OrderedDict[str, tuple[float, Quiz]] = OrderedDict()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Quiz | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, quiz = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+                return quiz
+            del self._entries[key]
+
+        if self.shared is not None:
+            try:
+                quiz = await self.shared.get(key, self.ttl)
+            except Exception:
+                logger.exception("Could not read from the shared generation cache")
+                quiz = None
+
+            if quiz is not None:
+                self._put_local(key, quiz)
+                self.shared_hits += 1
+                return quiz
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, quiz: Quiz):
+        self._put_local(key, quiz)
+        if self.shared is not None:
+            try:
+                await self.shared.put(key, quiz)
+            except Exception:
+                logger.exception("Could not write to the shared generation cache")
+
+    def _put_local(self, key: str, quiz: Quiz):
+        self._entries[key] = (time.monotonic() + self.ttl, quiz)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,66 @@
+import re
+from difflib import SequenceMatcher
+
+from models import Question
+
+# Cycled through to steer each chunk of a large quiz towards a different part of the topic
+subtopic_hints = (
+    "the basics and key definitions",
+    "history and origins",
+    "notable people",
+    "facts and figures",
+    "important events",
+    "terminology",
+    "lesser known details",
+    "how it works",
+    "common misconceptions",
+    "recent developments",
+)
+
+
+def split_chunks(num_questions: int, chunk_size: int) -> list[int]:
+    """Splits the number of questions into chunks of at most chunk_size, as evenly as possible."""
+    num_chunks = max(1, -(-num_questions // chunk_size))
+    size, remainder = divmod(num_questions, num_chunks)
+    return [size + 1 if i < remainder else size for i in range(num_chunks)]
+
+
+def chunk_topic(topic: str, chunk: int, num_chunks: int) -> str:
+    """Returns the topic asked for by a chunk of a quiz, with a hint to keep it from repeating the
+    questions of the other chunks."""
+    if num_chunks == 1:
+        return topic
+    hint = subtopic_hints[chunk % len(subtopic_hints)]
+    return f"{topic} (part {chunk + 1} of {num_chunks}, focusing on {hint})"
+
+
+def normalize_question(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def dedupe_questions(questions: list[Question], threshold: float = 0.9) -> list[Question]:
+    """Returns the questions without those repeating an earlier question, which is one with the
+    same correct answer whose normalized text is at least threshold similar. Questions that are
+    worded alike but have different answers, such as those about different years, are kept."""
+    kept: list[Question] = []
+    seen: dict[str, list[str]] = {}
+    for question in questions:
+        text = normalize_question(question.text)
+        similar = seen.setdefault(normalize_question(question.correct_answer), [])
+        matcher = SequenceMatcher(None, "", text)
+        duplicate = False
+        for other in similar:
+            matcher.set_seq1(other)
+            if (
+                matcher.real_quick_ratio() >= threshold
+                and matcher.quick_ratio() >= threshold
+                and matcher.ratio() >= threshold
+            ):
+                duplicate = True
+                break
+
+        if not duplicate:
+            kept.append(question)
+            similar.append(text)
+
+    return kept
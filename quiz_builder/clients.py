@@ -0,0 +1,144 @@
+import asyncio
+import json
+import random
+from abc import ABC, abstractmethod
+from typing import AsyncIterator
+
+from openai import AsyncOpenAI
+
+
+class Completion:
+    def __init__(self, content: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.content = content
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class LLMClient(ABC):
+    """The interface QuizBuilder uses to request a chat completion from a language model."""
+
+    @abstractmethod
+    async def complete(self, messages: list[dict], model: str, temperature: float) -> Completion:
+        """Returns the completion for the given messages."""
+
+    @abstractmethod
+    def stream(
+        self, messages: list[dict], model: str, temperature: float
+    ) -> AsyncIterator[Completion]:
+        """Yields the completion for the given messages as it is produced. Token counts may be
+        reported on any chunk, including a final chunk with no content."""
+
+    async def close(self):
+        """Releases any connections held by the client."""
+
+
+class OpenAIClient(LLMClient):
+    def __init__(self, api_key: str):
+        # The client holds a keep-alive connection pool, so one is kept for the life of the process.
+        # Retries are handled by QuizBuilder so the client should fail fast.
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
+
+    async def complete(self, messages: list[dict], model: str, temperature: float) -> Completion:
+        response = await self.client.chat.completions.create(
+            model=model, messages=messages, temperature=temperature
+        )
+
+        usage = response.usage
+        return Completion(
+            response.choices[0].message.content,
+            prompt_tokens=usage.prompt_tokens if usage else 0,
+            completion_tokens=usage.completion_tokens if usage else 0,
+        )
+
+    async def stream(
+        self, messages: list[dict], model: str, temperature: float
+    ) -> AsyncIterator[Completion]:
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+
+        async for chunk in response:
+            content = ""
+            if chunk.choices:
+                content = chunk.choices[0].delta.content or ""
+            usage = chunk.usage
+            yield Completion(
+                content,
+                prompt_tokens=usage.prompt_tokens if usage else 0,
+                completion_tokens=usage.completion_tokens if usage else 0,
+            )
+
+    async def close(self):
+        await self.client.close()
+
+
+class FakeLLMClient(LLMClient):
+    """Produces a quiz locally without calling out to a language model, for offline use and tests.
+    Expects the last message to be in the "topic | number of questions" format used by QuizBuilder.
+    """
+
+    def __init__(self, delay: float = 0.0, failures: int = 0, chunk_size: int = 16):
+        self.delay = delay
+        self.failures = failures
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    async def complete(self, messages: list[dict], model: str, temperature: float) -> Completion:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+        self._maybe_fail()
+        return self._make_quiz(messages)
+
+    async def stream(
+        self, messages: list[dict], model: str, temperature: float
+    ) -> AsyncIterator[Completion]:
+        self.calls += 1
+        self._maybe_fail()
+
+        # The delay is spread across the chunks so the first chunk arrives quickly
+        completion = self._make_quiz(messages)
+        content = completion.content
+        chunks = [content[i : i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        for chunk in chunks:
+            if self.delay:
+                await asyncio.sleep(self.delay / len(chunks))
+            yield Completion(chunk)
+
+        yield Completion("", completion.prompt_tokens, completion.completion_tokens)
+
+    def _maybe_fail(self):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Fake LLM failure")
+
+    def _make_quiz(self, messages: list[dict]) -> Completion:
+        topic, _, count = messages[-1]["content"].rpartition("|")
+        topic = topic.strip()
+        rand = random.Random(f"{topic}|{count}")
+
+        questions = []
+        for i in range(int(count)):
+            options = [f"{topic} answer {i + 1}.{n + 1}" for n in range(4)]
+            correct_answer_index = rand.randrange(len(options))
+            questions.append(
+                dict(
+                    text=f"Question {i + 1} about {topic}?",
+                    options=options,
+                    correct_answer=options[correct_answer_index],
+                    correct_answer_index=correct_answer_index,
+                )
+            )
+
+        content = json.dumps(dict(prompt=topic, questions=questions))
+        prompt_tokens = sum(len(m["content"].split()) for m in messages)
+        return Completion(content, prompt_tokens, len(content.split()))
@@ -0,0 +1,80 @@
+import json
+import re
+
+from models import Question
+from quiz_builder.validation import QuizValidator
+
+questions_key = re.compile(r'"questions"\s*:\s*\[')
+
+
+class QuestionStreamParser:
+    """Incrementally parses the quiz JSON produced by the language model, returning each question
+    as soon as its object has been closed rather than waiting for the whole quiz."""
+
+    def __init__(self, validator: QuizValidator = None):
+        self.validator = validator or QuizValidator()
+        self.done = False
+        self.invalid = 0
+        self._prefix = ""
+        self._in_questions = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._current: list[str] = []
+
+    def feed(self, chunk: str) -> list[Question]:
+        """Consumes the next chunk of the completion and returns any questions it completed."""
+        if self.done:
+            return []
+
+        if not self._in_questions:
+            self._prefix += chunk
+            match = questions_key.search(self._prefix)
+            if match is None:
+                return []
+
+            self._in_questions = True
+            chunk = self._prefix[match.end() :]
+            self._prefix = ""
+
+        questions = []
+        for char in chunk:
+            if self._depth == 0:
+                if char == "{":
+                    self._depth = 1
+                    self._current = [char]
+                elif char == "]":
+                    self.done = True
+                    break
+                continue
+
+            self._current.append(char)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    question = self._parse("".join(self._current))
+                    if question is not None:
+                        questions.append(question)
+
+        return questions
+
+    def _parse(self, question_json: str) -> Question | None:
+        try:
+            question = self.validator.question(json.loads(question_json))
+        except ValueError:
+            question = None
+
+        if question is None:
+            self.invalid += 1
+        return question
@@ -0,0 +1,289 @@
+"""Checks and repairs the quizzes produced by the language model.
+
+Completions are often almost right: the JSON is wrapped in a code fence or followed by a note,
+has a trailing comma, or a question's correct_answer_index disagrees with its correct_answer.
+Rather than failing the whole quiz, QuizValidator repairs what it can and drops only the questions
+it cannot, counting each problem it finds.
+
+QuizValidator.validate_many checks quizzes that were cached or imported in bulk, which
+validate_quizzes.py does for a file of quizzes."""
+
+import json
+import re
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator
+
+from pydantic import TypeAdapter, ValidationError
+
+from instrumentation import Counter
+from models import Question, Quiz
+
+question_list = TypeAdapter(list[Question])
+code_fence = re.compile(r"```[a-zA-Z]*\s*(.*?)\s*```", re.DOTALL)
+
+# What was done about a problem
+repaired = "repaired"
+dropped = "dropped"
+
+
+class QuizOutputError(ValueError):
+    """Raised when no quiz can be recovered from a completion."""
+
+
+def loads_with_trailing_commas(text: str, max_commas: int = 50) -> tuple[object, int]:
+    """Parses the JSON, removing the commas directly before a closing bracket or brace, and
+    returns it with the number of commas removed. The commas are found from where parsing fails
+    so those inside strings are left alone. Raises a JSONDecodeError if the text is invalid for
+    any other reason."""
+    for removed in range(max_commas):
+        try:
+            return json.loads(text), removed
+        except json.JSONDecodeError as e:
+            comma = text.rfind(",", 0, e.pos)
+            closing = text[e.pos : e.pos + 1] in ("]", "}")
+            if comma == -1 or text[comma + 1 : e.pos].strip() or not closing:
+                raise
+            text = text[:comma] + text[comma + 1 :]
+
+    return json.loads(text), max_commas
+
+
+class QuizValidator:
+    """Validates and repairs quizzes. Problems are counted by name and what was done about them
+    in problems, and in the metric if given."""
+
+    def __init__(self, num_options: int = 4, metric: Counter = None):
+        self.num_options = num_options
+        self.metric = metric
+        self.problems: dict[tuple[str, str], int] = {}
+
+    def parse(self, content: str) -> list[Question]:
+        """Returns the valid questions of the completion, repaired where possible. Raises a
+        QuizOutputError if the completion holds no quiz or none of its questions are valid."""
+        data = self.load(content)
+        return self.questions(data.get("questions") if isinstance(data, dict) else data)
+
+    def questions(self, questions) -> list[Question]:
+        """Returns the valid questions of the list, repaired where possible. Raises a
+        QuizOutputError if it is not a list or none of its questions are valid."""
+        if not isinstance(questions, list):
+            self._problem("no_questions", dropped)
+            raise QuizOutputError("The completion has no list of questions")
+
+        # Almost every completion is valid, so the questions are first validated all at once
+        try:
+            valid = question_list.validate_python(questions)
+        except ValidationError:
+            valid = None
+        if valid and all(self._is_valid(q) for q in valid):
+            return valid
+
+        valid = [q for q in map(self.question, questions) if q is not None]
+        if not valid:
+            raise QuizOutputError(f"None of the {len(questions)} questions are valid")
+        return valid
+
+    def load(self, content: str):
+        """Parses the JSON in the completion, extracting it from surrounding text and removing
+        trailing commas if needed."""
+        try:
+            return json.loads(content)
+        except ValueError:
+            pass
+
+        text = content
+        fenced = code_fence.search(text)
+        if fenced is not None:
+            self._problem("code_fence", repaired)
+            text = fenced.group(1)
+
+        start, end = text.find("{"), text.rfind("}")
+        if start == -1 or end < start:
+            self._problem("invalid_json", dropped)
+            raise QuizOutputError("The completion contains no JSON object")
+        if start > 0 or end < len(text) - 1:
+            self._problem("surrounding_text", repaired)
+            text = text[start : end + 1]
+
+        try:
+            data, removed = loads_with_trailing_commas(text)
+        except ValueError as e:
+            self._problem("invalid_json", dropped)
+            raise QuizOutputError("The completion is not valid JSON") from e
+
+        if not removed:
+            return data
+        self._problem("trailing_comma", repaired)
+        return data
+
+    def question(self, data) -> Question | None:
+        """Returns the question with its answer reconciled with its options, or None if it cannot
+        be repaired. The repairs of a question are only counted if it is kept, so a dropped
+        question counts once, as the problem it was dropped for."""
+        if not isinstance(data, dict):
+            return self._drop("not_an_object")
+
+        text = data.get("text")
+        if not isinstance(text, str) or not text.strip():
+            return self._drop("missing_text")
+
+        options = data.get("options")
+        if not isinstance(options, list):
+            return self._drop("missing_options")
+
+        repairs = []
+        stripped = [str(o).strip() for o in options if isinstance(o, (str, int, float))]
+        unique = list(dict.fromkeys(o for o in stripped if o))
+        if len(unique) != len(options):
+            repairs.append("invalid_options")
+        if len(unique) < self.num_options:
+            return self._drop("too_few_options")
+
+        index = self._correct_index(data, unique, repairs)
+        if index is None:
+            return self._drop("no_correct_answer")
+
+        if len(unique) > self.num_options:
+            # Keeps the correct answer and the first of the others
+            repairs.append("too_many_options")
+            correct = unique[index]
+            others = [o for o in unique if o != correct][: self.num_options - 1]
+            index = min(index, self.num_options - 1)
+            unique = others[:index] + [correct] + others[index:]
+
+        for problem in repairs:
+            self._problem(problem, repaired)
+        return Question(
+            text=text.strip(),
+            options=unique,
+            correct_answer=unique[index],
+            correct_answer_index=index,
+        )
+
+    def _correct_index(self, data: dict, options: list[str], repairs: list[str]) -> int | None:
+        """Returns the index of the correct answer in the cleaned up options, adding the repairs
+        made to find it to repairs. The answer text is trusted over the index when they disagree,
+        as it is what the model wrote out."""
+        answer = data.get("correct_answer")
+        index = data.get("correct_answer_index")
+        original = data["options"]
+        if isinstance(answer, str) and answer.strip():
+            answer = answer.strip()
+            if answer in options:
+                found = options.index(answer)
+            else:
+                folded = [o.casefold() for o in options]
+                found = folded.index(answer.casefold()) if answer.casefold() in folded else None
+
+            if found is not None:
+                if index != found:
+                    repairs.append("index_missing" if index is None else "index_mismatch")
+                return found
+
+        # Only the index can be used, and it refers to the options before they were cleaned up
+        if isinstance(index, int) and not isinstance(index, bool) and 0 <= index < len(original):
+            repairs.append("answer_not_an_option" if answer else "answer_missing")
+            value = str(original[index]).strip()
+            return options.index(value) if value in options else None
+
+        return None
+
+    def quiz(self, data) -> Quiz | None:
+        """Returns the quiz with its questions repaired, or None if none are valid. Quizzes that
+        are already valid, as almost all stored quizzes are, are checked without being rebuilt."""
+        try:
+            quiz = Quiz.model_validate(data)
+        except ValidationError:
+            quiz = None
+
+        if quiz is not None and all(self._is_valid(q) for q in quiz.questions):
+            return quiz
+
+        if not isinstance(data, dict) or not isinstance(data.get("prompt"), str):
+            self._problem("missing_prompt", dropped)
+            return None
+
+        try:
+            questions = self.questions(data.get("questions"))
+        except QuizOutputError:
+            return None
+        return Quiz(
+            id=data.get("id"),
+            prompt=data["prompt"],
+            questions=questions,
+            generating=bool(data.get("generating", False)),
+        )
+
+    def _is_valid(self, question: Question) -> bool:
+        options = question.options
+        return (
+            len(options) == self.num_options
+            and 0 <= question.correct_answer_index < len(options)
+            and options[question.correct_answer_index] == question.correct_answer
+            and len(set(options)) == len(options)
+            and bool(question.text.strip())
+        )
+
+    def validate_many(
+        self, lines: Iterable[str], workers: int = 1, batch_size: int = 1000
+    ) -> Iterator[Quiz | None]:
+        """Validates JSON quizzes, one per line, yielding each repaired quiz or None if it could not
+        be repaired. With more than one worker, batches are validated in parallel processes and
+        their problems added to these once each batch is done. Only a few batches per worker are
+        read ahead, so the lines can be streamed from a file of any size."""
+        batches = _batches((line for line in lines if line.strip()), batch_size)
+        if workers <= 1:
+            for batch in batches:
+                yield from map(self._load_quiz, batch)
+            return
+
+        with ProcessPoolExecutor(workers) as executor:
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(_validate_batch, self.num_options, batch))
+                if len(pending) >= workers * 2:
+                    yield from self._batch_result(pending.popleft())
+            while pending:
+                yield from self._batch_result(pending.popleft())
+
+    def _batch_result(self, future: Future) -> list[Quiz | None]:
+        quizzes, problems = future.result()
+        for key, count in problems.items():
+            self._problem(*key, count=count)
+        return quizzes
+
+    def _load_quiz(self, line: str) -> Quiz | None:
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return self._drop("invalid_json")
+        return self.quiz(data)
+
+    def _drop(self, problem: str) -> None:
+        self._problem(problem, dropped)
+        return None
+
+    def _problem(self, problem: str, action: str, count: int = 1):
+        key = (problem, action)
+        self.problems[key] = self.problems.get(key, 0) + count
+        if self.metric is not None:
+            self.metric.inc(count, problem=problem, action=action)
+
+
+def _batches(lines: Iterable[str], batch_size: int) -> Iterator[list[str]]:
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _validate_batch(
+    num_options: int, lines: list[str]
+) -> tuple[list[Quiz | None], dict[tuple[str, str], int]]:
+    validator = QuizValidator(num_options)
+    return [validator._load_quiz(line) for line in lines], validator.problems
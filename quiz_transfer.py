@@ -0,0 +1,117 @@
+"""Exports and imports quizzes in bulk, for moving a quiz bank between environments.
+
+    python quiz_transfer.py export quizzes.jsonl.gz
+    python quiz_transfer.py import quizzes.jsonl.gz --workers 4
+    python quiz_transfer.py export snapshot.pgcopy.gz
+
+The default format has one JSON quiz per line, in the shape of a Quiz without ids, so it can be
+read, edited and checked with validate_quizzes.py. Every quiz is validated, and repaired where
+possible, when it is imported. The binary format is PostgreSQL's COPY format, which reloads much
+faster as the rows are never parsed in Python, but can only be read by a database with the same
+schema. Paths ending in .pgcopy or .pgcopy.gz use the binary format and paths ending in .gz are
+gzip compressed. Imported quizzes are always given new ids, and expire as if created now."""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import sys
+import time
+
+from persistance.database import Database
+from persistance.quiz_repo import QuizRepo
+from quiz_builder.validation import QuizValidator
+from reaper import quiz_ttl
+
+logger = logging.getLogger(__name__)
+
+
+def open_file(path: str, mode: str):
+    """Opens the path in binary mode, or stdin or stdout for -, decompressing .gz files."""
+    if path == "-":
+        return os.fdopen(os.dup((sys.stdin if mode == "rb" else sys.stdout).fileno()), mode)
+    if path.endswith(".gz"):
+        # Compresses at the level of the gzip command rather than the slower maximum
+        return gzip.open(path, mode, compresslevel=6)
+    return open(path, mode)
+
+
+def file_format(path: str, format: str | None) -> str:
+    if format is not None:
+        return format
+    return "binary" if path.removesuffix(".gz").endswith(".pgcopy") else "jsonl"
+
+
+def export_quizzes(repo: QuizRepo, path: str, format: str) -> int | None:
+    """Writes every finished quiz to the path and returns the number written, which is not
+    counted in the binary format."""
+    with open_file(path, "wb") as f:
+        if format == "binary":
+            repo.export_copy(f)
+            return None
+
+        count = 0
+        for quiz in repo.export_quizzes():
+            line = json.dumps(quiz, ensure_ascii=False, separators=(",", ":")) + "\n"
+            f.write(line.encode())
+            count += 1
+        return count
+
+
+def import_quizzes(repo: QuizRepo, path: str, format: str, workers: int, batch_size: int):
+    with open_file(path, "rb") as f:
+        if format == "binary":
+            result = repo.import_copy(f)
+        else:
+            validator = QuizValidator()
+            lines = (line.decode() for line in f)
+            quizzes = (q for q in validator.validate_many(lines, workers) if q is not None)
+            result = repo.import_quizzes(quizzes, batch_size=batch_size)
+            for (problem, action), count in sorted(validator.problems.items()):
+                logger.info("%s %s %d", problem, action, count)
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="write every finished quiz to a file")
+    export.add_argument("path", help="the file to write, or - for stdout")
+    export.add_argument("--format", choices=("jsonl", "binary"))
+    load = commands.add_parser("import", help="save the quizzes in a file as new quizzes")
+    load.add_argument("path", help="the file to read, or - for stdin")
+    load.add_argument("--format", choices=("jsonl", "binary"))
+    load.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="processes validating quizzes in the jsonl format",
+    )
+    load.add_argument("--batch-size", type=int, default=1000, help="quizzes per transaction")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    repo = QuizRepo(Database.default(), ttl=quiz_ttl())
+    format = file_format(args.path, args.format)
+    started = time.perf_counter()
+
+    if args.command == "export":
+        count = export_quizzes(repo, args.path, format)
+        if count is not None:
+            logger.info("Exported %d quizzes", count)
+    else:
+        result = import_quizzes(repo, args.path, format, args.workers, args.batch_size)
+        logger.info(
+            "Imported %d quizzes with %d questions, rejected %d questions",
+            result.quizzes,
+            result.questions,
+            result.rejected,
+        )
+
+    logger.info("Took %.1fs", time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    main()
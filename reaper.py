@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from dotenv import load_dotenv
+
+from instrumentation import reaper_rows, reaper_run_seconds, serve_metrics
+from persistance.database import Database
+from persistance.generation_cache_repo import GenerationCacheRepo
+from persistance.generation_job_repo import GenerationJobRepo
+from persistance.quiz_repo import QuizRepo
+
+logger = logging.getLogger(__name__)
+
+
+def quiz_ttl() -> float | None:
+    """Returns the seconds a new quiz is kept for, QUIZ_TTL_DAYS days or 30 by default, or None
+    if quizzes are kept forever with QUIZ_TTL_DAYS=0."""
+    load_dotenv()
+    days = float(os.getenv("QUIZ_TTL_DAYS", 30))
+    return days * 24 * 60 * 60 if days > 0 else None
+
+
+class QuizReaper:
+    """Deletes expired quizzes in small batches, each in its own short transaction and with a
+    pause between them, so that no long running locks are held and the write ahead log grows
+    steadily rather than in one large burst. Pool generation jobs that failed more than
+    failed_job_age seconds ago and generated quizzes cached for longer than cache_max_age are
+    deleted the same way, if their repositories are given."""
+
+    def __init__(
+        self,
+        quiz_repo: QuizRepo,
+        batch_size: int = 500,
+        pause: float = 0.1,
+        interval: float = 300.0,
+        job_repo: GenerationJobRepo = None,
+        cache_repo: GenerationCacheRepo = None,
+        failed_job_age: float = 86400.0,
+        cache_max_age: float = 3600.0,
+    ):
+        self.quiz_repo = quiz_repo
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self.job_repo = job_repo
+        self.cache_repo = cache_repo
+        self.failed_job_age = failed_job_age
+        self.cache_max_age = cache_max_age
+        self.quizzes_deleted = 0
+        self.questions_deleted = 0
+        self.last_run_seconds = 0.0
+
+    @classmethod
+    def default(cls, quiz_repo: QuizRepo):
+        load_dotenv()
+        return cls(
+            quiz_repo,
+            batch_size=int(os.getenv("QUIZ_REAPER_BATCH", 500)),
+            pause=int(os.getenv("QUIZ_REAPER_PAUSE_MS", 100)) / 1000,
+            interval=float(os.getenv("QUIZ_REAPER_INTERVAL", 300)),
+            job_repo=GenerationJobRepo(quiz_repo.database),
+            cache_repo=GenerationCacheRepo(quiz_repo.database),
+            failed_job_age=float(os.getenv("QUIZ_REAPER_FAILED_JOB_AGE", 86400)),
+            # Cached quizzes older than the cache ttl are never returned
+            cache_max_age=float(os.getenv("QUIZ_CACHE_TTL", 3600)),
+        )
+
+    async def run_once(self) -> int:
+        """Deletes every quiz that has expired, then old failed jobs and stale cached quizzes.
+        Returns the number of quizzes deleted."""
+        started = time.perf_counter()
+        deleted = 0
+        while True:
+            quizzes, questions = await self.quiz_repo.delete_expired(self.batch_size)
+            deleted += quizzes
+            self.quizzes_deleted += quizzes
+            self.questions_deleted += questions
+            reaper_rows.inc(quizzes, table="quizzes")
+            reaper_rows.inc(questions, table="questions")
+            if quizzes < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        if self.job_repo is not None:
+            await self._delete_in_batches(
+                "generation_jobs", self.job_repo.delete_failed, self.failed_job_age
+            )
+        if self.cache_repo is not None:
+            await self._delete_in_batches(
+                "generation_cache", self.cache_repo.delete_stale, self.cache_max_age
+            )
+
+        self.last_run_seconds = time.perf_counter() - started
+        reaper_run_seconds.observe(self.last_run_seconds)
+        logger.info(
+            "Deleted %d expired quizzes in %.1fs, %d quizzes and %d questions since starting",
+            deleted,
+            self.last_run_seconds,
+            self.quizzes_deleted,
+            self.questions_deleted,
+        )
+        return deleted
+
+    async def _delete_in_batches(self, table: str, delete, age: float) -> int:
+        deleted = 0
+        while True:
+            batch = await delete(age, self.batch_size)
+            deleted += batch
+            reaper_rows.inc(batch, table=table)
+            if batch < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+
+        if deleted:
+            logger.info("Deleted %d rows from %s", deleted, table)
+        return deleted
+
+    async def run(self):
+        """Deletes expired quizzes every interval until cancelled."""
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("The quiz reaper failed")
+
+            await asyncio.sleep(self.interval)
+
+    async def backfill(self) -> int:
+        """Gives the quizzes with no expiry, such as those created before quizzes expired, an
+        expiry of the ttl after they were created. Returns the number of quizzes updated."""
+        if self.quiz_repo.ttl is None:
+            raise ValueError("Quizzes do not expire when QUIZ_TTL_DAYS=0")
+
+        updated = 0
+        while True:
+            batch = await self.quiz_repo.set_missing_expiry(self.batch_size)
+            updated += batch
+            if batch < self.batch_size:
+                return updated
+            await asyncio.sleep(self.pause)
+
+
+async def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Deletes expired quizzes")
+    parser.add_argument("--once", action="store_true", help="delete expired quizzes and exit")
+    parser.add_argument(
+        "--backfill", action="store_true", help="give quizzes with no expiry one and exit"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("QUIZ_REAPER_METRICS_PORT", 0)) or None,
+        help="serve the metrics at /metrics on the port",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port)
+    database = Database.default()
+    database.open()
+    reaper = QuizReaper.default(QuizRepo(database, ttl=quiz_ttl()))
+
+    try:
+        if args.backfill:
+            logger.info("Gave %d quizzes an expiry", await reaper.backfill())
+        elif args.once:
+            await reaper.run_once()
+        else:
+            await reaper.run()
+    finally:
+        database.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
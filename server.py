@@ -0,0 +1,66 @@
+"""Runs the app in production across several worker processes.
+
+    python server.py --workers 4
+    python server.py --migrate
+
+Every worker builds its own database pool, caches and quiz builder once in the app lifespan, so
+the database allows up to workers * DB_POOL_MAX connections. The metrics are also held by each
+worker, so /metrics reports only the worker that answers the scrape; for totals across the app run
+one worker per instance with --workers 1. Migrations are not applied by the workers; run them
+beforehand with `make migrate`, or pass --migrate to apply them once before the workers start. On
+SIGTERM each worker stops accepting connections and finishes its in-flight requests and quiz
+generation for up to the graceful timeout before shutting down."""
+
+import argparse
+import logging
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+from persistance.database import Database
+from persistance.migrator import MigrationRunner
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("QUIZ_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("QUIZ_PORT", 8000)))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=int(os.getenv("QUIZ_WORKERS", os.cpu_count() or 1)),
+        help="the number of worker processes, by default one for each CPU",
+    )
+    parser.add_argument(
+        "--graceful-timeout",
+        type=float,
+        default=float(os.getenv("QUIZ_GRACEFUL_TIMEOUT", 30)),
+        help="seconds to wait for in-flight work on shutdown",
+    )
+    parser.add_argument("--migrate", action="store_true", help="apply migrations before starting")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.migrate:
+        applied = MigrationRunner(Database.default()).migrate()
+        logger.info("Applied %d migrations", len(applied))
+
+    # The graceful timeout is read by the lifespan of each worker for draining quiz generation
+    os.environ["QUIZ_GRACEFUL_TIMEOUT"] = str(args.graceful_timeout)
+    uvicorn.run(
+        "api:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        proxy_headers=True,
+        log_level="info",
+    )
+
+
+if __name__ == "__main__":
+    main()
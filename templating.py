@@ -0,0 +1,175 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+import jinja2
+from dotenv import load_dotenv
+from fastapi.staticfiles import StaticFiles
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+from starlette.responses import Response
+from starlette.types import Scope
+
+from instrumentation import template_render_seconds, timed
+from models import Question
+
+
+def directory_hash(directory: str) -> str:
+    """Returns a hash of the names and contents of every file in the directory."""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode())
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class HashedStaticFiles(StaticFiles):
+    """Serves the static files, whose URLs include a hash of their content so that browsers can
+    cache them forever: a changed file is given a new URL. Requests without the current hash, such
+    as from a page rendered before the file changed, are revalidated on every use instead."""
+
+    immutable = "public, max-age=31536000, immutable"
+
+    def __init__(self, directory: str, prefix: str = "/static"):
+        super().__init__(directory=directory)
+        self.prefix = prefix
+        # The size, modification time and hash of each file by path
+        self._hashes: dict[str, tuple[tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        path = path.lstrip("/")
+        return f"{self.prefix}/{path}?v={self.file_hash(path)}"
+
+    def file_hash(self, path: str) -> str:
+        full_path = os.path.join(self.directory, path)
+        stat = os.stat(full_path)
+        key = (stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        with open(full_path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()[:12]
+        with self._lock:
+            self._hashes[path] = (key, digest)
+        return digest
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            version = parse_qs(scope["query_string"].decode()).get("v")
+            current = version is not None and version[0] == self.file_hash(path)
+            response.headers["Cache-Control"] = self.immutable if current else "no-cache"
+        return response
+
+
+class FragmentCache:
+    """An LRU of rendered HTML fragments that never change once rendered, such as a question."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, Markup] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> Markup | None:
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return fragment
+
+    def put(self, key: tuple, fragment: Markup):
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class QuizTemplates(Jinja2Templates):
+    """The app's templates, which times every render and caches the HTML of each question.
+
+    Templates are compiled once and their bytecode cached on disk so that new worker processes
+    skip compiling them. They are not checked for changes unless QUIZ_TEMPLATE_RELOAD=true.
+    Templates link to static files with static_url, which adds the hash of the file."""
+
+    def __init__(
+        self,
+        directory: str,
+        reload: bool = False,
+        bytecode_cache_dir: str = None,
+        fragment_cache_entries: int = 10_000,
+        static_files: HashedStaticFiles = None,
+    ):
+        env = jinja2.Environment(
+            loader=jinja2.FileSystemLoader(directory),
+            autoescape=jinja2.select_autoescape(),
+            auto_reload=reload,
+            bytecode_cache=jinja2.FileSystemBytecodeCache(bytecode_cache_dir),
+        )
+        super().__init__(env=env)
+        self.directory = directory
+        self.reload = reload
+        self.static_files = static_files
+        self.fragments = FragmentCache(fragment_cache_entries)
+        self._version = None
+        if static_files is not None:
+            env.globals["static_url"] = static_files.url
+
+    @classmethod
+    def default(cls, directory: str = "templates", static_files: HashedStaticFiles = None):
+        load_dotenv()
+        return cls(
+            directory,
+            reload=os.getenv("QUIZ_TEMPLATE_RELOAD") == "true",
+            bytecode_cache_dir=os.getenv("QUIZ_TEMPLATE_CACHE_DIR"),
+            fragment_cache_entries=int(os.getenv("QUIZ_FRAGMENT_CACHE_ENTRIES", 10_000)),
+            static_files=static_files,
+        )
+
+    @property
+    def version(self) -> str:
+        """A hash of the templates and the static files they link to, which changes whenever the
+        HTML rendered from the same data could. Only recomputed when templates are reloaded."""
+        if self._version is None or self.reload:
+            version = directory_hash(self.directory)
+            if self.static_files is not None:
+                version += directory_hash(self.static_files.directory)
+            self._version = version
+        return self._version
+
+    def TemplateResponse(self, *args, **kwargs):
+        # The template is rendered when the response is created
+        name = kwargs.get("name") or next(arg for arg in args if isinstance(arg, str))
+        with timed("render", template_render_seconds, template=name):
+            return super().TemplateResponse(*args, **kwargs)
+
+    def question(self, quiz_id: str, question: Question, question_number: int) -> Markup:
+        """Returns the HTML of the question form, which is the same for every attempt at the quiz
+        and so is only rendered the first time each question is shown."""
+        key = (quiz_id, question.id)
+        fragment = self.fragments.get(key)
+        if fragment is None:
+            with timed("render", template_render_seconds, template="macros/quiz.html"):
+                macros = self.get_template("macros/quiz.html").module
+                fragment = Markup(macros.question(quiz_id, question, question_number))
+            self.fragments.put(key, fragment)
+
+        return fragment
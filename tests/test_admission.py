@@ -0,0 +1,171 @@
+import asyncio
+
+import pytest
+
+from admission import GenerationBusyError, GenerationGate, MemoryRateLimiter, RateLimitedError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def take(limiter: MemoryRateLimiter, key: str = "client"):
+    asyncio.run(limiter.take(key))
+
+
+def test_a_burst_is_admitted_and_then_limited():
+    limiter = MemoryRateLimiter("test", rate=1.0, burst=3, clock=Clock())
+
+    for _ in range(3):
+        take(limiter)
+    with pytest.raises(RateLimitedError) as e:
+        take(limiter)
+
+    assert e.value.retry_after == pytest.approx(1.0)
+    assert e.value.retry_after_header == "1"
+
+
+def test_tokens_refill_over_time_up_to_the_burst():
+    clock = Clock()
+    limiter = MemoryRateLimiter("test", rate=0.5, burst=2, clock=clock)
+    take(limiter)
+    take(limiter)
+
+    clock.now = 1.0
+    with pytest.raises(RateLimitedError) as e:
+        take(limiter)
+    assert e.value.retry_after == pytest.approx(1.0)
+
+    clock.now = 2.0
+    take(limiter)
+
+    # A long pause refills no more than the burst
+    clock.now = 1000.0
+    take(limiter)
+    take(limiter)
+    with pytest.raises(RateLimitedError):
+        take(limiter)
+
+
+def test_rejected_requests_take_no_tokens():
+    clock = Clock()
+    limiter = MemoryRateLimiter("test", rate=1.0, burst=1, clock=clock)
+    take(limiter)
+    for _ in range(5):
+        with pytest.raises(RateLimitedError):
+            take(limiter)
+
+    clock.now = 1.0
+    take(limiter)
+
+
+def test_each_key_has_its_own_bucket():
+    limiter = MemoryRateLimiter("test", rate=1.0, burst=1, clock=Clock())
+    take(limiter, "a")
+    take(limiter, "b")
+
+    with pytest.raises(RateLimitedError):
+        take(limiter, "a")
+
+
+def test_the_least_recently_used_bucket_is_evicted_at_max_keys():
+    limiter = MemoryRateLimiter("test", rate=1.0, burst=1, max_keys=2, clock=Clock())
+    take(limiter, "a")
+    take(limiter, "b")
+    with pytest.raises(RateLimitedError):
+        take(limiter, "a")
+
+    # "b" is now the least recently used, and is forgotten to make room for "c"
+    take(limiter, "c")
+
+    assert set(limiter._buckets) == {"a", "c"}
+    take(limiter, "b")
+
+
+def test_the_gate_admits_up_to_its_concurrency():
+    async def run():
+        gate = GenerationGate(concurrency=2, max_queue=0, max_wait=1)
+        first = await gate.acquire()
+        await gate.acquire()
+        assert gate.running == 2
+        with pytest.raises(GenerationBusyError):
+            await gate.acquire()
+
+        gate.release(first)
+        await gate.acquire()
+        return gate
+
+    gate = asyncio.run(run())
+
+    assert gate.admitted == 3
+    assert gate.rejected == 1
+
+
+def test_a_full_queue_is_rejected_at_once():
+    async def run():
+        gate = GenerationGate(concurrency=1, max_queue=1, max_wait=10)
+        await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+        assert gate.waiting == 1
+
+        with pytest.raises(GenerationBusyError) as e:
+            await asyncio.wait_for(gate.acquire(), 1)
+        waiter.cancel()
+        return e.value
+
+    error = asyncio.run(run())
+
+    assert "waiting" in str(error)
+    assert error.retry_after > 0
+
+
+def test_a_wait_longer_than_max_wait_is_rejected():
+    async def run():
+        gate = GenerationGate(concurrency=1, max_queue=5, max_wait=0.01)
+        await gate.acquire()
+        with pytest.raises(GenerationBusyError, match="Timed out"):
+            await gate.acquire()
+        return gate
+
+    gate = asyncio.run(run())
+
+    assert gate.waiting == 0
+    assert gate.rejected == 1
+
+
+def test_a_released_slot_is_given_to_a_waiter():
+    async def run():
+        gate = GenerationGate(concurrency=1, max_queue=1, max_wait=1)
+        acquired = await gate.acquire()
+        waiter = asyncio.create_task(gate.acquire())
+        await asyncio.sleep(0)
+
+        gate.release(acquired)
+        await waiter
+        return gate
+
+    gate = asyncio.run(run())
+
+    assert gate.running == 1
+    assert gate.waiting == 0
+
+
+def test_slot_releases_when_the_block_raises():
+    async def run():
+        gate = GenerationGate(concurrency=1, max_queue=0, max_wait=1)
+        with pytest.raises(ValueError):
+            async with gate.slot():
+                raise ValueError()
+        async with gate.slot():
+            pass
+        return gate
+
+    gate = asyncio.run(run())
+
+    assert gate.running == 0
+    assert gate.admitted == 2
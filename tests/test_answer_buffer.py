@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from persistance.answer_buffer import AnswerBuffer, AnswerBufferFullError
+
+
+class FakeDatabase:
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args, **kwargs)
+
+
+class RecordingBuffer(AnswerBuffer):
+    """Records the batches written instead of inserting them, failing the first failures."""
+
+    def __init__(self, failures: int = 0, **kwargs):
+        super().__init__(FakeDatabase(), **kwargs)
+        self.failures = failures
+        self.batches = []
+
+    def _write(self, batch):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("Fake database failure")
+        self.batches.append(batch)
+
+
+def test_answers_are_visible_until_flushed():
+    buffer = RecordingBuffer()
+    buffer.add("attempt", 1, True)
+    buffer.add("attempt", 2, False)
+
+    assert buffer.answers("attempt") == {1: True, 2: False}
+    assert asyncio.run(buffer.flush())
+
+    assert buffer.answers("attempt") == {}
+    assert buffer.pending == 0
+    assert [(a, q, c) for a, q, c, _ in buffer.batches[0]] == [
+        ("attempt", 1, True),
+        ("attempt", 2, False),
+    ]
+
+
+def test_the_first_answer_to_a_question_is_kept():
+    buffer = RecordingBuffer()
+
+    assert buffer.add("attempt", 1, False) is False
+    assert buffer.add("attempt", 1, True) is False
+    assert buffer.pending == 1
+
+
+def test_answers_are_flushed_in_batches_of_max_batch():
+    buffer = RecordingBuffer(max_batch=2)
+    for question_id in range(5):
+        buffer.add("attempt", question_id, True)
+
+    assert asyncio.run(buffer.flush())
+
+    assert [len(batch) for batch in buffer.batches] == [2, 2, 1]
+    assert buffer.flushes == 3
+    assert buffer.flushed == 5
+
+
+def test_a_failed_flush_keeps_the_answers_for_the_next_one():
+    buffer = RecordingBuffer(failures=1)
+    buffer.add("attempt", 1, True)
+
+    assert not asyncio.run(buffer.flush())
+    assert buffer.failed_flushes == 1
+    assert buffer.answers("attempt") == {1: True}
+
+    assert asyncio.run(buffer.flush())
+    assert buffer.answers("attempt") == {}
+    assert len(buffer.batches) == 1
+
+
+def test_the_background_flush_retries_after_a_failure():
+    async def run():
+        buffer = RecordingBuffer(failures=1, flush_interval=0.01)
+        buffer.start()
+        buffer.add("attempt", 1, True)
+        for _ in range(100):
+            if buffer.flushed:
+                break
+            await asyncio.sleep(0.01)
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(run())
+
+    assert buffer.failed_flushes == 1
+    assert buffer.flushed == 1
+    assert buffer.pending == 0
+
+
+def test_a_full_buffer_rejects_answers():
+    buffer = RecordingBuffer(max_pending=1)
+    buffer.add("attempt", 1, True)
+
+    with pytest.raises(AnswerBufferFullError):
+        buffer.add("attempt", 2, True)
+    assert buffer.rejected == 1
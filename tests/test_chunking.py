@@ -0,0 +1,51 @@
+from models import Question
+from quiz_builder.chunking import dedupe_questions, split_chunks
+
+
+def make_question(text: str, answer: str) -> Question:
+    options = [answer, "other 1", "other 2", "other 3"]
+    return Question(text=text, options=options, correct_answer=answer, correct_answer_index=0)
+
+
+def test_split_chunks_is_as_even_as_possible():
+    assert split_chunks(25, 10) == [9, 8, 8]
+    assert split_chunks(10, 10) == [10]
+    assert split_chunks(0, 10) == [0]
+
+
+def test_rewordings_with_the_same_answer_are_removed():
+    questions = [
+        make_question("What is the capital of France?", "Paris"),
+        make_question("What is the capital of France", "Paris"),
+        make_question("what is the Capital of France?!", "Paris"),
+    ]
+
+    assert dedupe_questions(questions) == questions[:1]
+
+
+def test_similar_questions_with_different_answers_are_kept():
+    questions = [
+        make_question("In which year did World War 1 end?", "1918"),
+        make_question("In which year did World War 2 end?", "1945"),
+    ]
+
+    assert dedupe_questions(questions) == questions
+
+
+def test_different_questions_with_the_same_answer_are_kept():
+    questions = [
+        make_question("What is the capital of France?", "Paris"),
+        make_question("Where is the Louvre?", "Paris"),
+    ]
+
+    assert dedupe_questions(questions) == questions
+
+
+def test_the_threshold_controls_how_similar_duplicates_must_be():
+    questions = [
+        make_question("Who painted the Mona Lisa?", "Leonardo"),
+        make_question("Who was the painter of the Mona Lisa?", "Leonardo"),
+    ]
+
+    assert dedupe_questions(questions) == questions
+    assert dedupe_questions(questions, threshold=0.7) == questions[:1]
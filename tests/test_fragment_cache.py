@@ -0,0 +1,47 @@
+import os
+
+from markupsafe import Markup
+
+from models import Question
+from templating import FragmentCache, QuizTemplates
+
+templates_dir = os.path.join(os.path.dirname(__file__), "..", "templates")
+
+
+def test_least_recently_used_fragment_is_evicted():
+    cache = FragmentCache(max_entries=2)
+    cache.put(("quiz", 1), Markup("<p>1</p>"))
+    cache.put(("quiz", 2), Markup("<p>2</p>"))
+    cache.get(("quiz", 1))
+    cache.put(("quiz", 3), Markup("<p>3</p>"))
+
+    assert len(cache) == 2
+    assert cache.get(("quiz", 1)) == Markup("<p>1</p>")
+    assert cache.get(("quiz", 2)) is None
+
+
+def test_hits_and_misses_are_counted():
+    cache = FragmentCache()
+    cache.put(("quiz", 1), Markup("<p>1</p>"))
+    cache.get(("quiz", 1))
+    cache.get(("quiz", 2))
+
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_question_is_rendered_once(tmp_path):
+    templates = QuizTemplates(templates_dir, bytecode_cache_dir=str(tmp_path))
+    question = Question(
+        id=7,
+        text="What is <b>1 + 1</b>?",
+        options=["1", "2"],
+        correct_answer="2",
+        correct_answer_index=1,
+    )
+
+    first = templates.question("quiz", question, 1)
+    second = templates.question("quiz", question, 1)
+
+    assert first is second
+    assert "&lt;b&gt;" in first
+    assert (templates.fragments.hits, templates.fragments.misses) == (1, 1)
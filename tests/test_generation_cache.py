@@ -0,0 +1,107 @@
+import asyncio
+
+from models import Question, Quiz
+from quiz_builder.cache import GenerationCache, GenerationCacheStore, cache_key
+
+
+def make_quiz(prompt: str) -> Quiz:
+    question = Question(
+        text="What is 1 + 1?", options=["1", "2"], correct_answer="2", correct_answer_index=1
+    )
+    return Quiz(prompt=prompt, questions=[question])
+
+
+class DictStore(GenerationCacheStore):
+    def __init__(self):
+        self.quizzes: dict[str, Quiz] = {}
+        self.max_ages: list[float] = []
+
+    async def get(self, key: str, max_age: float) -> Quiz | None:
+        self.max_ages.append(max_age)
+        return self.quizzes.get(key)
+
+    async def put(self, key: str, quiz: Quiz):
+        self.quizzes[key] = quiz
+
+
+class BrokenStore(GenerationCacheStore):
+    async def get(self, key: str, max_age: float) -> Quiz | None:
+        raise ConnectionError("store is down")
+
+    async def put(self, key: str, quiz: Quiz):
+        raise ConnectionError("store is down")
+
+
+def test_key_depends_on_every_input():
+    key = cache_key("rome", 10, "model", "prompt")
+
+    assert key == cache_key("rome", 10, "model", "prompt")
+    assert key != cache_key("paris", 10, "model", "prompt")
+    assert key != cache_key("rome", 5, "model", "prompt")
+    assert key != cache_key("rome", 10, "other model", "prompt")
+    assert key != cache_key("rome", 10, "model", "other prompt")
+
+
+def test_local_hits_and_misses():
+    async def run():
+        cache = GenerationCache()
+        await cache.put("a", make_quiz("a"))
+        return cache, await cache.get("a"), await cache.get("b")
+
+    cache, hit, miss = asyncio.run(run())
+
+    assert hit == make_quiz("a")
+    assert miss is None
+    assert (cache.local_hits, cache.shared_hits, cache.misses) == (1, 0, 1)
+
+
+def test_least_recently_used_quiz_is_evicted():
+    async def run():
+        cache = GenerationCache(max_entries=2)
+        await cache.put("a", make_quiz("a"))
+        await cache.put("b", make_quiz("b"))
+        await cache.get("a")
+        await cache.put("c", make_quiz("c"))
+        return [await cache.get(key) is not None for key in "abc"]
+
+    assert asyncio.run(run()) == [True, False, True]
+
+
+def test_expired_quizzes_are_not_returned():
+    async def run():
+        cache = GenerationCache(ttl=0)
+        await cache.put("a", make_quiz("a"))
+        return cache, await cache.get("a")
+
+    cache, quiz = asyncio.run(run())
+
+    assert quiz is None
+    assert len(cache._entries) == 0
+
+
+def test_shared_store_fills_the_local_tier():
+    store = DictStore()
+
+    async def run():
+        await GenerationCache(shared=store).put("a", make_quiz("a"))
+        cache = GenerationCache(ttl=60, shared=store)
+        return cache, await cache.get("a"), await cache.get("a")
+
+    cache, first, second = asyncio.run(run())
+
+    assert first == second == make_quiz("a")
+    assert (cache.local_hits, cache.shared_hits) == (1, 1)
+    assert store.max_ages == [60]
+
+
+def test_failing_shared_store_is_treated_as_a_miss():
+    async def run():
+        cache = GenerationCache(shared=BrokenStore())
+        await cache.put("a", make_quiz("a"))
+        cache._entries.clear()
+        return cache, await cache.get("a")
+
+    cache, quiz = asyncio.run(run())
+
+    assert quiz is None
+    assert cache.misses == 1
@@ -0,0 +1,94 @@
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from api import not_modified, progress_etag
+from compression import accepts_encoding
+from templating import HashedStaticFiles
+
+
+def make_scope(headers: dict[str, str]) -> dict:
+    raw = [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+    return dict(type="http", method="GET", path="/", query_string=b"", headers=raw)
+
+
+class ProgressRepo:
+    def __init__(self, version: tuple[int, int, bool] | None):
+        self.version = version
+
+    async def get_progress_version(self, quiz_id: str, attempt_id: str):
+        return self.version
+
+
+def check(if_none_match: str | None, version=(10, 3, False), attempt_id="attempt"):
+    headers = {} if if_none_match is None else {"If-None-Match": if_none_match}
+    request = Request(make_scope(headers))
+    return asyncio.run(not_modified(request, ProgressRepo(version), "quiz", attempt_id))
+
+
+def test_accepts_encoding():
+    assert accepts_encoding(make_scope({"Accept-Encoding": "gzip, br"}), "br")
+    assert accepts_encoding(make_scope({"Accept-Encoding": "BR;q=0.5"}), "br")
+    assert not accepts_encoding(make_scope({"Accept-Encoding": "gzip"}), "br")
+    assert not accepts_encoding(make_scope({"Accept-Encoding": "br; q=0, gzip"}), "br")
+    assert not accepts_encoding(make_scope({}), "br")
+
+
+def test_progress_etag_changes_with_progress():
+    etag = progress_etag("attempt", 10, 3, False)
+
+    assert etag.startswith('W/"')
+    assert "attempt" not in etag
+    assert etag == progress_etag("attempt", 10, 3, False)
+    assert etag != progress_etag("attempt", 10, 4, False)
+    assert etag != progress_etag("attempt", 11, 3, False)
+    assert etag != progress_etag("attempt", 10, 3, True)
+    assert etag != progress_etag("other attempt", 10, 3, False)
+
+
+def test_not_modified_for_the_current_progress():
+    etag = progress_etag("attempt", 10, 3, False)
+
+    response = check(f'"other", {etag.removeprefix("W/")}')
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+
+def test_modified_when_progress_changed():
+    assert check(progress_etag("attempt", 10, 2, False)) is None
+
+
+def test_modified_without_a_cached_page_attempt_or_quiz():
+    etag = progress_etag("attempt", 10, 3, False)
+
+    assert check(None) is None
+    assert check(etag, attempt_id=None) is None
+    assert check(etag, version=None) is None
+
+
+def test_static_urls_are_cached_only_with_the_current_hash(tmp_path):
+    (tmp_path / "app.css").write_text("body { color: black; }")
+    static_files = HashedStaticFiles(str(tmp_path))
+    client = TestClient(Starlette(routes=[Mount("/static", static_files)]))
+
+    url = static_files.url("/app.css")
+    assert url.startswith("/static/app.css?v=")
+
+    assert client.get(url).headers["Cache-Control"] == HashedStaticFiles.immutable
+    assert client.get("/static/app.css").headers["Cache-Control"] == "no-cache"
+    assert client.get("/static/app.css?v=stale").headers["Cache-Control"] == "no-cache"
+
+
+def test_changed_static_file_gets_a_new_url(tmp_path):
+    path = tmp_path / "app.css"
+    path.write_text("body { color: black; }")
+    static_files = HashedStaticFiles(str(tmp_path))
+    url = static_files.url("app.css")
+
+    path.write_text("body { color: white; background: black; }")
+
+    assert static_files.url("app.css") != url
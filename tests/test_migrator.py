@@ -0,0 +1,51 @@
+from persistance.migrator import Migration, MigrationRunner, no_transaction_marker
+
+
+def test_migrations_run_in_a_transaction_unless_marked():
+    assert Migration(1, "plain", "CREATE TABLE t (id INT);").transactional
+    assert not Migration(2, "indexes", f"\n{no_transaction_marker}\nSELECT 1;").transactional
+
+
+def test_marker_only_counts_at_the_start():
+    sql = f"CREATE TABLE t (id INT);\n{no_transaction_marker}\n"
+    assert Migration(1, "late_marker", sql).transactional
+
+
+def test_statements_are_split_on_semicolons_ending_a_line():
+    sql = f"""{no_transaction_marker}
+-- A comment; with a semicolon;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx
+    ON a (id);
+CREATE INDEX CONCURRENTLY b_idx ON b (name) WHERE name <> ';';
+
+SELECT 1;
+"""
+    assert Migration(1, "indexes", sql).statements() == [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS a_idx\n    ON a (id)",
+        "CREATE INDEX CONCURRENTLY b_idx ON b (name) WHERE name <> ';'",
+        "SELECT 1",
+    ]
+
+
+def test_concurrent_index_names():
+    assert Migration.concurrent_index_name("CREATE INDEX CONCURRENTLY a_idx ON a (id)") == "a_idx"
+    assert (
+        Migration.concurrent_index_name(
+            "create unique index concurrently if not exists b_idx on b (id)"
+        )
+        == "b_idx"
+    )
+    assert Migration.concurrent_index_name("CREATE INDEX c_idx ON c (id)") is None
+    assert Migration.concurrent_index_name("SELECT 1") is None
+
+
+def test_bundled_migrations_load_in_order():
+    migrations = MigrationRunner(database=None).load()
+
+    versions = [m.version for m in migrations]
+    assert versions == sorted(versions)
+    assert all(m.statements() for m in migrations)
+    for migration in migrations:
+        if not migration.transactional:
+            names = [migration.concurrent_index_name(s) for s in migration.statements()]
+            assert any(names)
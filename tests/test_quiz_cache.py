@@ -0,0 +1,97 @@
+from models import Question, Quiz
+from persistance.quiz_cache import InMemorySharedCache, QuizContentCache
+
+
+def make_quiz(quiz_id: str, answered: bool | None = None) -> Quiz:
+    question = Question(
+        id=1,
+        text="What is 1 + 1?",
+        options=["1", "2", "3", "4"],
+        correct_answer="2",
+        correct_answer_index=1,
+        answered_correct=answered,
+    )
+    return Quiz(id=quiz_id, prompt="Maths", questions=[question])
+
+
+def quiz_size(quiz: Quiz) -> int:
+    return len(quiz.model_dump_json())
+
+
+def test_least_recently_used_quiz_is_evicted():
+    cache = QuizContentCache(max_entries=2)
+    cache.put(make_quiz("a"))
+    cache.put(make_quiz("b"))
+    cache.get("a")
+    cache.put(make_quiz("c"))
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.evictions == 1
+
+
+def test_evicts_to_stay_within_max_bytes():
+    size = quiz_size(make_quiz("a"))
+    cache = QuizContentCache(max_bytes=2 * size)
+    for quiz_id in "abc":
+        cache.put(make_quiz(quiz_id))
+
+    assert len(cache) == 2
+    assert cache.size_bytes == 2 * size
+    assert cache.get("a") is None
+
+
+def test_quiz_larger_than_max_bytes_is_not_cached():
+    cache = QuizContentCache(max_bytes=quiz_size(make_quiz("a")) - 1)
+    cache.put(make_quiz("a"))
+
+    assert len(cache) == 0
+    assert cache.size_bytes == 0
+
+
+def test_replacing_a_quiz_does_not_count_its_size_twice():
+    cache = QuizContentCache()
+    cache.put(make_quiz("a"))
+    cache.put(make_quiz("a"))
+
+    assert len(cache) == 1
+    assert cache.size_bytes == quiz_size(make_quiz("a"))
+
+
+def test_answered_state_is_not_cached():
+    cache = QuizContentCache()
+    cache.put(make_quiz("a", answered=True))
+
+    assert cache.get("a").questions[0].answered_correct is None
+
+
+def test_hits_and_misses_are_counted():
+    cache = QuizContentCache()
+    cache.put(make_quiz("a"))
+    cache.get("a")
+    cache.get("b")
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.hit_ratio == 0.5
+
+
+def test_shared_cache_fills_the_local_cache():
+    shared = InMemorySharedCache()
+    QuizContentCache(shared=shared).put(make_quiz("a"))
+    cache = QuizContentCache(shared=shared)
+
+    assert cache.get("a") == make_quiz("a")
+    assert cache.get("a") is not None
+    assert (cache.shared_hits, cache.hits) == (1, 1)
+
+
+def test_invalidate_removes_the_quiz_everywhere():
+    shared = InMemorySharedCache()
+    cache = QuizContentCache(shared=shared)
+    cache.put(make_quiz("a"))
+    cache.invalidate("a")
+
+    assert cache.get("a") is None
+    assert shared.get("a") is None
+    assert cache.size_bytes == 0
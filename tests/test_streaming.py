@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+from quiz_builder import FakeLLMClient, QuizBuilder
+from quiz_builder.streaming import QuestionStreamParser
+
+
+def make_question(text: str, options: list[str], index: int = 0) -> dict:
+    return dict(
+        text=text, options=options, correct_answer=options[index], correct_answer_index=index
+    )
+
+
+def feed_in_chunks(content: str, size: int) -> list:
+    parser = QuestionStreamParser()
+    questions = []
+    for i in range(0, len(content), size):
+        questions += parser.feed(content[i : i + size])
+    return questions
+
+
+def test_questions_are_returned_whatever_the_chunk_boundaries():
+    quiz = dict(
+        prompt="capitals",
+        questions=[
+            make_question("Capital of France?", ["Paris", "Lyon", "Nice", "Lille"]),
+            make_question("Capital of Spain?", ["Vigo", "Madrid", "Cadiz", "Leon"], 1),
+        ],
+    )
+    content = json.dumps(quiz, indent=2)
+
+    for size in (1, 2, 3, 7, 16, len(content)):
+        questions = feed_in_chunks(content, size)
+        assert [q.text for q in questions] == ["Capital of France?", "Capital of Spain?"]
+        assert questions[1].correct_answer == "Madrid"
+
+
+def test_a_question_is_returned_as_soon_as_its_object_closes():
+    parser = QuestionStreamParser()
+    first = json.dumps(make_question("One?", ["a", "b", "c", "d"]))
+
+    assert parser.feed('{"prompt": "p", "questions": [' + first[:-1]) == []
+    assert [q.text for q in parser.feed(first[-1] + ", {")] == ["One?"]
+    assert not parser.done
+
+
+def test_braces_and_quotes_inside_strings_are_not_structure():
+    question = make_question(
+        'Which is a "dict" literal: {} or [] or \\"{\\"?',
+        ["{}", "[]", '"}"', "{{"],
+        2,
+    )
+    content = json.dumps(dict(prompt="p", questions=[question]))
+
+    questions = feed_in_chunks(content, 3)
+
+    assert len(questions) == 1
+    assert questions[0].text == question["text"]
+    assert questions[0].correct_answer == '"}"'
+
+
+def test_questions_after_the_list_closes_are_ignored():
+    parser = QuestionStreamParser()
+    parser.feed('{"questions": []}')
+
+    assert parser.done
+    assert parser.feed(json.dumps(make_question("Late?", ["a", "b", "c", "d"]))) == []
+
+
+def test_invalid_questions_are_counted_and_skipped():
+    valid = json.dumps(make_question("Valid?", ["a", "b", "c", "d"]))
+    content = '{"questions": [{"text": "No options"}, ' + valid + "]}"
+    parser = QuestionStreamParser()
+
+    questions = parser.feed(content)
+
+    assert [q.text for q in questions] == ["Valid?"]
+    assert parser.invalid == 1
+
+
+def test_stream_quiz_with_the_fake_client():
+    builder = QuizBuilder(FakeLLMClient(chunk_size=5))
+
+    async def collect():
+        return [q async for q in builder.stream_quiz("rivers", num_questions=4)]
+
+    questions = asyncio.run(collect())
+
+    assert [q.text for q in questions] == [f"Question {i} about rivers?" for i in range(1, 5)]
+    assert all(q.options[q.correct_answer_index] == q.correct_answer for q in questions)
@@ -0,0 +1,158 @@
+import json
+
+import pytest
+
+from models import Question
+from quiz_builder.validation import QuizOutputError, QuizValidator, loads_with_trailing_commas
+
+
+def question(**overrides) -> dict:
+    data = dict(
+        text="Largest planet?",
+        options=["Mars", "Jupiter", "Venus", "Earth"],
+        correct_answer="Jupiter",
+        correct_answer_index=1,
+    )
+    data.update(overrides)
+    return data
+
+
+def completion(*questions: dict) -> str:
+    return json.dumps(dict(prompt="planets", questions=list(questions)))
+
+
+def test_trailing_commas_are_removed():
+    data, removed = loads_with_trailing_commas('{"a": [1, 2,], "b": {"c": 3,},}')
+
+    assert data == {"a": [1, 2], "b": {"c": 3}}
+    assert removed == 3
+
+
+def test_commas_inside_strings_are_kept():
+    data, removed = loads_with_trailing_commas('{"a": "x,]", "b": [1,]}')
+
+    assert data == {"a": "x,]", "b": [1]}
+    assert removed == 1
+
+
+def test_other_invalid_json_is_an_error():
+    with pytest.raises(json.JSONDecodeError):
+        loads_with_trailing_commas('{"a": [1 2]}')
+
+
+def test_a_valid_completion_is_parsed_without_problems():
+    validator = QuizValidator()
+
+    questions = validator.parse(completion(question()))
+
+    assert questions == [Question(**question())]
+    assert validator.problems == {}
+
+
+def test_a_fenced_completion_with_surrounding_text_and_trailing_commas_is_repaired():
+    validator = QuizValidator()
+    content = "Here is your quiz:\n```json\n" + completion(question())[:-2] + "],}\n```\nEnjoy!"
+
+    questions = validator.parse(content)
+
+    assert [q.correct_answer for q in questions] == ["Jupiter"]
+    assert validator.problems == {
+        ("code_fence", "repaired"): 1,
+        ("trailing_comma", "repaired"): 1,
+    }
+
+
+def test_a_completion_with_no_json_is_an_error():
+    validator = QuizValidator()
+
+    with pytest.raises(QuizOutputError):
+        validator.parse("Sorry, I cannot help with that.")
+    assert validator.problems == {("invalid_json", "dropped"): 1}
+
+
+def test_the_answer_text_is_trusted_over_a_wrong_index():
+    validator = QuizValidator()
+
+    repaired = validator.question(question(correct_answer_index=3))
+
+    assert repaired.correct_answer_index == 1
+    assert validator.problems == {("index_mismatch", "repaired"): 1}
+
+
+def test_an_out_of_range_index_with_a_valid_answer_is_repaired():
+    validator = QuizValidator()
+
+    repaired = validator.question(question(correct_answer_index=9))
+
+    assert repaired.correct_answer == "Jupiter"
+    assert repaired.correct_answer_index == 1
+
+
+def test_the_index_is_used_when_the_answer_is_not_an_option():
+    validator = QuizValidator()
+
+    repaired = validator.question(question(correct_answer="Saturn", correct_answer_index=2))
+
+    assert repaired.correct_answer == "Venus"
+    assert validator.problems == {("answer_not_an_option", "repaired"): 1}
+
+
+def test_a_question_with_no_usable_answer_is_dropped():
+    validator = QuizValidator()
+
+    assert validator.question(question(correct_answer="Saturn", correct_answer_index=9)) is None
+    assert validator.problems == {("no_correct_answer", "dropped"): 1}
+
+
+def test_duplicate_options_are_removed_and_the_answer_kept():
+    validator = QuizValidator()
+    options = ["Mars", "Jupiter", "Mars ", "Venus", "Earth"]
+
+    repaired = validator.question(question(options=options, correct_answer_index=1))
+
+    assert repaired.options == ["Mars", "Jupiter", "Venus", "Earth"]
+    assert repaired.correct_answer_index == 1
+    assert validator.problems == {("invalid_options", "repaired"): 1}
+
+
+def test_a_question_left_with_too_few_options_counts_only_as_dropped():
+    validator = QuizValidator()
+
+    assert validator.question(question(options=["Mars", "Jupiter", "Mars", "Jupiter"])) is None
+    assert validator.problems == {("too_few_options", "dropped"): 1}
+
+
+def test_extra_options_are_trimmed_keeping_the_correct_answer():
+    validator = QuizValidator()
+    options = ["Mars", "Venus", "Earth", "Saturn", "Jupiter"]
+
+    repaired = validator.question(question(options=options, correct_answer_index=4))
+
+    assert len(repaired.options) == 4
+    assert repaired.correct_answer == "Jupiter"
+    assert repaired.options[repaired.correct_answer_index] == "Jupiter"
+
+
+def test_invalid_questions_are_dropped_and_the_rest_kept():
+    validator = QuizValidator()
+
+    questions = validator.parse(completion(question(), {"text": "No options"}))
+
+    assert len(questions) == 1
+    assert validator.problems == {("missing_options", "dropped"): 1}
+
+
+def test_validate_many_repairs_and_drops_quizzes():
+    validator = QuizValidator()
+    lines = [
+        completion(question()),
+        completion(question(correct_answer_index=0)),
+        "not json",
+        "",
+        completion({"text": "No options"}),
+    ]
+
+    quizzes = list(validator.validate_many(lines))
+
+    assert [quiz is not None for quiz in quizzes] == [True, True, False, False]
+    assert quizzes[1].questions[0].correct_answer_index == 1
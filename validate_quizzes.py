@@ -0,0 +1,51 @@
+"""Validates and repairs a file of quizzes, one JSON quiz per line, such as an export.
+
+python validate_quizzes.py quizzes.jsonl.gz --workers 4 --output valid.jsonl
+
+Files ending in .gz are read and written gzip compressed, as quiz_transfer.py exports them."""
+
+import argparse
+import gzip
+import os
+import sys
+
+from quiz_builder.validation import QuizValidator
+
+
+def open_text(path: str, mode: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", compresslevel=6)
+    return open(path, mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?", help="a file of JSON quizzes, one per line, or stdin")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--output", metavar="PATH", help="write the valid quizzes to the file")
+    args = parser.parse_args()
+
+    source = open_text(args.path, "r") if args.path else sys.stdin
+    output = open_text(args.output, "w") if args.output else None
+    validator = QuizValidator()
+    valid = invalid = 0
+    with source:
+        for quiz in validator.validate_many(source, args.workers):
+            if quiz is None:
+                invalid += 1
+                continue
+
+            valid += 1
+            if output is not None:
+                output.write(quiz.model_dump_json(exclude={"id"}) + "\n")
+
+    if output is not None:
+        output.close()
+
+    print(f"{valid} valid quizzes, {invalid} could not be repaired")
+    for (problem, action), count in sorted(validator.problems.items()):
+        print(f"{problem:24} {action:10} {count}")
+
+
+if __name__ == "__main__":
+    main()